@@ -0,0 +1,211 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from multiprocessing.managers import SyncManager
+from typing import Any, Callable, List, Optional
+
+from .config import EnvSettings, apply_settings, get_settings
+from .discovery import FolderJob, discover_jobs
+from .iterate_folders import plan_workers, run_job
+from .sherlock import FrameResult, iter_folder_results
+
+ENV = EnvSettings()
+
+
+def make_process_pool(workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Make a process pool whose workers use the current settings, for running folders from
+    asyncio code.
+
+    Args:
+        workers (Optional[int]): The number of worker processes (defaults to ENV.jobs)
+
+    Returns:
+        ProcessPoolExecutor: The process pool
+    """
+    return ProcessPoolExecutor(
+        max_workers=max(1, workers or ENV.jobs),
+        initializer=apply_settings,
+        initargs=(get_settings(),),
+    )
+
+
+def _process_folder_worker(folder_path: str, cancel_event: Any) -> List[FrameResult]:
+    """
+    Process a folder in a worker process, stopping after the current image once cancelled.
+    """
+    results = []
+    with closing(iter_folder_results(folder_path)) as folder_results:
+        for result in folder_results:
+            results.append(result)
+            if cancel_event.is_set():
+                print(f"Stopped processing {folder_path} as it was cancelled")
+                break
+    return results
+
+
+def _run_job_worker(job: FolderJob, cancel_event: Any):
+    """
+    Run a job in a worker process, stopping after the current image once cancelled.
+    """
+    run_job(job, cancelled=cancel_event.is_set)
+
+
+async def start_manager() -> SyncManager:
+    """
+    Start a manager process, which holds the cancellation events shared with workers.
+
+    Returns:
+        SyncManager: The started manager
+    """
+    return await asyncio.to_thread(multiprocessing.Manager)
+
+
+async def run_cancellable(
+    executor: ProcessPoolExecutor,
+    manager: SyncManager,
+    function: Callable[..., Any],
+    *args: Any,
+) -> Any:
+    """
+    Run a task in a process pool, telling it to stop if the awaiting task is cancelled.
+
+    The task is given a cancellation event as its last argument. Once cancelled, this waits
+    for the task to stop (at the end of its current image) before raising, so that no results
+    are written for the folder after it has returned.
+
+    Args:
+        executor (ProcessPoolExecutor): The process pool
+        manager (SyncManager): The manager to make the cancellation event with
+        function (Callable[...,Any]): The task
+        *args (Any): Arguments for the task
+
+    Returns:
+        Any: The result of the task
+    """
+    cancel_event = manager.Event()
+    future = executor.submit(function, *args, cancel_event)
+    wrapped = asyncio.wrap_future(future)
+    try:
+        return await asyncio.shield(wrapped)
+    except asyncio.CancelledError:
+        cancel_event.set()
+        # Tasks that have not started yet are dropped
+        future.cancel()
+        await asyncio.wait([wrapped])
+        if not wrapped.cancelled():
+            # The task's own error (if any) is superseded by the cancellation
+            wrapped.exception()
+        raise
+
+
+async def process_folder_async(
+    folder_path: str, executor: Optional[ProcessPoolExecutor] = None
+) -> List[FrameResult]:
+    """
+    Process the images in a folder without blocking the event loop.
+
+    The folder is processed (reading, decoding and searching its images) in a worker
+    process, and writes the same outputs as process_folder. Cancelling the awaiting task
+    stops the worker after its current image; the results so far are kept, and the folder
+    resumes from its first unfinished background window when it is next processed.
+
+    Args:
+        folder_path (str): The path to the folder
+        executor (Optional[ProcessPoolExecutor]): The process pool to use, e.g. from
+            make_process_pool, so that several folders share its workers. If not given, a
+            pool is made for this folder alone.
+
+    Returns:
+        List[FrameResult]: The result for each image, as yielded by iter_folder_results
+    """
+    if executor is not None:
+        manager = await start_manager()
+        try:
+            return await run_cancellable(
+                executor, manager, _process_folder_worker, folder_path
+            )
+        finally:
+            await asyncio.to_thread(manager.shutdown)
+
+    executor = make_process_pool(1)
+    try:
+        return await process_folder_async(folder_path, executor)
+    finally:
+        # Joining the worker blocks, so is done in a thread
+        await asyncio.to_thread(executor.shutdown)
+
+
+async def run_sherlock_async(
+    root_path: Optional[str] = None,
+    jobs: Optional[int] = None,
+    executor: Optional[ProcessPoolExecutor] = None,
+):
+    """
+    Run Sherlock on a range of folders without blocking the event loop.
+
+    Folders are discovered in a thread, and processed in worker processes, at most jobs at a
+    time. Cancelling the awaiting task stops every running folder after its current image
+    and skips the folders not yet started.
+
+    Args:
+        root_path (Optional[str]): The root path (defaults to ENV.root_directory)
+        jobs (Optional[int]): The number of folders to process at the same time (defaults to
+            ENV.jobs)
+        executor (Optional[ProcessPoolExecutor]): The process pool to use. If not given, a
+            pool is made with workers sharing the memory budget, as by run_sherlock.
+    """
+    if root_path is None:
+        root_path = ENV.root_directory
+    if jobs is None:
+        jobs = ENV.jobs
+
+    folder_jobs = await asyncio.to_thread(discover_jobs, root_path)
+    pending_jobs = []
+    for job in folder_jobs:
+        if job.completed:
+            print(f"Skipping folder {job.path} as it has been previously completed")
+        else:
+            pending_jobs.append(job)
+    if not pending_jobs:
+        return
+
+    if executor is None:
+        settings, jobs = await asyncio.to_thread(plan_workers, pending_jobs, jobs)
+        executor = ProcessPoolExecutor(
+            max_workers=max(1, jobs), initializer=apply_settings, initargs=(settings,)
+        )
+        try:
+            await _run_jobs(pending_jobs, jobs, executor)
+        finally:
+            # Joining the workers blocks, so is done in a thread
+            await asyncio.to_thread(executor.shutdown)
+    else:
+        await _run_jobs(pending_jobs, jobs, executor)
+
+
+async def _run_jobs(
+    pending_jobs: List[FolderJob], jobs: int, executor: ProcessPoolExecutor
+):
+    """
+    Run jobs in a process pool, at most jobs at a time.
+    """
+    limit = asyncio.Semaphore(max(1, jobs))
+
+    async def run_limited(job: FolderJob):
+        async with limit:
+            await run_cancellable(executor, manager, _run_job_worker, job)
+
+    manager = await start_manager()
+    try:
+        results = await asyncio.gather(
+            *(run_limited(job) for job in pending_jobs), return_exceptions=True
+        )
+    finally:
+        await asyncio.to_thread(manager.shutdown)
+    for job, result in zip(pending_jobs, results):
+        if isinstance(result, asyncio.CancelledError):
+            raise result
+        if isinstance(result, Exception):
+            print(f"Warning: Processing {job.path} failed ({result!r})")
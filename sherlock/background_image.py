@@ -1,4 +1,4 @@
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, Optional, Tuple
 
 import cv2
 import numpy as np
@@ -6,6 +6,9 @@ from PIL import Image
 from PIL.ExifTags import TAGS
 
 from .config import EnvSettings
+from .roi import RegionOfInterest
+from .storage import get_storage
+from .utils import load_image
 
 ENV = EnvSettings()
 
@@ -25,35 +28,161 @@ def make_background_image(
         int: The maximum index used in the background image
         bool: Whether the background image was day or night
     """
-    images: List[np.ndarray] = []
+    background_image, image_index, day_night_background, _, _ = make_background_window(
+        folder_path, current_image_index
+    )
+    return background_image, image_index, day_night_background
 
-    for image_index in range(
-        current_image_index, current_image_index + ENV.background_max_images
-    ):
+
+def make_background_window(
+    folder_path: str,
+    current_image_index: int,
+    max_images: Optional[int] = None,
+    roi: Optional[RegionOfInterest] = None,
+) -> Tuple[np.ndarray | None, int, bool, np.ndarray | None, np.ndarray | None]:
+    """
+    Make the background image from a set of images, keeping the decoded images.
+
+    The images are decoded straight into one (N,H,W,3) stack, so that they can be processed
+    together without being read again. If ENV.night_single_channel is set, night windows are
+    decoded into a single channel (N,H,W) stack, giving a single channel background.
+
+    If ENV.volatility_weight is set, the volatility of each pixel over the window is found in
+    the same pass as the background (see background_statistics).
+
+    Args:
+        folder_path (str): The path to the image folder
+        current_image_index (int): The current image index
+        max_images (Optional[int]): The maximum number of images in the window (defaults to
+            ENV.background_max_images)
+        roi (Optional[RegionOfInterest]): The region to search, if not the whole image. The
+            background is only found for tiles containing part of the region, and is zero
+            elsewhere.
+
+    Returns:
+        np.ndarray: The background image
+        int: The maximum index used in the background image
+        bool: Whether the background image was day or night
+        np.ndarray: The stack of decoded images, starting with the current image
+        np.ndarray: The (H,W) volatility of each pixel, or None if it is not used
+    """
+    if max_images is None:
+        max_images = ENV.background_max_images
+    frame_stack = None
+    frame_count = 0
+
+    for image_index in range(current_image_index, current_image_index + max_images):
         image_path = f"{folder_path}/{ENV.image_prefix}_{str(image_index).zfill(4)}.{ENV.image_suffix}"
-        image = cv2.imread(image_path)
+        image, day_night_image = load_window_image(image_path)
         if isinstance(image, np.ndarray):
 
             if image_index == current_image_index:
-                day_night_background = daytime_test(image, image_path)
+                day_night_background = day_night_image
+                frame_stack = np.empty((max_images,) + image.shape, dtype=image.dtype)
             else:
-                day_night_image = daytime_test(image, image_path)
-
-                if day_night_image == day_night_background:
-                    images.append(image)
-
-                else:
-                    # New day/night period
+                if (
+                    day_night_image != day_night_background
+                    or image.shape != frame_stack.shape[1:]
+                ):
+                    # New day/night period (or camera setting)
                     break
+
+            frame_stack[frame_count] = image
+            frame_count += 1
         else:
             day_night_background = False
             break
-    if len(images) > 0:
-        background_image = np.median(images, axis=0)
+
+    # The current image itself is not used in its background
+    volatility = None
+    if frame_count > 1 and (roi is None or roi.mask.shape != frame_stack.shape[1:3]):
+        background_image, volatility = background_statistics(frame_stack[1:frame_count])
+    elif frame_count > 1:
+        background_image = np.zeros(frame_stack.shape[1:])
+        if ENV.volatility_weight > 0:
+            volatility = np.zeros(frame_stack.shape[1:3], dtype=np.float32)
+        for rows, columns in roi.tiles:
+            background_image[rows, columns], tile_volatility = background_statistics(
+                frame_stack[1:frame_count, rows, columns]
+            )
+            if volatility is not None:
+                volatility[rows, columns] = tile_volatility
     else:
         background_image = None
 
-    return background_image, image_index, day_night_background
+    if frame_stack is not None:
+        frame_stack = frame_stack[:frame_count]
+
+    return background_image, image_index, day_night_background, frame_stack, volatility
+
+
+def background_statistics(
+    frames: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray | None]:
+    """
+    Find the background of a stack of images and, if ENV.volatility_weight is set, the
+    volatility of each pixel.
+
+    The volatility is the interquartile range of each pixel over the stack (the largest over
+    its channels). Pixels that keep changing without an animal (e.g. moving vegetation,
+    water or flickering shadows) have a large range, whereas the range of a pixel that only
+    changes when an animal passes stays small. The quartiles are found in the same partition
+    as the median, so this costs little more than the median alone.
+
+    Args:
+        frames (np.ndarray): The (N,H,W,3) (or (N,H,W)) stack of images
+
+    Returns:
+        np.ndarray: The background image (the median of the stack)
+        np.ndarray: The (H,W) volatility of each pixel, or None if it is not used
+    """
+    if ENV.volatility_weight <= 0:
+        return np.median(frames, axis=0), None
+    lower_quartile, median, upper_quartile = np.percentile(frames, [25, 50, 75], axis=0)
+    volatility = upper_quartile - lower_quartile
+    if volatility.ndim == 3:
+        volatility = np.max(volatility, axis=2)
+    return median, volatility.astype(np.float32)
+
+
+def load_window_image(image_path: str) -> Tuple[np.ndarray | None, bool]:
+    """
+    Decode an image for a background window and test whether it is a daytime image.
+
+    If ENV.night_single_channel is set, night images are decoded as a single (grey) channel.
+    This is done directly when the metadata shows the image is a night image, and otherwise by
+    collapsing the colour image once it has been tested.
+
+    Args:
+        image_path (str): The image path
+
+    Returns:
+        np.ndarray: The image, or None if it could not be read
+        bool: True if it is a daytime image
+    """
+    if not ENV.night_single_channel:
+        image = load_image(image_path)
+        if image is None:
+            return None, False
+        return image, daytime_test(image, image_path)
+
+    if not get_storage(image_path).is_file(image_path):
+        return None, False
+    try:
+        is_daytime = daytime_from_metadata(image_path)
+    except OSError:
+        return None, False
+    if is_daytime is False:
+        return load_image(image_path, single_channel=True), False
+
+    image = load_image(image_path)
+    if image is None:
+        return None, False
+    if is_daytime is None:
+        is_daytime = daytime_test_sample(image)
+    if not is_daytime:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image, is_daytime
 
 
 def daytime_test(image: np.ndarray, image_path: str) -> bool:
@@ -67,17 +196,33 @@ def daytime_test(image: np.ndarray, image_path: str) -> bool:
     Returns:
         bool: True if it is a daytime image
     """
+    is_daytime = daytime_from_metadata(image_path)
+    if is_daytime is None:
+        return daytime_test_sample(image)
+    return is_daytime
+
+
+def daytime_from_metadata(image_path: str) -> Optional[bool]:
+    """
+    Test whether or not an image is a daytime image from its metadata, without decoding it.
+
+    Args:
+        image_path (str): The image path
+
+    Returns:
+        Optional[bool]: True if it is a daytime image, or None if the metadata has no "Flash"
+            field
+    """
     image_metadata = get_image_metadata(image_path)
     if "Flash" in image_metadata:
         return image_metadata["Flash"] == 24
 
-    else:
-        if not ENV.image_metadata_warning_shown:
+    if not ENV.image_metadata_warning_shown:
 
-            print('Warning: No field "Flash" found in image metadata')
-            ENV.image_metadata_warning_shown = True
+        print('Warning: No field "Flash" found in image metadata')
+        ENV.image_metadata_warning_shown = True
 
-        return daytime_test_sample(image)
+    return None
 
 
 def daytime_test_sample(
@@ -131,8 +276,11 @@ def get_image_metadata(image_path: str) -> Dict[str, Any]:
     Returns:
         Dict[str,Any]: The metadata
     """
-    image = Image.open(image_path)
-    exif_data = image._getexif()
+    with (
+        get_storage(image_path).read_header(image_path) as header,
+        Image.open(header) as image,
+    ):
+        exif_data = image._getexif()
 
     if exif_data is None:
         if not ENV.image_metadata_warning_shown:
@@ -0,0 +1,269 @@
+import io
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .config import EnvSettings
+from .discovery import discover_jobs, is_video_file, video_output_paths
+from .process_images import CANDIDATE_DTYPE, score_contours
+from .storage import get_storage
+from .utils import (
+    cached_datetime,
+    create_summary_csv,
+    find_max_image_path,
+    mark_adjacent_frames,
+    mark_adjacent_images,
+)
+
+ENV = EnvSettings()
+
+
+def candidates_path(folder_path: str, run_code: Optional[Any] = None) -> str:
+    """
+    Get the path of the candidates file for a folder, or for a video clip.
+
+    Args:
+        folder_path (str): The folder path, or the path to the video
+        run_code (Optional[Any]): The run code (defaults to ENV.run_code)
+
+    Returns:
+        str: The path of the candidates file
+    """
+    if run_code is None:
+        run_code = ENV.run_code
+    if is_video_file(os.path.basename(folder_path)):
+        return f"{os.path.splitext(folder_path)[0]}_candidates_{run_code}.npy"
+    return f"{folder_path}/candidates_{run_code}.npy"
+
+
+def load_candidates(
+    folder_path: str, run_code: Optional[Any] = None
+) -> Dict[int, np.ndarray]:
+    """
+    Load the measured candidate rectangles of a folder (or video clip).
+
+    Args:
+        folder_path (str): The folder path, or the path to the video
+        run_code (Optional[Any]): The run code (defaults to ENV.run_code)
+
+    Returns:
+        Dict[int,np.ndarray]: The candidates of each image with any, by image index (or
+            frame number)
+    """
+    path = candidates_path(folder_path, run_code)
+    storage = get_storage(path)
+    if not storage.is_file(path):
+        return {}
+    candidates = np.load(io.BytesIO(storage.read_bytes(path)))
+    if candidates.dtype != CANDIDATE_DTYPE:
+        print(f"Warning: Ignoring {path} as it was written by a different version")
+        return {}
+    image_indices, starts = np.unique(candidates["image_index"], return_index=True)
+    return {
+        int(image_index): rows
+        for image_index, rows in zip(image_indices, np.split(candidates, starts[1:]))
+    }
+
+
+def save_candidates(folder_path: str, candidates: Dict[int, np.ndarray]):
+    """
+    Save the measured candidate rectangles of a folder (or video clip) as a single
+    structured array.
+
+    Args:
+        folder_path (str): The folder path, or the path to the video
+        candidates (Dict[int,np.ndarray]): The candidates of each image, by image index (or
+            frame number)
+    """
+    rows = [candidates[image_index] for image_index in sorted(candidates)]
+    path = candidates_path(folder_path)
+    buffer = io.BytesIO()
+    np.save(
+        buffer, np.concatenate(rows) if rows else np.zeros(0, dtype=CANDIDATE_DTYPE)
+    )
+    get_storage(path).write_bytes(path, buffer.getvalue())
+
+
+def rescore_entry(
+    image_datum: Dict[str, Any], image_candidates: Optional[np.ndarray]
+) -> Dict[str, Any]:
+    """
+    Apply the current thresholds to the candidates of an image (or video frame).
+
+    Args:
+        image_datum (Dict[str,Any]): The result of the image in the previous run
+        image_candidates (Optional[np.ndarray]): The candidates of the image, if any
+
+    Returns:
+        Dict[str,Any]: The new result of the image, before adjacency is applied. Errors
+            are kept as they were.
+    """
+    global_change = image_datum.get("reason") == "global change"
+    if "error" in image_datum and not global_change:
+        if "reason" in image_datum:
+            return {
+                "status": "animal",
+                "reason": image_datum["reason"],
+                "contours": 0,
+                "error": True,
+            }
+        return {"status": "error", "error": True, "contours": 0}
+
+    contours_found = 0
+    if image_candidates is not None:
+        contours_found = int(np.sum(score_contours(image_candidates)))
+    if global_change:
+        # Still counted as true, as the search was cut short
+        return {
+            "status": "animal",
+            "reason": "global change",
+            "contours": contours_found,
+            "error": True,
+        }
+    if contours_found > 0:
+        return {
+            "status": "animal",
+            "reason": "contour found",
+            "contours": contours_found,
+        }
+    return {"status": "no animal", "reason": "no contour found", "contours": 0}
+
+
+def rescore_folder(folder_path: str, source_run_code: Optional[Any] = None) -> bool:
+    """
+    Apply the current size, disturbance and secondary colour thresholds to the candidates
+    measured by a previous run, without detecting them again.
+
+    The results and summary are written under ENV.run_code, so they replace those of the
+    previous run unless the run code has been changed.
+
+    Args:
+        folder_path (str): The folder path
+        source_run_code (Optional[Any]): The run code of the previous run (defaults to
+            ENV.run_code)
+
+    Returns:
+        bool: Whether the folder could be rescored
+    """
+    if source_run_code is None:
+        source_run_code = ENV.run_code
+    storage = get_storage(folder_path)
+    json_path = f"{folder_path}/processed_data_{source_run_code}.json"
+    if not storage.is_file(json_path) or not storage.is_file(
+        candidates_path(folder_path, source_run_code)
+    ):
+        print(f"Skipping folder {folder_path} as it has no candidates to rescore")
+        return False
+    previous_data: Dict[str, Any] = storage.read_json(json_path)
+    if not previous_data["completed"]:
+        print(f"Skipping folder {folder_path} as it has not been completed")
+        return False
+    candidates = load_candidates(folder_path, source_run_code)
+    max_image = find_max_image_path(folder_path)
+    date_times: Dict[str, str] = {}
+
+    # Replay the images in order, as process_folder does, so adjacency is applied the same way
+    processed_data: Dict[str, Any] = {
+        "completed": True,
+        "images": {},
+        "windows": previous_data.get("windows", []),
+    }
+    for image_index in sorted(int(key) for key in previous_data["images"]):
+        image_datum = previous_data["images"][str(image_index)]
+        image_path = f"{folder_path}/{ENV.image_prefix}_{str(image_index).zfill(4)}.{ENV.image_suffix}"
+        image_entry = rescore_entry(image_datum, candidates.get(image_index))
+        if image_entry.get("error") and image_entry["reason"] != "global change":
+            processed_data["images"][str(image_index)] = image_entry
+            continue
+        if not storage.is_file(image_path):
+            # Only marked by adjacency, which is applied again below
+            continue
+
+        processed_data["images"][str(image_index)] = image_entry
+        if image_entry["contours"] > 0:
+            mark_adjacent_images(
+                processed_data,
+                folder_path,
+                image_index,
+                cached_datetime(image_path, date_times),
+                max_image,
+                date_times,
+            )
+
+    storage.write_json(
+        f"{folder_path}/processed_data_{ENV.run_code}.json", processed_data
+    )
+    if str(source_run_code) != str(ENV.run_code):
+        save_candidates(folder_path, candidates)
+    create_summary_csv(processed_data, folder_path)
+    return True
+
+
+def rescore_video(video_path: str, source_run_code: Optional[Any] = None) -> bool:
+    """
+    Apply the current thresholds to the candidates measured in a video clip by a previous
+    run, as rescore_folder does for a folder.
+
+    Args:
+        video_path (str): The path to the video
+        source_run_code (Optional[Any]): The run code of the previous run (defaults to
+            ENV.run_code)
+
+    Returns:
+        bool: Whether the clip could be rescored
+    """
+    if source_run_code is None:
+        source_run_code = ENV.run_code
+    source_json_path, _ = video_output_paths(video_path, source_run_code)
+    storage = get_storage(source_json_path)
+    if not storage.is_file(source_json_path) or not storage.is_file(
+        candidates_path(video_path, source_run_code)
+    ):
+        print(f"Skipping video {video_path} as it has no candidates to rescore")
+        return False
+    previous_data: Dict[str, Any] = storage.read_json(source_json_path)
+    if not previous_data["completed"]:
+        print(f"Skipping video {video_path} as it has not been completed")
+        return False
+    candidates = load_candidates(video_path, source_run_code)
+
+    processed_data: Dict[str, Any] = {
+        "completed": True,
+        "images": {
+            frame_number: rescore_entry(frame_datum, candidates.get(int(frame_number)))
+            for frame_number, frame_datum in previous_data["images"].items()
+        },
+    }
+    mark_adjacent_frames(processed_data)
+
+    json_path, csv_path = video_output_paths(video_path)
+    storage.write_json(json_path, processed_data)
+    if str(source_run_code) != str(ENV.run_code):
+        save_candidates(video_path, candidates)
+    create_summary_csv(processed_data, os.path.dirname(video_path), csv_path)
+    return True
+
+
+def rescore_sherlock(
+    root_path: Optional[str] = None, source_run_code: Optional[Any] = None
+):
+    """
+    Rescore every folder under the root directory with the current thresholds.
+
+    Args:
+        root_path (Optional[str]): The root directory (defaults to ENV.root_directory)
+        source_run_code (Optional[Any]): The run code of the previous run (defaults to
+            ENV.run_code)
+    """
+    if root_path is None:
+        root_path = ENV.root_directory
+    rescored = 0
+    rescored_videos = 0
+    for job in discover_jobs(root_path, include_completed_videos=True):
+        if job.frame_count and rescore_folder(job.path, source_run_code):
+            rescored += 1
+        for video_path in job.videos:
+            if rescore_video(video_path, source_run_code):
+                rescored_videos += 1
+    print(f"Rescored {rescored} folder(s) and {rescored_videos} video(s)")
@@ -0,0 +1,215 @@
+import argparse
+import cProfile
+import json
+import pstats
+import sys
+from typing import Callable, Dict, List, Optional
+
+from .config import EnvSettings, load_config_file
+
+ENV = EnvSettings()
+
+
+def add_common_arguments(parser: argparse.ArgumentParser):
+    """
+    Add the arguments shared by every command.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser for the command
+    """
+    parser.add_argument(
+        "root",
+        nargs="?",
+        default=None,
+        help="the root directory of the images (default: root_directory in the config)",
+    )
+    parser.add_argument(
+        "-c", "--config", help='a JSON file of settings, e.g. {"image_suffix": "jpg"}'
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="number of folders to process at the same time"
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="sherlock.prof",
+        metavar="PATH",
+        help="profile the run, saving the statistics to PATH (default: sherlock.prof)",
+    )
+
+
+def run_command(arguments: argparse.Namespace):
+    """
+    Process every folder under the root directory.
+
+    Args:
+        arguments (argparse.Namespace): The parsed arguments
+    """
+    from .iterate_folders import run_sherlock
+
+    run_sherlock(arguments.root, dry_run=arguments.dry_run)
+
+
+def watch_command(arguments: argparse.Namespace):
+    """
+    Watch the root directory, processing new images as they arrive.
+
+    Args:
+        arguments (argparse.Namespace): The parsed arguments
+    """
+    from .watch import watch_sherlock
+
+    watch_sherlock(
+        arguments.root, poll_interval=arguments.interval, max_polls=arguments.polls
+    )
+
+
+def evaluate_command(arguments: argparse.Namespace):
+    """
+    Compare the accuracy and cost of several configurations on labelled folders.
+
+    Args:
+        arguments (argparse.Namespace): The parsed arguments
+    """
+    from .evaluate import evaluate_configurations, write_report
+
+    with open(arguments.configurations, "r") as configurations_file:
+        configurations = json.load(configurations_file)
+    report = evaluate_configurations(
+        arguments.root or ENV.root_directory,
+        configurations,
+        labels_name=arguments.labels,
+        keep_outputs=arguments.keep_outputs,
+    )
+    if arguments.output is not None:
+        write_report(report, arguments.output)
+
+
+def rescore_command(arguments: argparse.Namespace):
+    """
+    Apply new thresholds to the candidates found by a previous run.
+
+    Args:
+        arguments (argparse.Namespace): The parsed arguments
+    """
+    from .candidates import rescore_sherlock
+
+    rescore_sherlock(arguments.root, source_run_code=arguments.source_run_code)
+
+
+def build_parsers() -> Dict[str, argparse.ArgumentParser]:
+    """
+    Build the argument parser for each command.
+
+    Returns:
+        Dict[str,argparse.ArgumentParser]: The parsers, by command name
+    """
+    run_parser = argparse.ArgumentParser(
+        prog="sherlock [run]",
+        description="Remove false positive camera trap images.",
+        epilog="Other commands: sherlock watch --help, sherlock evaluate --help,"
+        " sherlock rescore --help",
+    )
+    add_common_arguments(run_parser)
+    run_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="print the folders that would be processed and the estimated cost",
+    )
+    run_parser.set_defaults(handler=run_command)
+
+    watch_parser = argparse.ArgumentParser(
+        prog="sherlock watch",
+        description="Keep processing new or changed images as they arrive.",
+    )
+    add_common_arguments(watch_parser)
+    watch_parser.add_argument(
+        "--interval", type=float, help="seconds between checks for new images"
+    )
+    watch_parser.add_argument(
+        "--polls", type=int, help="stop after this many checks (e.g. 1 for cron jobs)"
+    )
+    watch_parser.set_defaults(handler=watch_command)
+
+    evaluate_parser = argparse.ArgumentParser(
+        prog="sherlock evaluate",
+        description="Compare the precision, recall, speed and memory use of several"
+        " configurations on folders with a labels file.",
+    )
+    add_common_arguments(evaluate_parser)
+    evaluate_parser.add_argument(
+        "configurations",
+        help='a JSON file of settings for each configuration, e.g. {"fast":'
+        ' {"sample_size": 1000}, "default": {}}',
+    )
+    evaluate_parser.add_argument(
+        "--labels",
+        default="labels.csv",
+        help="the name of the labels CSV in each folder (columns image_index, animal)",
+    )
+    evaluate_parser.add_argument("--output", help="save the comparison to this CSV")
+    evaluate_parser.add_argument(
+        "--keep-outputs",
+        action="store_true",
+        help="keep the results written by each configuration",
+    )
+    evaluate_parser.set_defaults(handler=evaluate_command)
+
+    rescore_parser = argparse.ArgumentParser(
+        prog="sherlock rescore",
+        description="Apply new size, disturbance and secondary colour thresholds to the"
+        " candidates found by a previous run, without detecting them again.",
+    )
+    add_common_arguments(rescore_parser)
+    rescore_parser.add_argument(
+        "--from",
+        dest="source_run_code",
+        metavar="RUN_CODE",
+        help="the run code of the previous run (default: run_code in the config, whose"
+        " results are then replaced)",
+    )
+    rescore_parser.set_defaults(handler=rescore_command)
+
+    return {
+        "run": run_parser,
+        "watch": watch_parser,
+        "evaluate": evaluate_parser,
+        "rescore": rescore_parser,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Run the sherlock command line interface.
+
+    Args:
+        argv (Optional[List[str]]): The arguments (defaults to sys.argv[1:])
+
+    Returns:
+        int: The exit code
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+
+    parsers = build_parsers()
+    command = "run"
+    if argv and argv[0] in parsers:
+        command, argv = argv[0], argv[1:]
+    arguments = parsers[command].parse_args(argv)
+
+    if arguments.config is not None:
+        load_config_file(arguments.config)
+    if arguments.jobs is not None:
+        ENV.jobs = arguments.jobs
+
+    handler: Callable[[argparse.Namespace], None] = arguments.handler
+    if arguments.profile is None:
+        handler(arguments)
+        return 0
+
+    profiler = cProfile.Profile()
+    profiler.runcall(handler, arguments)
+    profiler.dump_stats(arguments.profile)
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(20)
+    print(f"Profile saved to {arguments.profile}")
+    return 0
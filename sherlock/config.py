@@ -1,3 +1,6 @@
+import json
+from typing import Any, Dict, List, Optional
+
 import numpy as np
 
 
@@ -100,3 +103,201 @@ class EnvSettings:
 
             # Time tolerance for datetime adjacency
             self.datetime_adjacency_tolerance: int = 20
+
+            # Folder name/relative path patterns to process (fnmatch syntax)
+            self.include_patterns: List[str] = ["*"]
+
+            # Folder name/relative path patterns to skip, along with their subfolders
+            self.exclude_patterns: List[str] = ["positive_images", ".*"]
+
+            # Number of threads used to walk the folder tree
+            self.discovery_threads: int = 8
+
+            # Estimated processing time per frame, used for job planning
+            self.estimated_seconds_per_frame: float = 0.1
+
+            # Estimated processing time per megabyte of images, used for job planning
+            self.estimated_seconds_per_megabyte: float = 0.2
+
+            # Whether to claim folders with lease files, so that several processes (on any
+            # number of machines sharing the images) can work through the same root directory
+            self.coordinate: bool = False
+
+            # Seconds without a heartbeat after which another process may take over a lease
+            self.lease_ttl: float = 300
+
+            # Seconds between lease heartbeats
+            self.lease_heartbeat: float = 30
+
+            # Seconds between checks for new images when watching a folder tree
+            self.watch_poll_interval: float = 600
+
+            # How to save positive images: "annotated" (full size, with contours marked on),
+            # "preview" (reduced size, with contours marked on), "link" (a link to the
+            # original image plus a JSON file of contours) or "original" (an unmarked copy)
+            self.export_mode: str = "annotated"
+
+            # Number of threads used to save positive images
+            self.export_workers: int = 2
+
+            # Scale of the saved images in "preview" mode
+            self.export_preview_scale: float = 0.25
+
+            # JPEG quality (0-100) of the saved images in "preview" mode
+            self.export_jpeg_quality: int = 80
+
+            # The suffixes of video clips to process
+            self.video_suffixes: List[str] = ["mp4", "avi", "mov"]
+
+            # Process every n-th frame of video clips
+            self.video_frame_stride: int = 1
+
+            # Number of decoded video frames to buffer ahead of processing
+            self.video_buffer_size: int = 16
+
+            # Number of folders to process at the same time (each in its own process)
+            self.jobs: int = 1
+
+            # Memory budget in MB for the whole run (by default, half of the physical memory).
+            # Window lengths, images queued for export and jobs are reduced to fit it
+            self.memory_budget_mb: Optional[float] = None
+
+            # Whether to process night images with a single (grey) channel. Infrared night
+            # images are grey, so this gives the same results with a third of the work
+            self.night_single_channel: bool = False
+
+            # Whether to track boxes through bursts of images. The first image of a burst
+            # is searched in full, and later images only near the previous image's boxes,
+            # unless there are changes elsewhere or the boxes are lost
+            self.burst_tracking: bool = False
+
+            # Maximum seconds between images in the same burst
+            self.burst_interval: float = 2
+
+            # Pixels around the previous image's boxes to search when tracking
+            self.tracking_margin: int = 50
+
+            # Number of changed pixel samples away from the tracked boxes above which the
+            # whole image is searched again (0 to search again on any change)
+            self.tracking_new_seeds: int = 5
+
+            # Endpoint of the S3-compatible object store used for "s3://bucket/..." paths (e.g.
+            # a MinIO server). If None, the AWS endpoint from the boto3 configuration is used
+            self.s3_endpoint_url: Optional[str] = None
+
+            # Maximum number of pooled connections to the object store
+            self.storage_connections: int = 16
+
+            # Bytes read from the start of each image to get its metadata from the object store
+            self.header_read_bytes: int = 131072
+
+            # The name of the mask image in a folder marking the region to search (white) and
+            # the region to ignore (black), e.g. a timestamp banner, sky or a moving bush
+            self.roi_mask_name: str = "roi_mask.png"
+
+            # Regions to ignore, by folder: folder name/path patterns (fnmatch syntax) mapped
+            # to lists of polygons, each a list of [x, y] pixel corners
+            self.roi_polygons: Dict[str, List[List[List[int]]]] = {}
+
+            # Size in pixels of the tiles skipped when building backgrounds, if they are
+            # entirely outside the region to search
+            self.roi_tile_size: int = 64
+
+            # Multiple of each pixel's interquartile range over its background window added to
+            # its background tolerance, so that pixels which change all the time (e.g. moving
+            # vegetation, water or shadows) need a larger change to count. 0 turns this off
+            self.volatility_weight: float = 0
+
+            # Directory of a persistent cache of decoded images, so that folders processed
+            # again (e.g. while tuning settings) are not decoded again. None turns this off
+            self.frame_cache_directory: Optional[str] = None
+
+            # Size in bytes at which the least recently used images are evicted from the cache
+            self.frame_cache_max_bytes: int = 20 * 1024**3
+
+            # Scale at which images are cached and processed, relative to full resolution, if
+            # frame_cache_directory is set. Sizes such as size_tol_day are then in scaled pixels
+            self.frame_cache_scale: float = 1.0
+
+            # The library used to decode images: "opencv", "pil", "turbojpeg" (if PyTurboJPEG
+            # is installed) or "auto" to use whichever is fastest for the images. "auto" is
+            # benchmarked in each process, so parallel workers may pick different decoders.
+            self.image_decoder: str = "opencv"
+
+            # Fraction of samples that must differ from the background for an image to count
+            # as a global change (e.g. a lighting change or the camera being bumped). These
+            # images are normalised to the background and, if still changed, searched with a
+            # limited budget and recorded as "global change". 1 turns this off
+            self.global_change_fraction: float = 0.3
+
+            # Maximum number of candidate positions searched in a global change image
+            self.global_change_max_seeds: int = 100
+
+            # Maximum total number of pixels walked when searching a global change image
+            self.global_change_max_walk: int = 2000
+
+            # Folder (local or s3://) of a run-wide index of background windows already
+            # processed, by the contents of their images and the settings. Windows seen before
+            # (e.g. in copied folders) reuse their results rather than being processed again.
+            # None turns this off
+            self.dedup_directory: Optional[str] = None
+
+            # Number of bytes at the start of each image (with its size) hashed to identify it,
+            # which covers its metadata. 0 hashes the whole image, which reads it twice
+            self.dedup_hash_bytes: int = 65536
+
+            # Height and width in pixels of the crops of accepted boxes written to each
+            # folder's crop store (crops_{run_code}.raw, with crop_index_{run_code}.json), for
+            # classifying positive images without decoding them again. None turns this off
+            self.crop_size: Optional[int] = None
+
+            # Number of crops the crop store grows by at a time
+            self.crop_chunk_size: int = 256
+
+
+def load_config_file(config_path: str):
+    """
+    Override settings from a JSON file mapping setting names to values.
+
+    Lists are converted to NumPy arrays (or tuples) where the default setting is one.
+
+    Args:
+        config_path (str): The path to the JSON file
+    """
+    env = EnvSettings()
+    with open(config_path, "r") as config_file:
+        overrides: Dict[str, Any] = json.load(config_file)
+
+    for name, value in overrides.items():
+        if name.startswith("_") or not hasattr(env, name):
+            raise ValueError(f"Unknown setting {name!r} in {config_path}")
+        default = getattr(env, name)
+        if isinstance(default, np.ndarray):
+            value = np.array(value)
+        elif isinstance(default, tuple):
+            value = tuple(value)
+        setattr(env, name, value)
+
+
+def get_settings() -> Dict[str, Any]:
+    """
+    Get a copy of the current settings, e.g. to pass to worker processes.
+
+    Returns:
+        Dict[str,Any]: The settings
+    """
+    return {
+        name: value
+        for name, value in vars(EnvSettings()).items()
+        if not name.startswith("_")
+    }
+
+
+def apply_settings(settings: Dict[str, Any]):
+    """
+    Apply settings from get_settings (e.g. in a worker process).
+
+    Args:
+        settings (Dict[str,Any]): The settings
+    """
+    vars(EnvSettings()).update(settings)
@@ -0,0 +1,288 @@
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .config import EnvSettings
+from .decoders import decode_image
+from .discovery import is_video_file
+from .frame_cache import frame_scale
+from .process_images import Box
+from .storage import get_storage
+
+ENV = EnvSettings()
+
+# The index of a crop store: the row of each crop in the crops array, and its image and full
+# resolution box
+CROP_INDEX_DTYPE = np.dtype(
+    [
+        ("row", np.int64),
+        ("image_index", np.int32),
+        ("left", np.int32),
+        ("right", np.int32),
+        ("bottom", np.int32),
+        ("top", np.int32),
+    ]
+)
+
+# The fields of the index holding the box
+BOX_FIELDS = ("left", "right", "bottom", "top")
+
+
+def crop_paths(folder_path: str) -> Tuple[str, str]:
+    """
+    Get the paths of the crop store of a folder, or of a video clip.
+
+    Args:
+        folder_path (str): The folder path, or the path to the video
+
+    Returns:
+        str: The path of the raw crops file
+        str: The path of the index
+    """
+    if is_video_file(os.path.basename(folder_path)):
+        stem = os.path.splitext(folder_path)[0]
+        return (
+            f"{stem}_crops_{ENV.run_code}.raw",
+            f"{stem}_crop_index_{ENV.run_code}.json",
+        )
+    return (
+        f"{folder_path}/crops_{ENV.run_code}.raw",
+        f"{folder_path}/crop_index_{ENV.run_code}.json",
+    )
+
+
+def crop_box(image: np.ndarray, box: Box, size: int) -> np.ndarray:
+    """
+    Cut a box out of an image and resize it.
+
+    Args:
+        image (np.ndarray): The image, as (H,W,3) BGR or (H,W) grey
+        box (Box): The box, in the image's coordinates
+        size (int): The height and width of the crop
+
+    Returns:
+        np.ndarray: The (size,size,3) BGR crop
+    """
+    left, right, bottom, top = box
+    left = min(max(left, 0), image.shape[0] - 1)
+    bottom = min(max(bottom, 0), image.shape[1] - 1)
+    crop = image[left : max(right, left + 1), bottom : max(top, bottom + 1)]
+    crop = cv2.resize(crop, (size, size), interpolation=cv2.INTER_AREA)
+    if crop.ndim == 2:
+        crop = cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR)
+    return crop
+
+
+class CropWriter:
+    """
+    Write the accepted boxes of positive images as fixed size crops, while the images are
+    still in memory.
+
+    The crops are appended to one raw (N,size,size,3) uint8 array per folder, which grows
+    ENV.crop_chunk_size crops at a time and is written through a memory map. The index (the
+    image and full resolution box of each crop) is written when the writer is closed.
+    """
+
+    def __init__(self, folder_path: str, start_index: int = 1):
+        """
+        Args:
+            folder_path (str): The folder path
+            start_index (int): The image processing starts from. Crops of earlier images
+                from a previous run are kept, unless starting from the first image.
+        """
+        self.crops_path, self.index_path = crop_paths(folder_path)
+        self.size = ENV.crop_size
+        self._crop_bytes = self.size * self.size * 3
+        self._capacity = 0
+        self._count = 0
+        self._crops: Optional[np.memmap] = None
+        # The rows of the crops of each image, and their boxes
+        self._rows: Dict[int, List[Tuple[int, Box]]] = {}
+
+        if (
+            start_index > 1
+            and os.path.isfile(self.index_path)
+            and os.path.isfile(self.crops_path)
+        ):
+            index_data = get_storage(self.index_path).read_json(self.index_path)
+            # Crops of another size are written again from the start
+            if index_data["crop_shape"] == [self.size, self.size, 3]:
+                index = load_crop_index(folder_path)
+                self._count = os.path.getsize(self.crops_path) // self._crop_bytes
+                for entry in index:
+                    self._rows.setdefault(int(entry["image_index"]), []).append(
+                        (
+                            int(entry["row"]),
+                            tuple(int(entry[name]) for name in BOX_FIELDS),
+                        )
+                    )
+        if self._count == 0:
+            self._rows = {}
+            with open(self.crops_path, "wb"):
+                pass
+
+    def _grow(self):
+        """
+        Extend the crops file by a chunk and map it again.
+        """
+        if self._crops is not None:
+            self._crops.flush()
+            del self._crops
+        self._capacity = self._count + max(1, ENV.crop_chunk_size)
+        with open(self.crops_path, "r+b") as crops_file:
+            crops_file.truncate(self._capacity * self._crop_bytes)
+        self._crops = np.memmap(
+            self.crops_path,
+            dtype=np.uint8,
+            mode="r+",
+            shape=(self._capacity, self.size, self.size, 3),
+        )
+
+    def add(
+        self,
+        image_index: int,
+        image_path: str,
+        image: Optional[np.ndarray],
+        boxes: List[Box],
+        scale: Optional[float] = None,
+    ):
+        """
+        Add the crops of an image, replacing any from a previous run.
+
+        Args:
+            image_index (int): The image index (or frame number of a video clip)
+            image_path (str): The image path, to decode the image if it is not given
+            image (Optional[np.ndarray]): The image as processed, or None to decode it
+            boxes (List[Box]): The accepted boxes, in full resolution coordinates
+            scale (Optional[float]): The scale of the image relative to full resolution
+                (defaults to frame_scale)
+        """
+        self.remove(image_index)
+        if not boxes:
+            return
+
+        if scale is None:
+            scale = frame_scale()
+        if image is None:
+            image = decode_image(image_path)
+            scale = 1.0
+            if image is None:
+                print(f"Warning: Could not read {image_path} to crop its boxes")
+                return
+
+        rows = []
+        for box in boxes:
+            if self._count >= self._capacity:
+                self._grow()
+            scaled_box = tuple(int(coordinate * scale) for coordinate in box)
+            self._crops[self._count] = crop_box(image, scaled_box, self.size)
+            rows.append((self._count, box))
+            self._count += 1
+        self._rows[image_index] = rows
+
+    def remove(self, image_index: int):
+        """
+        Remove the crops of an image from a previous run from the index.
+
+        Removed crops are left unused in the crops file until the folder is next run in full.
+
+        Args:
+            image_index (int): The image index
+        """
+        self._rows.pop(image_index, None)
+
+    def close(self):
+        """
+        Trim the crops file to the crops written, and write the index.
+        """
+        if self._crops is not None:
+            self._crops.flush()
+            del self._crops
+            self._crops = None
+        with open(self.crops_path, "r+b") as crops_file:
+            crops_file.truncate(self._count * self._crop_bytes)
+
+        entries = sorted(
+            (row, image_index, box)
+            for image_index, rows in self._rows.items()
+            for row, box in rows
+        )
+        get_storage(self.index_path).write_json(
+            self.index_path,
+            {
+                "crop_shape": [self.size, self.size, 3],
+                "crops": [
+                    [row, image_index, *box] for row, image_index, box in entries
+                ],
+            },
+        )
+
+
+def load_crop_index(folder_path: str) -> Optional[np.ndarray]:
+    """
+    Load the index of the crop store of a folder (or video clip).
+
+    Args:
+        folder_path (str): The folder path
+
+    Returns:
+        Optional[np.ndarray]: The row, image index and full resolution box of each crop
+            (with CROP_INDEX_DTYPE), or None if there is no index
+    """
+    index_path = crop_paths(folder_path)[1]
+    storage = get_storage(index_path)
+    if not storage.is_file(index_path):
+        return None
+    crops = storage.read_json(index_path)["crops"]
+    return np.array([tuple(crop) for crop in crops], dtype=CROP_INDEX_DTYPE)
+
+
+def load_crops(folder_path: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Load the crop store of a folder (or video clip), memory mapped read-only.
+
+    Args:
+        folder_path (str): The folder path
+
+    Returns:
+        Optional[Tuple[np.ndarray,np.ndarray]]: The (N,size,size,3) BGR crops and the index
+            (see load_crop_index), where index["row"] gives the row of each indexed crop, or
+            None if the folder has no crop store
+    """
+    crops_path, index_path = crop_paths(folder_path)
+    if not os.path.isfile(crops_path) or not os.path.isfile(index_path):
+        return None
+    crop_shape = tuple(get_storage(index_path).read_json(index_path)["crop_shape"])
+    count = os.path.getsize(crops_path) // int(np.prod(crop_shape))
+    if count == 0:
+        crops = np.zeros((0,) + crop_shape, dtype=np.uint8)
+    else:
+        crops = np.memmap(
+            crops_path, dtype=np.uint8, mode="r", shape=(count,) + crop_shape
+        )
+    return crops, load_crop_index(folder_path)
+
+
+def iter_crop_batches(
+    folder_path: str, batch_size: int = 64
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Stream a folder's crops in batches, e.g. to a classifier.
+
+    Args:
+        folder_path (str): The folder path
+        batch_size (int): The number of crops in each batch
+
+    Yields:
+        np.ndarray: A (batch_size,size,size,3) BGR batch of crops (smaller at the end)
+        np.ndarray: The index entries of the crops in the batch
+    """
+    store = load_crops(folder_path)
+    if store is None:
+        return
+    crops, index = store
+    for start in range(0, len(index), batch_size):
+        batch = index[start : start + batch_size]
+        yield crops[batch["row"]], batch
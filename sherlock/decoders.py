@@ -0,0 +1,393 @@
+import abc
+import io
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import EnvSettings
+from .storage import get_storage
+
+ENV = EnvSettings()
+
+# The reduction factors that JPEG images can be decoded at directly
+REDUCTION_FACTORS = (8, 4, 2)
+
+
+def reduced_size(height: int, width: int, scale: float) -> Tuple[int, int]:
+    """
+    Get the size of an image once scaled.
+
+    Args:
+        height (int): The full resolution height
+        width (int): The full resolution width
+        scale (float): The scale relative to full resolution
+
+    Returns:
+        Tuple[int,int]: The scaled height and width
+    """
+    if scale == 1:
+        return height, width
+    return max(1, round(height * scale)), max(1, round(width * scale))
+
+
+def reduction_factor(scale: float) -> int:
+    """
+    Get the largest factor an image can be reduced by while decoding, without going below the
+    requested scale.
+
+    Args:
+        scale (float): The scale relative to full resolution
+
+    Returns:
+        int: The reduction factor (1 if the image is decoded at full resolution)
+    """
+    for factor in REDUCTION_FACTORS:
+        if scale <= 1 / factor:
+            return factor
+    return 1
+
+
+def fit_to_scale(
+    image: np.ndarray, full_size: Tuple[int, int], scale: float
+) -> np.ndarray:
+    """
+    Resize a (possibly already reduced) decoded image to exactly the requested scale.
+
+    Args:
+        image (np.ndarray): The decoded image
+        full_size (Tuple[int,int]): The full resolution height and width
+        scale (float): The scale relative to full resolution
+
+    Returns:
+        np.ndarray: The image at the requested scale
+    """
+    import cv2
+
+    height, width = reduced_size(*full_size, scale)
+    if image.shape[:2] == (height, width):
+        return image
+    return cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def orient(image: np.ndarray, orientation: int) -> np.ndarray:
+    """
+    Rotate or flip a decoded image as given by its EXIF orientation, as OpenCV does.
+
+    Args:
+        image (np.ndarray): The image, as stored
+        orientation (int): The EXIF orientation (1 to 8)
+
+    Returns:
+        np.ndarray: The image, the right way up
+    """
+    if orientation == 2:
+        image = image[:, ::-1]
+    elif orientation == 3:
+        image = image[::-1, ::-1]
+    elif orientation == 4:
+        image = image[::-1]
+    elif orientation == 5:
+        image = image.swapaxes(0, 1)
+    elif orientation == 6:
+        image = np.rot90(image, -1)
+    elif orientation == 7:
+        image = np.rot90(image, -1)[::-1]
+    elif orientation == 8:
+        image = np.rot90(image, 1)
+    # Callers may draw onto the image, so it must not be a read-only view
+    return np.require(image, requirements=("C_CONTIGUOUS", "WRITEABLE"))
+
+
+class Decoder(abc.ABC):
+    """
+    A way of decoding images.
+
+    Every decoder returns the same layout: an (H,W,3) BGR uint8 image, or an (H,W) uint8 image
+    if decoding a single (grey) channel, turned the right way up using its EXIF orientation.
+    """
+
+    # The name of the decoder, as used by ENV.image_decoder
+    name = ""
+
+    def available(self) -> bool:
+        """
+        Check whether the decoder can be used (i.e. its library is installed).
+
+        Returns:
+            bool: True if it can be used
+        """
+        return True
+
+    @abc.abstractmethod
+    def decode(
+        self, data: bytes, single_channel: bool = False, scale: float = 1.0
+    ) -> Optional[np.ndarray]:
+        """
+        Decode an image.
+
+        Args:
+            data (bytes): The encoded image
+            single_channel (bool): Whether to decode the image as a single (grey) channel
+            scale (float): The scale to decode the image at, relative to full resolution
+
+        Returns:
+            Optional[np.ndarray]: The image, or None if it could not be decoded
+        """
+
+
+class OpenCVDecoder(Decoder):
+    """
+    Decode images with OpenCV, reducing JPEG images while decoding with its IMREAD_REDUCED
+    flags.
+    """
+
+    name = "opencv"
+
+    def decode(
+        self, data: bytes, single_channel: bool = False, scale: float = 1.0
+    ) -> Optional[np.ndarray]:
+        import cv2
+
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        flags = cv2.IMREAD_GRAYSCALE if single_channel else cv2.IMREAD_COLOR
+        if scale == 1:
+            return cv2.imdecode(buffer, flags)
+
+        factor = reduction_factor(scale)
+        if factor > 1:
+            # e.g. cv2.IMREAD_REDUCED_COLOR_2, which reduces JPEG images in the DCT
+            flags = getattr(
+                cv2,
+                f"IMREAD_REDUCED_{'GRAYSCALE' if single_channel else 'COLOR'}_{factor}",
+            )
+        image = cv2.imdecode(buffer, flags)
+        if image is None:
+            return None
+        # The full size is needed to scale the reduced image exactly
+        header = read_header(data)
+        if header is None:
+            full_size = (image.shape[0] * factor, image.shape[1] * factor)
+        elif header[2] in (5, 6, 7, 8):
+            # OpenCV has already turned the image
+            full_size = (header[1], header[0])
+        else:
+            full_size = (header[0], header[1])
+        return fit_to_scale(image, full_size, scale)
+
+
+class PILDecoder(Decoder):
+    """
+    Decode images with Pillow, using Image.draft to reduce JPEG images while decoding.
+    """
+
+    name = "pil"
+
+    def decode(
+        self, data: bytes, single_channel: bool = False, scale: float = 1.0
+    ) -> Optional[np.ndarray]:
+        from PIL import Image
+
+        try:
+            with Image.open(io.BytesIO(data)) as pil_image:
+                full_width, full_height = pil_image.size
+                orientation = pil_image.getexif().get(0x0112, 1)
+                mode = "L" if single_channel else "RGB"
+                if scale < 1:
+                    pil_image.draft(
+                        mode, reduced_size(full_height, full_width, scale)[::-1]
+                    )
+                image = np.asarray(pil_image.convert(mode))
+        except (OSError, ValueError):
+            return None
+
+        if not single_channel:
+            image = image[:, :, ::-1]
+        return orient(
+            fit_to_scale(image, (full_height, full_width), scale), orientation
+        )
+
+
+class TurboJPEGDecoder(Decoder):
+    """
+    Decode JPEG images with libjpeg-turbo through PyTurboJPEG (pip install PyTurboJPEG), if it
+    is installed. Other images are decoded with OpenCV.
+    """
+
+    name = "turbojpeg"
+
+    def __init__(self):
+        self._jpeg = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def jpeg(self):
+        """
+        The TurboJPEG instance, or None if libjpeg-turbo could not be loaded.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                try:
+                    from turbojpeg import TurboJPEG
+
+                    self._jpeg = TurboJPEG()
+                except (ImportError, OSError, RuntimeError):
+                    self._jpeg = None
+            return self._jpeg
+
+    def available(self) -> bool:
+        return self.jpeg is not None
+
+    def decode(
+        self, data: bytes, single_channel: bool = False, scale: float = 1.0
+    ) -> Optional[np.ndarray]:
+        if not data.startswith(b"\xff\xd8"):
+            return DECODERS["opencv"].decode(data, single_channel, scale)
+
+        from turbojpeg import TJPF_BGR, TJPF_GRAY
+
+        factor = reduction_factor(scale)
+        try:
+            image = self.jpeg.decode(
+                data,
+                pixel_format=TJPF_GRAY if single_channel else TJPF_BGR,
+                scaling_factor=None if factor == 1 else (1, factor),
+            )
+        except (OSError, ValueError):
+            return None
+        if image.ndim == 3 and single_channel:
+            image = image[:, :, 0]
+
+        header = read_header(data)
+        if header is None:
+            header = (image.shape[0] * factor, image.shape[1] * factor, 1)
+        return orient(fit_to_scale(image, header[:2], scale), header[2])
+
+
+DECODERS: Dict[str, Decoder] = {
+    decoder.name: decoder
+    for decoder in (OpenCVDecoder(), PILDecoder(), TurboJPEGDecoder())
+}
+
+# The decoder chosen by benchmark_decoders, by (image size, scale, single channel)
+_chosen_decoders: Dict[Tuple, Decoder] = {}
+_chosen_decoders_lock = threading.Lock()
+
+
+def read_header(data: bytes) -> Optional[Tuple[int, int, int]]:
+    """
+    Read the size and EXIF orientation of an encoded image, without decoding it.
+
+    Args:
+        data (bytes): The encoded image
+
+    Returns:
+        Optional[Tuple[int,int,int]]: The height and width (as stored, before the image is
+            turned) and orientation, or None if they could not be read
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(io.BytesIO(data)) as pil_image:
+            width, height = pil_image.size
+            return height, width, pil_image.getexif().get(0x0112, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def benchmark_decoders(
+    data: bytes, single_channel: bool = False, scale: float = 1.0, repeats: int = 3
+) -> List[Tuple[str, float]]:
+    """
+    Time each available decoder on an image.
+
+    Args:
+        data (bytes): The encoded image
+        single_channel (bool): Whether to decode the image as a single (grey) channel
+        scale (float): The scale to decode the image at, relative to full resolution
+        repeats (int): The number of times to decode the image with each decoder
+
+    Returns:
+        List[Tuple[str,float]]: The name and mean decode time in seconds of each decoder that
+            could decode the image, fastest first
+    """
+    timings = []
+    for decoder in DECODERS.values():
+        if not decoder.available():
+            continue
+        # The first decode also loads the decoder's library, so is not timed
+        if decoder.decode(data, single_channel, scale) is None:
+            continue
+        start_time = time.perf_counter()
+        for _ in range(repeats):
+            decoder.decode(data, single_channel, scale)
+        timings.append((decoder.name, (time.perf_counter() - start_time) / repeats))
+    return sorted(timings, key=lambda timing: timing[1])
+
+
+def get_decoder(
+    data: bytes, single_channel: bool = False, scale: float = 1.0
+) -> Decoder:
+    """
+    Get the decoder to use, as set by ENV.image_decoder.
+
+    If ENV.image_decoder is "auto", the available decoders are benchmarked on the first image
+    decoded for each image size (ENV.image_size), scale and number of channels, and the
+    fastest is used from then on.
+
+    Args:
+        data (bytes): The encoded image about to be decoded
+        single_channel (bool): Whether the image is decoded as a single (grey) channel
+        scale (float): The scale the image is decoded at, relative to full resolution
+
+    Returns:
+        Decoder: The decoder
+    """
+    if ENV.image_decoder != "auto":
+        if ENV.image_decoder not in DECODERS:
+            raise ValueError(
+                f"Unknown image decoder {ENV.image_decoder!r}, expected one of"
+                f" {('auto',) + tuple(DECODERS)}"
+            )
+        return DECODERS[ENV.image_decoder]
+
+    key = (tuple(ENV.image_size), scale, single_channel)
+    with _chosen_decoders_lock:
+        if key not in _chosen_decoders:
+            timings = benchmark_decoders(data, single_channel, scale)
+            if timings and not _chosen_decoders:
+                # Only the first benchmark is reported, to keep the output short
+                print(
+                    f"Decoding images with {timings[0][0]} ("
+                    + ", ".join(
+                        f"{name}: {seconds * 1000:.1f} ms" for name, seconds in timings
+                    )
+                    + ")"
+                )
+            _chosen_decoders[key] = DECODERS[timings[0][0] if timings else "opencv"]
+        return _chosen_decoders[key]
+
+
+def decode_image(
+    image_path: str, single_channel: bool = False, scale: float = 1.0
+) -> Optional[np.ndarray]:
+    """
+    Read and decode an image with the decoder set by ENV.image_decoder.
+
+    Args:
+        image_path (str): The path to the image
+        single_channel (bool): Whether to decode the image as a single (grey) channel
+        scale (float): The scale to decode the image at, relative to full resolution
+
+    Returns:
+        Optional[np.ndarray]: The (H,W,3) BGR image, or the (H,W) grey image if single_channel
+            is set, or None if it could not be read
+    """
+    try:
+        data = get_storage(image_path).read_bytes(image_path)
+    except OSError:
+        return None
+    return get_decoder(data, single_channel, scale).decode(data, single_channel, scale)
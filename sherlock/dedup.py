@@ -0,0 +1,291 @@
+import hashlib
+import io
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import EnvSettings, get_settings
+from .frame_cache import frame_scale
+from .process_images import CANDIDATE_DTYPE
+from .roi import RegionOfInterest
+from .storage import get_storage
+
+ENV = EnvSettings()
+
+# Settings that change what is found in a window, which key the index of reused windows. The
+# decoder is among these, as decoders give slightly different pixels.
+DETECTION_SETTINGS = {
+    "background_max_images",
+    "background_tol_day",
+    "background_tol_night",
+    "bounces",
+    "burst_interval",
+    "burst_tracking",
+    "colour_lower",
+    "colour_upper",
+    "global_change_fraction",
+    "global_change_max_seeds",
+    "global_change_max_walk",
+    "greyscale_parameter",
+    "image_decoder",
+    "min_background_used",
+    "night_single_channel",
+    "pixel_samples",
+    "roi_tile_size",
+    "sample_size",
+    "secondary_color_lower",
+    "secondary_color_upper",
+    "tracking_margin",
+    "tracking_new_seeds",
+    "volatility_weight",
+}
+
+# Settings that do not change what is found in a window. The thresholds applied by
+# score_contours and the adjacency settings are among these, as reused windows are scored and
+# marked again. The image size, region of interest, frame scale and video stride are covered
+# by the window key itself. Every setting must be in exactly one of these two sets.
+NON_DETECTION_SETTINGS = {
+    "root_directory",
+    "image_prefix",
+    "image_suffix",
+    "min_images_process",
+    "image_metadata_warning_shown",
+    "image_size",
+    "count_pixels",
+    "disturbance_tol",
+    "size_tol_day",
+    "size_tol_night",
+    "secondary_colour_tol",
+    "save_images",
+    "adjacency",
+    "run_code",
+    "datetime_adjacency_tolerance",
+    "include_patterns",
+    "exclude_patterns",
+    "discovery_threads",
+    "estimated_seconds_per_frame",
+    "estimated_seconds_per_megabyte",
+    "coordinate",
+    "lease_ttl",
+    "lease_heartbeat",
+    "watch_poll_interval",
+    "export_mode",
+    "export_workers",
+    "export_preview_scale",
+    "export_jpeg_quality",
+    "video_suffixes",
+    "video_frame_stride",
+    "video_buffer_size",
+    "jobs",
+    "memory_budget_mb",
+    "s3_endpoint_url",
+    "storage_connections",
+    "header_read_bytes",
+    "roi_mask_name",
+    "roi_polygons",
+    "frame_cache_directory",
+    "frame_cache_max_bytes",
+    "frame_cache_scale",
+    "dedup_directory",
+    "dedup_hash_bytes",
+    "crop_size",
+    "crop_chunk_size",
+}
+
+
+@dataclass
+class WindowRecord:
+    """
+    What was found in a background window, so that an identical window can reuse it.
+    """
+
+    # The number of images in the window (background_end_index - window start)
+    length: int
+
+    # The candidates and whether there was a global change, for each image that was searched,
+    # by its position in the window. Images without an entry could not be read.
+    frames: Dict[int, Tuple[np.ndarray, bool]] = field(default_factory=dict)
+
+
+def settings_hash() -> str:
+    """
+    Hash the settings that change what is found in a window.
+
+    Returns:
+        str: The hash
+    """
+    settings = {
+        name: value
+        for name, value in get_settings().items()
+        if name in DETECTION_SETTINGS
+    }
+    settings["frame_scale"] = frame_scale()
+    encoded = json.dumps(settings, sort_keys=True, default=repr)
+    return hashlib.blake2b(encoded.encode(), digest_size=16).hexdigest()
+
+
+def content_hash(image_path: str, content_hashes: Dict[str, str]) -> str:
+    """
+    Hash the contents of an image.
+
+    Only its size and first ENV.dedup_hash_bytes bytes (which hold its metadata and the start
+    of its image data) are hashed, or the whole file if that is 0, in which case the image is
+    read twice.
+
+    Args:
+        image_path (str): The image path
+        content_hashes (Dict[str,str]): The hashes found so far, by path, updated in place
+
+    Returns:
+        str: The hash ("missing" if there is no such image)
+    """
+    if image_path in content_hashes:
+        return content_hashes[image_path]
+    storage = get_storage(image_path)
+    entry = storage.stat(image_path)
+    if entry is None:
+        digest = "missing"
+    else:
+        if ENV.dedup_hash_bytes > 0:
+            data = storage.read_range(image_path, 0, ENV.dedup_hash_bytes)
+        else:
+            data = storage.read_bytes(image_path)
+        hasher = hashlib.blake2b(data, digest_size=16)
+        hasher.update(str(entry.size).encode())
+        digest = hasher.hexdigest()
+    content_hashes[image_path] = digest
+    return digest
+
+
+def window_key(
+    folder_path: str,
+    start_index: int,
+    window_length: int,
+    roi: Optional[RegionOfInterest],
+    content_hashes: Dict[str, str],
+) -> str:
+    """
+    Get the key of a background window, from the contents of every image it could use.
+
+    Args:
+        folder_path (str): The folder path
+        start_index (int): The first image of the window
+        window_length (int): The maximum number of images in the window
+        roi (Optional[RegionOfInterest]): The region to search, if not the whole image
+        content_hashes (Dict[str,str]): The hashes of images found so far, by path, updated
+            in place
+
+    Returns:
+        str: The key
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{window_length}|".encode())
+    if roi is not None:
+        hasher.update(str(roi.mask.shape).encode())
+        hasher.update(np.packbits(roi.mask).tobytes())
+    for image_index in range(start_index, start_index + window_length):
+        image_path = f"{folder_path}/{ENV.image_prefix}_{str(image_index).zfill(4)}.{ENV.image_suffix}"
+        hasher.update(f"|{content_hash(image_path, content_hashes)}".encode())
+    return hasher.hexdigest()
+
+
+def video_window_key(frames: List[np.ndarray], is_daytime: bool) -> str:
+    """
+    Get the key of a window of video frames, from the decoded frames themselves (a clip has
+    no file per frame to hash).
+
+    Args:
+        frames (List[np.ndarray]): The frames of the window
+        is_daytime (bool): Whether the clip is a daytime clip
+
+    Returns:
+        str: The key
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"video|{is_daytime}|{len(frames)}".encode())
+    for frame in frames:
+        hasher.update(f"|{frame.shape}|".encode())
+        hasher.update(np.ascontiguousarray(frame).data)
+    return hasher.hexdigest()
+
+
+def window_record_path(key: str) -> str:
+    """
+    Get the path of the record of a window in the index.
+
+    Args:
+        key (str): The window key
+
+    Returns:
+        str: The path in ENV.dedup_directory, under the hash of the current settings
+    """
+    return f"{ENV.dedup_directory}/{settings_hash()}/{key}.npz"
+
+
+def load_window(key: str) -> Optional[WindowRecord]:
+    """
+    Load the record of a window processed before with the current settings.
+
+    Args:
+        key (str): The window key
+
+    Returns:
+        Optional[WindowRecord]: The record, or None if there is none
+    """
+    path = window_record_path(key)
+    storage = get_storage(path)
+    if not storage.is_file(path):
+        return None
+    try:
+        with np.load(io.BytesIO(storage.read_bytes(path))) as arrays:
+            length = int(arrays["length"])
+            offsets = arrays["offsets"]
+            global_changes = arrays["global_changes"]
+            candidates = arrays["candidates"]
+    except (OSError, KeyError, ValueError) as error:
+        print(f"Warning: Ignoring {path} ({error})")
+        return None
+    if candidates.dtype != CANDIDATE_DTYPE:
+        return None
+
+    record = WindowRecord(length)
+    for offset, global_change in zip(offsets, global_changes):
+        record.frames[int(offset)] = (
+            candidates[candidates["image_index"] == offset].copy(),
+            bool(global_change),
+        )
+    return record
+
+
+def save_window(key: str, record: WindowRecord):
+    """
+    Save the record of a window to the index.
+
+    Args:
+        key (str): The window key
+        record (WindowRecord): The record
+    """
+    offsets = sorted(record.frames)
+    rows = []
+    for offset in offsets:
+        candidates = record.frames[offset][0].copy()
+        candidates["image_index"] = offset
+        rows.append(candidates)
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        length=np.array(record.length),
+        offsets=np.array(offsets, dtype=np.int32),
+        global_changes=np.array(
+            [record.frames[offset][1] for offset in offsets], dtype=bool
+        ),
+        candidates=np.concatenate(rows) if rows else np.zeros(0, CANDIDATE_DTYPE),
+    )
+    path = window_record_path(key)
+    try:
+        get_storage(path).write_bytes(path, buffer.getvalue())
+    except OSError as error:
+        # e.g. another process saving the same window at the same time
+        print(f"Warning: Could not save {path} ({error})")
@@ -0,0 +1,330 @@
+import os
+import re
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from fnmatch import fnmatch
+from typing import Any, List, Optional, Set, Tuple
+
+from .config import EnvSettings
+from .storage import get_storage
+
+ENV = EnvSettings()
+
+
+@dataclass
+class FolderJob:
+    """
+    A folder of images to be processed.
+    """
+
+    # The path to the folder
+    path: str
+
+    # The number of frames matching the image naming convention
+    frame_count: int
+
+    # The total size of those frames in bytes
+    total_bytes: int
+
+    # The highest frame index in the folder
+    max_index: int
+
+    # Whether a previous run with the same run code completed this folder
+    completed: bool
+
+    # The paths of video clips in the folder that still need processing (or of every clip, if
+    # discovered with include_completed_videos)
+    videos: List[str] = field(default_factory=list)
+
+    @property
+    def estimated_seconds(self) -> float:
+        """
+        Estimate the time needed to process this folder.
+        """
+        return (
+            self.frame_count * ENV.estimated_seconds_per_frame
+            + self.total_bytes / 1e6 * ENV.estimated_seconds_per_megabyte
+        )
+
+
+def frame_pattern() -> re.Pattern:
+    """
+    Get a regular expression matching frame file names, capturing the frame index.
+
+    Returns:
+        re.Pattern: The pattern
+    """
+    return re.compile(
+        rf"^{re.escape(ENV.image_prefix)}_(\d+)\.{re.escape(ENV.image_suffix)}$"
+    )
+
+
+def is_excluded(relative_path: str, name: str) -> bool:
+    """
+    Check whether a folder matches one of the exclude patterns.
+
+    Args:
+        relative_path (str): The folder path relative to the root
+        name (str): The folder name
+
+    Returns:
+        bool: True if the folder (and everything below it) should be skipped
+    """
+    return any(
+        fnmatch(name, pattern) or fnmatch(relative_path, pattern)
+        for pattern in ENV.exclude_patterns
+    )
+
+
+def is_included(relative_path: str, name: str) -> bool:
+    """
+    Check whether a folder matches one of the include patterns.
+
+    Args:
+        relative_path (str): The folder path relative to the root
+        name (str): The folder name
+
+    Returns:
+        bool: True if the folder may be processed
+    """
+    return any(
+        fnmatch(name, pattern) or fnmatch(relative_path, pattern)
+        for pattern in ENV.include_patterns
+    )
+
+
+def scan_folder(
+    folder_path: str,
+    relative_path: str,
+    pattern: re.Pattern,
+    include_completed_videos: bool = False,
+) -> Tuple[Optional[FolderJob], List[Tuple[str, str]]]:
+    """
+    Scan a single folder, listing it once.
+
+    Args:
+        folder_path (str): The folder path
+        relative_path (str): The folder path relative to the root
+        pattern (re.Pattern): The frame file name pattern
+        include_completed_videos (bool): Whether to list videos that have been completed
+            (e.g. to rescore them) as well as those that still need processing
+
+    Returns:
+        Optional[FolderJob]: The job for this folder, if it contains frames
+        List[Tuple[str,str]]: The (path, relative path) of each subfolder to scan
+    """
+    frame_count = 0
+    total_bytes = 0
+    max_index = 0
+    videos: List[str] = []
+    pending_videos = 0
+    video_bytes = 0
+    subfolders: List[Tuple[str, str]] = []
+
+    storage = get_storage(folder_path)
+    try:
+        entries = storage.list_dir(folder_path)
+    except OSError as error:
+        print(f"Warning: Could not scan {folder_path} ({error})")
+        return None, []
+
+    for entry in entries:
+        if entry.is_dir:
+            child_relative = (
+                entry.name if relative_path == "" else f"{relative_path}/{entry.name}"
+            )
+            if not is_excluded(child_relative, entry.name):
+                subfolders.append((f"{folder_path}/{entry.name}", child_relative))
+            continue
+
+        match = pattern.match(entry.name)
+        if match is None:
+            # Videos are decoded by OpenCV, which needs local files
+            if storage.is_local and is_video_file(entry.name):
+                video_path = f"{folder_path}/{entry.name}"
+                if not is_video_completed(video_path):
+                    videos.append(video_path)
+                    pending_videos += 1
+                    video_bytes += entry.size
+                elif include_completed_videos:
+                    videos.append(video_path)
+            continue
+        frame_count += 1
+        total_bytes += entry.size
+        max_index = max(max_index, int(match.group(1)))
+
+    name = os.path.basename(os.path.normpath(folder_path))
+    if frame_count <= ENV.min_images_process:
+        # Too few frames to process, but the folder may still contain videos
+        frame_count = total_bytes = max_index = 0
+    if (frame_count == 0 and not videos) or not is_included(relative_path or ".", name):
+        return None, subfolders
+
+    return (
+        FolderJob(
+            path=folder_path,
+            frame_count=frame_count,
+            total_bytes=total_bytes + video_bytes,
+            max_index=max_index,
+            completed=(frame_count == 0 or is_folder_completed(folder_path))
+            and pending_videos == 0,
+            videos=videos,
+        ),
+        subfolders,
+    )
+
+
+def is_folder_completed(folder_path: str) -> bool:
+    """
+    Check whether a previous run with the current run code completed a folder.
+
+    Args:
+        folder_path (str): The folder path
+
+    Returns:
+        bool: True if the folder was completed
+    """
+    return is_output_completed(f"{folder_path}/processed_data_{ENV.run_code}.json")
+
+
+def is_output_completed(json_path: str) -> bool:
+    """
+    Check whether a JSON results file records a completed run.
+
+    Args:
+        json_path (str): The path of the JSON results
+
+    Returns:
+        bool: True if the results are complete
+    """
+    storage = get_storage(json_path)
+    if not storage.is_file(json_path):
+        return False
+    try:
+        return bool(storage.read_json(json_path).get("completed", False))
+    except (OSError, ValueError):
+        return False
+
+
+def is_video_file(file_name: str) -> bool:
+    """
+    Check whether a file is a video, based on ENV.video_suffixes.
+
+    Args:
+        file_name (str): The file name
+
+    Returns:
+        bool: True if the file is a video
+    """
+    suffix = os.path.splitext(file_name)[1][1:].lower()
+    return suffix in {video_suffix.lower() for video_suffix in ENV.video_suffixes}
+
+
+def video_output_paths(
+    video_path: str, run_code: Optional[Any] = None
+) -> Tuple[str, str]:
+    """
+    Get the paths of the result files for a video.
+
+    Args:
+        video_path (str): The path to the video
+        run_code (Optional[Any]): The run code (defaults to ENV.run_code)
+
+    Returns:
+        str: The path of the JSON results
+        str: The path of the summary CSV
+    """
+    if run_code is None:
+        run_code = ENV.run_code
+    stem = os.path.splitext(video_path)[0]
+    return (
+        f"{stem}_processed_data_{run_code}.json",
+        f"{stem}_summary_data_{run_code}.csv",
+    )
+
+
+def is_video_completed(video_path: str) -> bool:
+    """
+    Check whether a previous run with the current run code completed a video.
+
+    Args:
+        video_path (str): The path to the video
+
+    Returns:
+        bool: True if the video was completed
+    """
+    json_path, _ = video_output_paths(video_path)
+    return is_output_completed(json_path)
+
+
+def discover_jobs(
+    root_path: str, include_completed_videos: bool = False
+) -> List[FolderJob]:
+    """
+    Walk a folder tree in parallel and list the folders to process, largest first.
+
+    Folders matching ENV.exclude_patterns are not descended into. Folders are only returned
+    if they match ENV.include_patterns and contain more than ENV.min_images_process frames, or
+    contain unprocessed videos (or any videos, if include_completed_videos is True).
+
+    Args:
+        root_path (str): The root path
+        include_completed_videos (bool): Whether to list videos that have been completed
+            (e.g. to rescore them) in the videos of each job
+
+    Returns:
+        List[FolderJob]: The jobs, ordered by decreasing estimated cost
+    """
+    pattern = frame_pattern()
+    jobs: List[FolderJob] = []
+    pending: Set[Future] = set()
+
+    with ThreadPoolExecutor(max_workers=ENV.discovery_threads) as executor:
+        pending.add(
+            executor.submit(
+                scan_folder, root_path, "", pattern, include_completed_videos
+            )
+        )
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, subfolders = future.result()
+                if job is not None:
+                    jobs.append(job)
+                for subfolder_path, relative_path in subfolders:
+                    pending.add(
+                        executor.submit(
+                            scan_folder,
+                            subfolder_path,
+                            relative_path,
+                            pattern,
+                            include_completed_videos,
+                        )
+                    )
+
+    jobs.sort(key=lambda job: (-job.estimated_seconds, job.path))
+    return jobs
+
+
+def print_plan(jobs: List[FolderJob]):
+    """
+    Print the job plan and its estimated cost.
+
+    Args:
+        jobs (List[FolderJob]): The jobs
+    """
+    remaining = [job for job in jobs if not job.completed]
+    print(f"{'folder':<60} {'frames':>8} {'MB':>10} {'status':>10} {'est. s':>10}")
+    for job in jobs:
+        status = "completed" if job.completed else "pending"
+        print(
+            f"{job.path:<60} {job.frame_count:>8} {job.total_bytes / 1e6:>10.1f}"
+            f" {status:>10} {job.estimated_seconds:>10.1f}"
+        )
+    total_seconds = sum(job.estimated_seconds for job in remaining)
+    print(
+        f"{len(remaining)} of {len(jobs)} folders to process:"
+        f" {sum(job.frame_count for job in remaining)} frames,"
+        f" {sum(job.total_bytes for job in remaining) / 1e6:.1f} MB,"
+        f" estimated {total_seconds / 60:.1f} minutes"
+    )
@@ -0,0 +1,268 @@
+import csv
+import importlib
+import io
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import time
+from dataclasses import replace
+from typing import Any, Dict, List, Optional
+
+from .config import EnvSettings, apply_settings, get_settings
+from .discovery import FolderJob, discover_jobs
+from .storage import get_storage
+
+ENV = EnvSettings()
+
+
+def load_labels(folder_path: str, labels_name: str = "labels.csv") -> Dict[str, bool]:
+    """
+    Load the ground truth labels for a folder.
+
+    The labels file is a CSV with the columns image_index and animal, where animal is 1/0 (or
+    True/False) for whether the image contains an animal.
+
+    Args:
+        folder_path (str): The folder path
+        labels_name (str): The file name of the labels CSV
+
+    Returns:
+        Dict[str,bool]: Whether each image contains an animal, by image index
+    """
+    labels: Dict[str, bool] = {}
+    labels_path = f"{folder_path}/{labels_name}"
+    labels_text = get_storage(labels_path).read_bytes(labels_path).decode()
+    for row in csv.DictReader(io.StringIO(labels_text, newline="")):
+        labels[str(int(row["image_index"]))] = row["animal"].strip().lower() in (
+            "1",
+            "true",
+            "yes",
+        )
+    return labels
+
+
+def score_folder(
+    folder_path: str, labels: Dict[str, bool], run_code: Any
+) -> Dict[str, int]:
+    """
+    Compare Sherlock's results for a folder against its labels.
+
+    Images are counted as positive if Sherlock returned them (including errors and images with
+    insufficient background), as these are the images a user would go on to check.
+
+    Args:
+        folder_path (str): The folder path
+        labels (Dict[str,bool]): The ground truth labels
+        run_code (Any): The run code of the results
+
+    Returns:
+        Dict[str,int]: The numbers of true/false positives/negatives
+    """
+    json_path = f"{folder_path}/processed_data_{run_code}.json"
+    images = get_storage(json_path).read_json(json_path)["images"]
+
+    counts = {
+        "true_positives": 0,
+        "false_positives": 0,
+        "false_negatives": 0,
+        "true_negatives": 0,
+    }
+    for image_index, is_animal in labels.items():
+        image_datum = images.get(image_index)
+        predicted = image_datum is None or image_datum["status"] != "no animal"
+        if predicted and is_animal:
+            counts["true_positives"] += 1
+        elif predicted:
+            counts["false_positives"] += 1
+        elif is_animal:
+            counts["false_negatives"] += 1
+        else:
+            counts["true_negatives"] += 1
+    return counts
+
+
+def _run_configuration(
+    jobs: List[FolderJob], settings: Dict[str, Any], results: multiprocessing.Queue
+):
+    """
+    Run Sherlock on the labelled folders with the given settings, reporting the time taken and
+    peak memory.
+
+    This runs in its own process, so that peak memory is measured for this configuration alone.
+    """
+    from .iterate_folders import run_job
+
+    # Load the processing modules before timing starts
+    importlib.import_module(".sherlock", __package__)
+
+    apply_settings(settings)
+    start_time = time.perf_counter()
+    for job in jobs:
+        run_job(job)
+    elapsed = time.perf_counter() - start_time
+
+    try:
+        import resource
+
+        peak_memory_mb: Optional[float] = resource.getrusage(
+            resource.RUSAGE_SELF
+        ).ru_maxrss / (1024**2 if os.uname().sysname == "Darwin" else 1024)
+    except ImportError:
+        peak_memory_mb = None
+    results.put((elapsed, peak_memory_mb))
+
+
+def evaluate_configurations(
+    root_path: str,
+    configurations: Dict[str, Dict[str, Any]],
+    labels_name: str = "labels.csv",
+    keep_outputs: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Run Sherlock on labelled folders under several configurations and compare the results.
+
+    Each configuration is a set of settings overriding the current ones, and is run in a fresh
+    process with its own run code, so that configurations do not reuse each other's results.
+    A configuration using a frame cache or window index is given new, empty ones for the same
+    reason. Only the images of folders containing a labels file are processed.
+
+    Args:
+        root_path (str): The root path of the labelled folders
+        configurations (Dict[str,Dict[str,Any]]): The settings for each configuration, by name
+        labels_name (str): The file name of the labels CSV in each folder
+        keep_outputs (bool): Whether to keep the output files written by each configuration
+
+    Returns:
+        List[Dict[str,Any]]: The precision, recall, images per second and peak memory of each
+            configuration
+    """
+    # Video clips have no labels, so only the images of each folder are processed
+    jobs = [
+        replace(job, videos=[])
+        for job in discover_jobs(root_path)
+        if get_storage(job.path).is_file(f"{job.path}/{labels_name}")
+    ]
+    if not jobs:
+        raise ValueError(f"No folders with a {labels_name} file found in {root_path}")
+    folders = {job.path: load_labels(job.path, labels_name) for job in jobs}
+    image_count = sum(job.frame_count for job in jobs)
+
+    context = multiprocessing.get_context("spawn")
+    report: List[Dict[str, Any]] = []
+    for name, overrides in configurations.items():
+        settings = get_settings()
+        settings["save_images"] = False
+        settings.update(overrides)
+        settings["run_code"] = f"evaluation_{name}"
+        settings["jobs"] = 1
+        temporary_directories = []
+        for setting_name in ("frame_cache_directory", "dedup_directory"):
+            if settings.get(setting_name):
+                temporary_directories.append(tempfile.mkdtemp(prefix="sherlock_"))
+                settings[setting_name] = temporary_directories[-1]
+
+        try:
+            results = context.Queue()
+            process = context.Process(
+                target=_run_configuration, args=(jobs, settings, results)
+            )
+            process.start()
+            while True:
+                try:
+                    elapsed, peak_memory_mb = results.get(timeout=1)
+                    break
+                except queue.Empty:
+                    if not process.is_alive():
+                        raise RuntimeError(f"Configuration {name!r} failed")
+            process.join()
+        finally:
+            for directory in temporary_directories:
+                shutil.rmtree(directory, ignore_errors=True)
+
+        totals: Dict[str, int] = {}
+        for folder_path, labels in folders.items():
+            counts = score_folder(folder_path, labels, settings["run_code"])
+            for key, count in counts.items():
+                totals[key] = totals.get(key, 0) + count
+            if not keep_outputs:
+                remove_outputs(folder_path, settings["run_code"])
+
+        predicted_positives = totals["true_positives"] + totals["false_positives"]
+        actual_positives = totals["true_positives"] + totals["false_negatives"]
+        report.append(
+            {
+                "configuration": name,
+                "precision": (
+                    totals["true_positives"] / predicted_positives
+                    if predicted_positives
+                    else float("nan")
+                ),
+                "recall": (
+                    totals["true_positives"] / actual_positives
+                    if actual_positives
+                    else float("nan")
+                ),
+                "images_per_second": image_count / elapsed,
+                "peak_memory_mb": peak_memory_mb,
+                **totals,
+            }
+        )
+
+    print_report(report)
+    return report
+
+
+def remove_outputs(folder_path: str, run_code: Any):
+    """
+    Remove the output files written for a run code.
+
+    Args:
+        folder_path (str): The folder path
+        run_code (Any): The run code
+    """
+    for output_name in (
+        f"processed_data_{run_code}.json",
+        f"summary_data_{run_code}.csv",
+        f"manifest_{run_code}.json",
+        f"candidates_{run_code}.npy",
+        f"crops_{run_code}.raw",
+        f"crop_index_{run_code}.json",
+    ):
+        get_storage(folder_path).remove(f"{folder_path}/{output_name}")
+
+
+def write_report(report: List[Dict[str, Any]], report_path: str):
+    """
+    Write the evaluation of each configuration to a CSV.
+
+    Args:
+        report (List[Dict[str,Any]]): The evaluation of each configuration
+        report_path (str): The path of the CSV
+    """
+    with open(report_path, "w", newline="") as report_file:
+        writer = csv.DictWriter(report_file, fieldnames=list(report[0]))
+        writer.writeheader()
+        writer.writerows(report)
+
+
+def print_report(report: List[Dict[str, Any]]):
+    """
+    Print the evaluation of each configuration side by side.
+
+    Args:
+        report (List[Dict[str,Any]]): The evaluation of each configuration
+    """
+    print(
+        f"{'configuration':<24} {'precision':>10} {'recall':>10} {'images/s':>10}"
+        f" {'peak MB':>10}"
+    )
+    for row in report:
+        peak_memory = (
+            "n/a" if row["peak_memory_mb"] is None else f"{row['peak_memory_mb']:.0f}"
+        )
+        print(
+            f"{row['configuration']:<24} {row['precision']:>10.3f} {row['recall']:>10.3f}"
+            f" {row['images_per_second']:>10.1f} {peak_memory:>10}"
+        )
@@ -0,0 +1,219 @@
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+from .config import EnvSettings
+from .decoders import decode_image
+from .process_images import Box
+from .storage import get_storage
+
+ENV = EnvSettings()
+
+EXPORT_MODES = ("annotated", "preview", "link", "original")
+
+
+def draw_boxes(image: np.ndarray, boxes: List[Box], scale: float = 1.0) -> np.ndarray:
+    """
+    Draw boxes onto an image in place.
+
+    Args:
+        image (np.ndarray): The image
+        boxes (List[Box]): The boxes, in full-resolution coordinates
+        scale (float): The scale of the image relative to full resolution
+
+    Returns:
+        np.ndarray: The image (converted to BGR if it was greyscale)
+    """
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    thickness = max(1, round(4 * scale))
+    for left, right, bottom, top in boxes:
+        cv2.rectangle(
+            image,
+            (int(top * scale), int(left * scale)),
+            (int(bottom * scale), int(right * scale)),
+            (0, 0, 255),
+            thickness,
+        )
+    return image
+
+
+class PositiveExporter:
+    """
+    Export positive images on a pool of background writer threads.
+
+    The output depends on the export mode:
+        "annotated": the full-resolution image with its boxes drawn on
+        "preview": a reduced-resolution image (ENV.export_preview_scale) with boxes drawn on
+        "link": a hard link (or symbolic link) to the original file, plus a JSON file of boxes
+            (only the JSON file, naming the original, if the images are not local files)
+        "original": a byte-for-byte copy of the original file, without any annotation
+    """
+
+    def __init__(
+        self,
+        folder_path: str,
+        mode: Optional[str] = None,
+        max_in_flight: Optional[int] = None,
+    ):
+        """
+        Args:
+            folder_path (str): The folder whose positive images are being exported
+            mode (Optional[str]): The export mode (defaults to ENV.export_mode)
+            max_in_flight (Optional[int]): The maximum number of images queued or being
+                written (defaults to twice ENV.export_workers)
+        """
+        self.mode = ENV.export_mode if mode is None else mode
+        if self.mode not in EXPORT_MODES:
+            raise ValueError(
+                f"Unknown export mode {self.mode!r}, expected one of {EXPORT_MODES}"
+            )
+        self.output_folder = f"{folder_path}/positive_images"
+        self.storage = get_storage(self.output_folder)
+        self._folder_created = False
+        self._executor = ThreadPoolExecutor(
+            max_workers=ENV.export_workers, thread_name_prefix="sherlock-export"
+        )
+        # Bound the number of images held in memory while waiting to be written
+        if max_in_flight is None:
+            max_in_flight = 2 * ENV.export_workers
+        self._slots = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._futures: List[Future] = []
+
+    def __enter__(self) -> "PositiveExporter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def submit(self, image_path: str, image: Optional[np.ndarray], boxes: List[Box]):
+        """
+        Queue a positive image for export.
+
+        The exporter takes ownership of the image and may draw onto it, so the caller must not
+        use it afterwards.
+
+        Args:
+            image_path (str): The path to the original image, whose file name is used for
+                the exported image
+            image (Optional[np.ndarray]): The decoded full resolution image (decoded here if
+                not given, and not needed for "link" or "original")
+            boxes (List[Box]): The accepted boxes
+        """
+        if not self._folder_created and self.storage.is_local:
+            os.makedirs(self.output_folder, exist_ok=True)
+            self._folder_created = True
+
+        self._slots.acquire()
+        future = self._executor.submit(self._export, image_path, image, boxes)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def close(self):
+        """
+        Wait for every queued export to be written, raising the first error (if any).
+        """
+        self._executor.shutdown(wait=True)
+        futures, self._futures = self._futures, []
+        for future in futures:
+            future.result()
+
+    def _export(self, image_path: str, image: Optional[np.ndarray], boxes: List[Box]):
+        output_path = f"{self.output_folder}/{os.path.basename(image_path)}"
+        if image is None and self.mode in ("annotated", "preview"):
+            image = decode_image(image_path)
+
+        if self.mode == "annotated":
+            self.write_image(output_path, draw_boxes(image, boxes))
+
+        elif self.mode == "preview":
+            scale = ENV.export_preview_scale
+            preview = cv2.resize(
+                image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+            )
+            self.write_image(
+                output_path,
+                draw_boxes(preview, boxes, scale),
+                [cv2.IMWRITE_JPEG_QUALITY, ENV.export_jpeg_quality],
+            )
+
+        elif self.mode == "link" and not self.storage.is_local:
+            write_box_sidecar(output_path, boxes, image_path)
+
+        elif self.mode == "link":
+            if os.path.lexists(output_path):
+                os.remove(output_path)
+            try:
+                os.link(image_path, output_path)
+            except OSError:
+                os.symlink(os.path.abspath(image_path), output_path)
+            write_box_sidecar(output_path, boxes)
+
+        elif self.storage.is_local:
+            shutil.copyfile(image_path, output_path)
+
+        else:
+            self.storage.write_bytes(
+                output_path, get_storage(image_path).read_bytes(image_path)
+            )
+
+    def write_image(
+        self,
+        output_path: str,
+        image: np.ndarray,
+        parameters: Optional[List[int]] = None,
+    ):
+        """
+        Encode an image (in the format given by its file suffix) and write it.
+
+        Args:
+            output_path (str): The path to write to
+            image (np.ndarray): The image
+            parameters (Optional[List[int]]): The cv2.imwrite parameters
+        """
+        if self.storage.is_local:
+            cv2.imwrite(output_path, image, parameters or [])
+            return
+        success, encoded = cv2.imencode(
+            os.path.splitext(output_path)[1], image, parameters or []
+        )
+        if not success:
+            raise ValueError(f"Could not encode {output_path}")
+        self.storage.write_bytes(output_path, encoded.tobytes())
+
+
+def write_box_sidecar(
+    output_path: str, boxes: List[Box], image_path: Optional[str] = None
+):
+    """
+    Write the boxes for an exported image to a JSON file next to it.
+
+    Boxes are written in pixel coordinates, with x measured along each row and y down each column.
+
+    Args:
+        output_path (str): The path to the exported image
+        boxes (List[Box]): The boxes
+        image_path (Optional[str]): The image to name in the JSON file (defaults to the file
+            name of the exported image)
+    """
+    sidecar_path = f"{os.path.splitext(output_path)[0]}.json"
+    get_storage(sidecar_path).write_json(
+        sidecar_path,
+        {
+            "image": image_path or os.path.basename(output_path),
+            "boxes": [
+                {
+                    "x_min": int(bottom),
+                    "x_max": int(top),
+                    "y_min": int(left),
+                    "y_max": int(right),
+                }
+                for left, right, bottom, top in boxes
+            ],
+        },
+    )
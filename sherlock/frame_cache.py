@@ -0,0 +1,209 @@
+import hashlib
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .config import EnvSettings
+from .decoders import decode_image, reduced_size
+from .process_images import Box
+from .storage import get_storage
+
+ENV = EnvSettings()
+
+# The bytes held in the cache directory, as last counted by this process
+_cache_bytes: Optional[int] = None
+_cache_lock = threading.Lock()
+
+
+def frame_scale() -> float:
+    """
+    Get the scale at which images are decoded, relative to full resolution.
+
+    Returns:
+        float: ENV.frame_cache_scale if the frame cache is in use, and 1 otherwise
+    """
+    if not ENV.frame_cache_directory:
+        return 1.0
+    return ENV.frame_cache_scale
+
+
+def scaled_size(height: int, width: int) -> Tuple[int, int]:
+    """
+    Get the size of an image once scaled to frame_scale.
+
+    Args:
+        height (int): The full resolution height
+        width (int): The full resolution width
+
+    Returns:
+        Tuple[int,int]: The scaled height and width
+    """
+    return reduced_size(height, width, frame_scale())
+
+
+def full_resolution_boxes(boxes: List[Box]) -> List[Box]:
+    """
+    Convert boxes found in scaled images (see frame_scale) to full resolution coordinates.
+
+    Args:
+        boxes (List[Box]): The boxes, in scaled coordinates
+
+    Returns:
+        List[Box]: The boxes, in full resolution coordinates
+    """
+    scale = frame_scale()
+    if scale == 1:
+        return boxes
+    return [
+        (
+            int(left / scale),
+            int(right / scale),
+            int(bottom / scale),
+            int(top / scale),
+        )
+        for left, right, bottom, top in boxes
+    ]
+
+
+def cache_path(image_path: str, single_channel: bool) -> Optional[str]:
+    """
+    Get the path of the cached copy of an image.
+
+    The cache key includes the size and modification time of the image, so an image that is
+    replaced is decoded again rather than read from a stale copy.
+
+    Args:
+        image_path (str): The image path
+        single_channel (bool): Whether the image is decoded as a single (grey) channel
+
+    Returns:
+        Optional[str]: The path in ENV.frame_cache_directory, or None if the image does not exist
+    """
+    entry = get_storage(image_path).stat(image_path)
+    if entry is None:
+        return None
+    if get_storage(image_path).is_local:
+        image_path = os.path.abspath(image_path)
+    key = hashlib.sha1(
+        f"{image_path}|{entry.size}|{entry.mtime_ns}|{frame_scale()}|{int(single_channel)}".encode()
+    ).hexdigest()
+    return os.path.join(ENV.frame_cache_directory, key[:2], f"{key}.npy")
+
+
+def load_cached_image(
+    image_path: str, single_channel: bool = False
+) -> Optional[np.ndarray]:
+    """
+    Decode an image through the frame cache.
+
+    Cached images are memory mapped copy-on-write, so they are read without being decoded,
+    and changes (e.g. boxes drawn for export) never reach the cache. They are still copied
+    once into the window's stack by make_background_window. Images not yet cached are
+    decoded, scaled to ENV.frame_cache_scale and saved for later runs.
+
+    Args:
+        image_path (str): The path to the image
+        single_channel (bool): Whether to decode the image as a single (grey) channel
+
+    Returns:
+        Optional[np.ndarray]: The (H,W,3) BGR image, or the (H,W) grey image if single_channel
+            is set, or None if it could not be read
+    """
+    path = cache_path(image_path, single_channel)
+    if path is None:
+        return None
+    try:
+        image = np.load(path, mmap_mode="c")
+        # Record the use, as the least recently used images are evicted first
+        os.utime(path)
+        return image
+    except (OSError, ValueError):
+        pass
+
+    image = decode_image(image_path, single_channel, frame_scale())
+    if image is None:
+        return None
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_path, "wb") as cache_file:
+            np.save(cache_file, image)
+        os.replace(temporary_path, path)
+    except OSError as error:
+        print(f"Warning: Could not cache {image_path} ({error})")
+        return image
+    add_cache_bytes(os.path.getsize(path))
+    return image
+
+
+def add_cache_bytes(size: int):
+    """
+    Count a file added to the frame cache, evicting the least recently used images once the
+    cache is larger than ENV.frame_cache_max_bytes.
+
+    Args:
+        size (int): The size of the file in bytes
+    """
+    global _cache_bytes
+
+    with _cache_lock:
+        if _cache_bytes is None:
+            _cache_bytes = sum(size for _, size, _ in list_cache_files())
+        else:
+            _cache_bytes += size
+        if _cache_bytes > ENV.frame_cache_max_bytes:
+            _cache_bytes = evict_cache_files(int(0.9 * ENV.frame_cache_max_bytes))
+
+
+def list_cache_files() -> List[Tuple[str, int, float]]:
+    """
+    List the images in the frame cache.
+
+    Returns:
+        List[Tuple[str,int,float]]: The path, size and last use time of each image
+    """
+    cache_files = []
+    if not os.path.isdir(ENV.frame_cache_directory):
+        return cache_files
+    for subfolder in os.scandir(ENV.frame_cache_directory):
+        if not subfolder.is_dir():
+            continue
+        for entry in os.scandir(subfolder.path):
+            if not entry.name.endswith(".npy"):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                # Evicted by another process
+                continue
+            cache_files.append((entry.path, stat.st_size, stat.st_mtime))
+    return cache_files
+
+
+def evict_cache_files(target_bytes: int) -> int:
+    """
+    Remove the least recently used images from the frame cache until it fits in target_bytes.
+
+    Other processes may share the cache, so the files are counted again here.
+
+    Args:
+        target_bytes (int): The size to reduce the cache to
+
+    Returns:
+        int: The size of the cache afterwards
+    """
+    cache_files = sorted(list_cache_files(), key=lambda cache_file: cache_file[2])
+    total_bytes = sum(size for _, size, _ in cache_files)
+    for path, size, _ in cache_files:
+        if total_bytes <= target_bytes:
+            break
+        try:
+            # Open memory maps of the file stay valid once it has been removed
+            os.remove(path)
+        except OSError:
+            continue
+        total_bytes -= size
+    return total_bytes
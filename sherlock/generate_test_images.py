@@ -2,6 +2,7 @@
 # To run it, it requires the additional dependency piexif
 
 
+import csv
 import os
 import random
 from datetime import datetime
@@ -22,13 +23,14 @@ for folder in folders:
 
 def generate_image_with_blob(
     width: int, height: int, blob_radius: int = 5
-) -> Image.Image:
+) -> tuple[Image.Image, int]:
     # Create a white image
     image = Image.new("RGB", (width, height), "white")
     draw = ImageDraw.Draw(image)
 
     # Random position for the black blob
-    for _ in range(random.randint(0, 2)):
+    blob_count = random.randint(0, 2)
+    for _ in range(blob_count):
         blob_x = random.randint(blob_radius, width - blob_radius)
         blob_y = random.randint(blob_radius, height - blob_radius)
 
@@ -43,7 +45,7 @@ def generate_image_with_blob(
             fill="black",
         )
 
-    return image
+    return image, blob_count
 
 
 def save_image_with_exif(image: Image.Image, path: str, flash_value: int):
@@ -70,9 +72,10 @@ def save_image_with_exif(image: Image.Image, path: str, flash_value: int):
 
 # Generate images with EXIF metadata
 for folder, (num_images, size) in folders.items():
+    labels = []
     for i in range(num_images):
         # Generate image with random blob
-        img = generate_image_with_blob(*size)
+        img, blob_count = generate_image_with_blob(*size)
 
         # Assign Flash value (24 for daytime, other for nighttime)
         flash_value = 24 if random.random() > 0.1 else 0
@@ -81,4 +84,13 @@ for folder, (num_images, size) in folders.items():
         image_path = os.path.join(folder, f"image_{str(i+1).zfill(4)}.jpg")
         save_image_with_exif(img, image_path, flash_value)
 
+        # Record the ground truth (the blobs are the "animals")
+        labels.append({"image_index": i + 1, "animal": int(blob_count > 0)})
+
+    # Save the ground truth labels, for use with sherlock.evaluate
+    with open(os.path.join(folder, "labels.csv"), "w", newline="") as labels_file:
+        writer = csv.DictWriter(labels_file, fieldnames=["image_index", "animal"])
+        writer.writeheader()
+        writer.writerows(labels)
+
 print("Image generation and metadata saving complete.")
@@ -1,31 +1,157 @@
-import os
-from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import closing
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
-from .config import EnvSettings
-from .sherlock import process_folder
+from .config import EnvSettings, apply_settings, get_settings
+from .discovery import (
+    FolderJob,
+    discover_jobs,
+    is_folder_completed,
+    is_video_completed,
+    print_plan,
+)
+from .leases import FolderLease, LeaseLostError
+from .resources import memory_budget_bytes, plan_resources, probe_image_shape
 
 ENV = EnvSettings()
 
 
-def run_sherlock(root_path: str = ENV.root_directory):
+def run_sherlock(
+    root_path: Optional[str] = None, dry_run: bool = False, jobs: Optional[int] = None
+):
     """
     Run Sherlock on a range of folders.
 
     Args:
-        root_path (str): The root path
-    """
-    # Run folder if it meets conditions
-    folder_path = Path(root_path)
-    file_count = len(list(folder_path.glob(f"*{ENV.image_suffix}")))
-    if (
-        file_count > ENV.min_images_process
-        and root_path.split("/")[-1] != "positive_images"
-    ):
-        print(f"Running folder {root_path}")
-
-        process_folder(root_path)
-
-    # Process subfolders
-    if os.path.isdir(root_path):
-        for folder in os.listdir(root_path):
-            run_sherlock(f"{root_path}/{folder}")
+        root_path (Optional[str]): The root path (defaults to ENV.root_directory)
+        dry_run (bool): If True, only print the job plan and its estimated cost
+        jobs (Optional[int]): The number of folders to process at the same time (defaults to
+            ENV.jobs)
+    """
+    if root_path is None:
+        root_path = ENV.root_directory
+    if jobs is None:
+        jobs = ENV.jobs
+
+    folder_jobs = discover_jobs(root_path)
+    if dry_run:
+        print_plan(folder_jobs)
+        return
+
+    pending_jobs = []
+    for job in folder_jobs:
+        if job.completed:
+            print(f"Skipping folder {job.path} as it has been previously completed")
+        else:
+            pending_jobs.append(job)
+
+    if jobs <= 1 or len(pending_jobs) <= 1:
+        for job in pending_jobs:
+            run_job(job)
+        return
+
+    settings, jobs = plan_workers(pending_jobs, jobs)
+
+    # Jobs are ordered largest first, so that the pool finishes as evenly as possible
+    with ProcessPoolExecutor(
+        max_workers=jobs, initializer=apply_settings, initargs=(settings,)
+    ) as executor:
+        futures = {executor.submit(run_job, job): job for job in pending_jobs}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as error:
+                print(f"Warning: Processing {futures[future].path} failed ({error!r})")
+
+
+def plan_workers(
+    pending_jobs: List[FolderJob], jobs: int
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Share the memory budget between worker processes, based on the largest folder's images.
+
+    Args:
+        pending_jobs (List[FolderJob]): The jobs to run, largest first
+        jobs (int): The number of folders to process at the same time
+
+    Returns:
+        Dict[str,Any]: The settings for each worker
+        int: The number of workers that fit in the memory budget
+    """
+    settings = get_settings()
+    largest_job = pending_jobs[0]
+    image_shape = probe_image_shape(
+        f"{largest_job.path}/{ENV.image_prefix}_{str(largest_job.max_index).zfill(4)}"
+        f".{ENV.image_suffix}"
+    )
+    budget = memory_budget_bytes()
+    if image_shape is not None and budget is not None:
+        jobs = plan_resources(image_shape, jobs).workers
+        settings["memory_budget_mb"] = budget / jobs / 1024**2
+    return settings, jobs
+
+
+def run_job(job: FolderJob, cancelled: Optional[Callable[[], bool]] = None):
+    """
+    Run a single job, claiming its folder first if coordinating with other processes.
+
+    Args:
+        job (FolderJob): The job
+        cancelled (Optional[Callable[[],bool]]): If given, checked after each image, and
+            the job is stopped once it returns True
+    """
+    if not ENV.coordinate:
+        process_job(job, cancelled=cancelled)
+        return
+
+    # Claim the folder so that no other process works on it at the same time
+    with FolderLease(job.path) as lease:
+        if not lease.acquire():
+            print(f"Skipping folder {job.path} as it is claimed by another process")
+            return
+        try:
+            process_job(job, lease, cancelled)
+        except LeaseLostError as error:
+            print(f"Warning: Stopped processing {job.path} ({error})")
+
+
+def process_job(
+    job: FolderJob,
+    lease: Optional[FolderLease] = None,
+    cancelled: Optional[Callable[[], bool]] = None,
+):
+    """
+    Process the images and videos in a folder, skipping any completed since it was discovered.
+
+    Args:
+        job (FolderJob): The job
+        lease (Optional[FolderLease]): The lease held on the folder, if coordinating
+        cancelled (Optional[Callable[[],bool]]): If given, checked after each image, and
+            the job is stopped once it returns True. The results so far are kept, and the
+            folder resumes from its first unfinished background window when it is next run.
+    """
+    # Imported here so that runs with nothing to do avoid loading OpenCV and pandas
+    from .sherlock import iter_folder_results
+    from .video import process_video
+
+    if job.frame_count > 0:
+        if is_folder_completed(job.path):
+            print(f"Skipping folder {job.path} as it has been completed elsewhere")
+        else:
+            print(f"Running folder {job.path}")
+            # Closed on cancellation, which finishes the exports and crops so far
+            with closing(iter_folder_results(job.path, lease)) as results:
+                for _ in results:
+                    if cancelled is not None and cancelled():
+                        print(f"Stopped processing {job.path} as it was cancelled")
+                        return
+
+    for video_path in job.videos:
+        if cancelled is not None and cancelled():
+            return
+        if is_video_completed(video_path):
+            continue
+        if lease is not None:
+            lease.check()
+        print(f"Running video {video_path}")
+        process_video(video_path)
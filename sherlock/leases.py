@@ -0,0 +1,166 @@
+import json
+import os
+import secrets
+import socket
+import threading
+import time
+from typing import Optional
+
+from .config import EnvSettings
+from .storage import get_storage
+
+ENV = EnvSettings()
+
+
+class LeaseLostError(RuntimeError):
+    """
+    Raised when a lease has been taken over by another process while work was in progress.
+    """
+
+
+class FolderLease:
+    """
+    A lease on a folder, held through a lease file in that folder.
+
+    Leases need only a shared filesystem (e.g. NFS): a lease is created with an atomic
+    exclusive create, kept alive by a heartbeat thread that refreshes the file's modification
+    time, and may be taken over by another process once it has not been refreshed for
+    ENV.lease_ttl seconds.
+    """
+
+    def __init__(self, folder_path: str, name: Optional[str] = None):
+        """
+        Args:
+            folder_path (str): The folder to lease
+            name (Optional[str]): The name of the lease (defaults to one lease per run code)
+        """
+        if not get_storage(folder_path).is_local:
+            raise ValueError(
+                "Leases need a shared filesystem, so coordinate cannot be used with"
+                f" {folder_path}"
+            )
+        if name is None:
+            name = str(ENV.run_code)
+        self.lease_path = f"{folder_path}/.sherlock_lease_{name}"
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.lost = False
+        self._held = False
+        self._stop_heartbeat = threading.Event()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "FolderLease":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def acquire(self) -> bool:
+        """
+        Try to claim the lease, taking it over if its holder has stopped heartbeating.
+
+        Returns:
+            bool: True if the lease is now held by this process
+        """
+        if self._try_create():
+            self._start_heartbeat()
+            return True
+
+        if not self._is_expired():
+            return False
+
+        # Move the stale lease aside. Rename is atomic, so only one process can win it
+        tombstone_path = f"{self.lease_path}.{self.owner.replace(':', '_')}.stale"
+        try:
+            os.rename(self.lease_path, tombstone_path)
+        except FileNotFoundError:
+            return False
+
+        if not self._is_expired(tombstone_path):
+            # Another process took the lease over between our check and the rename; give
+            # it back (os.link fails if someone has created a new lease in the meantime)
+            try:
+                os.link(tombstone_path, self.lease_path)
+            except OSError:
+                pass
+            _remove_file(tombstone_path)
+            return False
+
+        print(f"Taking over expired lease {self.lease_path}")
+        _remove_file(tombstone_path)
+        if self._try_create():
+            self._start_heartbeat()
+            return True
+        return False
+
+    def release(self):
+        """
+        Release the lease, if it is still held by this process.
+        """
+        self._stop_heartbeat.set()
+        if self._heartbeat_thread is not None:
+            self._heartbeat_thread.join()
+            self._heartbeat_thread = None
+        if self._held and self._is_owner():
+            _remove_file(self.lease_path)
+        self._held = False
+
+    def check(self):
+        """
+        Raise LeaseLostError if the lease has been taken over by another process.
+        """
+        if self.lost:
+            raise LeaseLostError(f"Lease {self.lease_path} was taken over")
+
+    def _try_create(self) -> bool:
+        try:
+            file_descriptor = os.open(
+                self.lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644
+            )
+        except FileExistsError:
+            return False
+        with os.fdopen(file_descriptor, "w") as lease_file:
+            json.dump({"owner": self.owner, "acquired": time.time()}, lease_file)
+            lease_file.flush()
+            os.fsync(lease_file.fileno())
+        self._held = True
+        self.lost = False
+        return True
+
+    def _is_expired(self, path: Optional[str] = None) -> bool:
+        try:
+            modified_time = os.stat(path or self.lease_path).st_mtime
+        except FileNotFoundError:
+            return False
+        return time.time() - modified_time > ENV.lease_ttl
+
+    def _is_owner(self) -> bool:
+        try:
+            with open(self.lease_path, "r") as lease_file:
+                return json.load(lease_file).get("owner") == self.owner
+        except (OSError, ValueError):
+            return False
+
+    def _start_heartbeat(self):
+        self._stop_heartbeat.clear()
+        self._heartbeat_thread = threading.Thread(
+            target=self._heartbeat, name=f"heartbeat {self.lease_path}", daemon=True
+        )
+        self._heartbeat_thread.start()
+
+    def _heartbeat(self):
+        while not self._stop_heartbeat.wait(ENV.lease_heartbeat):
+            if not self._is_owner():
+                print(f"Warning: Lease {self.lease_path} was taken over")
+                self.lost = True
+                return
+            try:
+                os.utime(self.lease_path)
+            except OSError as error:
+                print(f"Warning: Could not refresh lease {self.lease_path} ({error})")
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
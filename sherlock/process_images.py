@@ -1,13 +1,171 @@
-from typing import List, Tuple, Union
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 
 import numpy as np
 
 from .config import EnvSettings
+from .roi import RegionOfInterest
 
 ENV = EnvSettings()
 
+# A box as (left, right, bottom, top): left/right are row indices, bottom/top column indices
+Box = Tuple[int, int, int, int]
 
-def animal_finder(image: np.ndarray, background_image: np.ndarray, is_daytime: bool):
+# The end point of each walk already made in a frame, keyed by (direction, start position)
+WalkMemo = Dict[Tuple[int, int, int, int], Tuple[float, float]]
+
+# A candidate rectangle from animal_finder, with the measurements used to accept or reject it
+CANDIDATE_DTYPE = np.dtype(
+    [
+        ("image_index", np.int32),
+        ("left", np.int32),
+        ("right", np.int32),
+        ("bottom", np.int32),
+        ("top", np.int32),
+        ("area", np.int64),
+        ("disturbance", np.float64),
+        ("secondary_colour", np.float64),
+        ("is_daytime", np.bool_),
+    ]
+)
+
+
+def channel_bounds(
+    lower: np.ndarray, upper: np.ndarray, single_channel: bool
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Get the colour bounds to test sampled pixels against.
+
+    A grey pixel is within the bounds on every channel when its value is above the largest
+    lower bound and below the smallest upper bound, so these are used for single channel images.
+
+    Args:
+        lower (np.ndarray): The lower bound of each channel (BGR)
+        upper (np.ndarray): The upper bound of each channel (BGR)
+        single_channel (bool): Whether the images have a single channel
+
+    Returns:
+        Tuple[np.ndarray,np.ndarray]: The lower and upper bounds
+    """
+    if single_channel:
+        return np.array([np.max(lower)]), np.array([np.min(upper)])
+    return np.asarray(lower), np.asarray(upper)
+
+
+def with_channels(samples: np.ndarray, single_channel: bool) -> np.ndarray:
+    """
+    Give pixel samples from a single channel image a channel axis, so that they can be tested
+    in the same way as samples from colour images.
+
+    Args:
+        samples (np.ndarray): The pixel samples
+        single_channel (bool): Whether the samples are from a single channel image
+
+    Returns:
+        np.ndarray: The samples, with the channels on the last axis
+    """
+    return samples[..., np.newaxis] if single_channel else samples
+
+
+def grey_walk_bounds(image: np.ndarray) -> Optional[Tuple[float, float]]:
+    """
+    Get the colour bounds used by directional_walk for a single channel image.
+
+    These are found once per image, as directional_walk is called many times.
+
+    Args:
+        image (np.ndarray): The image
+
+    Returns:
+        Optional[Tuple[float,float]]: The lower and upper bounds, or None for a colour image
+    """
+    if image.ndim != 2:
+        return None
+    lower, upper = channel_bounds(ENV.colour_lower, ENV.colour_upper, True)
+    return float(lower[0]), float(upper[0])
+
+
+class WalkLimits(NamedTuple):
+    """
+    The limits on the walks made in an image, found once per image by walk_limits.
+    """
+
+    # The colour bounds for a single channel image (see grey_walk_bounds)
+    grey_bounds: Optional[Tuple[float, float]]
+
+    # The pixels to search, if not the whole image
+    roi_mask: Optional[np.ndarray]
+
+    # The background tolerance of each pixel, if it is not the same everywhere
+    tolerance_map: Optional[np.ndarray]
+
+    # The number of steps left for all the walks in the image, if limited (held in a list, as
+    # it is shared by every walk)
+    step_budget: Optional[List[int]] = None
+
+
+def background_tolerance_map(
+    is_daytime: bool, volatility: Optional[np.ndarray]
+) -> Optional[np.ndarray]:
+    """
+    Get the background tolerance of each pixel, raised by ENV.volatility_weight times the
+    volatility of the pixel over the background window.
+
+    Args:
+        is_daytime (bool): Whether or not the image is a daytime image
+        volatility (Optional[np.ndarray]): The (H,W) volatility of each pixel, from
+            make_background_window
+
+    Returns:
+        Optional[np.ndarray]: The (H,W) tolerances, or None if the tolerance is the same
+            everywhere
+    """
+    if volatility is None or ENV.volatility_weight <= 0:
+        return None
+    background_tolerance = (
+        ENV.background_tol_day if is_daytime else ENV.background_tol_night
+    )
+    return background_tolerance + ENV.volatility_weight * volatility
+
+
+def walk_limits(
+    image: np.ndarray,
+    is_daytime: bool,
+    roi: Optional[RegionOfInterest] = None,
+    volatility: Optional[np.ndarray] = None,
+    max_walk_steps: Optional[int] = None,
+) -> WalkLimits:
+    """
+    Get the limits on the walks made in an image.
+
+    Args:
+        image (np.ndarray): The image
+        is_daytime (bool): Whether or not the image is a daytime image
+        roi (Optional[RegionOfInterest]): The region to search, if not the whole image.
+        volatility (Optional[np.ndarray]): The volatility of each pixel over the background
+            window, if known.
+        max_walk_steps (Optional[int]): The total number of steps allowed for all the walks
+            in the image, if limited.
+
+    Returns:
+        WalkLimits: The limits
+    """
+    return WalkLimits(
+        grey_walk_bounds(image),
+        None if roi is None else roi.mask,
+        background_tolerance_map(is_daytime, volatility),
+        None if max_walk_steps is None else [max_walk_steps],
+    )
+
+
+def animal_finder(
+    image: np.ndarray,
+    background_image: np.ndarray,
+    is_daytime: bool,
+    seed_positions: Optional[np.ndarray] = None,
+    roi: Optional[RegionOfInterest] = None,
+    volatility: Optional[np.ndarray] = None,
+    max_walk_steps: Optional[int] = None,
+):
     """
     Identify animals in an image by locating bounding rectangles around detected points.
 
@@ -19,6 +177,13 @@ def animal_finder(image: np.ndarray, background_image: np.ndarray, is_daytime: b
         image (np.ndarray): The image in which to detect animals.
         background_image (np.ndarray): The background image
         is_daytime (bool): Whether or not this image was a daytime image
+        seed_positions (Optional[np.ndarray]): Candidate positions already found for this image
+            (e.g. by animal_inner_batch). If not given, they are found with animal_inner.
+        roi (Optional[RegionOfInterest]): The region to search, if not the whole image.
+        volatility (Optional[np.ndarray]): The volatility of each pixel over the background
+            window, from make_background_window.
+        max_walk_steps (Optional[int]): The total number of steps allowed for the walks in
+            the image, if limited (e.g. for a global change, see guard_global_change).
     Returns:
         tuple: Pruned lists of left, right, bottom, and top coordinates for bounding rectangles.
     """
@@ -27,7 +192,16 @@ def animal_finder(image: np.ndarray, background_image: np.ndarray, is_daytime: b
     top_bounds: List[int] = []
     bottom_bounds: List[int] = []
 
-    new_positions, animal_count = animal_inner(image, background_image, is_daytime)
+    if seed_positions is None:
+        new_positions, animal_count = animal_inner(
+            image, background_image, is_daytime, roi, volatility
+        )
+    else:
+        new_positions, animal_count = seed_positions, len(seed_positions)
+
+    # Walks from different seeds cross the same pixels, so share their end points
+    walk_memo: WalkMemo = {}
+    limits = walk_limits(image, is_daytime, roi, volatility, max_walk_steps)
 
     for i in range(animal_count):
         position = new_positions[i]
@@ -43,7 +217,12 @@ def animal_finder(image: np.ndarray, background_image: np.ndarray, is_daytime: b
 
         if is_new_point:
             left, right, top, bottom = bounce(
-                image, background_image, is_daytime, position
+                image,
+                background_image,
+                is_daytime,
+                position,
+                walk_memo,
+                limits,
             )
 
             if left < right and bottom < top:
@@ -55,6 +234,8 @@ def animal_finder(image: np.ndarray, background_image: np.ndarray, is_daytime: b
                         background_image,
                         is_daytime,
                         np.array([x_position, y_position]),
+                        walk_memo,
+                        limits,
                     )
                     left = min(left, left_new)
                     right = max(right, right_new)
@@ -121,8 +302,367 @@ def animal_finder(image: np.ndarray, background_image: np.ndarray, is_daytime: b
     return pruned_lefts, pruned_rights, pruned_bottoms, pruned_tops
 
 
+def burst_finder(
+    image: np.ndarray,
+    background_image: np.ndarray,
+    is_daytime: bool,
+    previous_boxes: List[Box],
+    seed_positions: Optional[np.ndarray] = None,
+    roi: Optional[RegionOfInterest] = None,
+    volatility: Optional[np.ndarray] = None,
+):
+    """
+    Identify animals in a later image of a burst, starting from the rectangles found in the
+    previous image.
+
+    Only the candidate positions within ENV.tracking_margin of the previous rectangles are
+    grown. The positions away from them act as a cheap check for changes elsewhere in the
+    image: if there are more than ENV.tracking_new_seeds of them, the whole image is searched
+    with animal_finder. The whole image is also searched if there were no previous rectangles,
+    or if the search near them finds nothing (the track is lost). A new animal giving no more
+    than ENV.tracking_new_seeds positions may therefore be missed until the next full search,
+    so set this to 0 to search the whole image whenever anything has changed elsewhere.
+
+    Args:
+        image (np.ndarray): The image in which to detect animals.
+        background_image (np.ndarray): The background image
+        is_daytime (bool): Whether or not this image was a daytime image
+        previous_boxes (List[Box]): The rectangles found in the previous image of the burst
+        seed_positions (Optional[np.ndarray]): Candidate positions already found for this image
+            (e.g. by animal_inner_batch). If not given, they are found with animal_inner.
+        roi (Optional[RegionOfInterest]): The region to search, if not the whole image.
+        volatility (Optional[np.ndarray]): The volatility of each pixel over the background
+            window, from make_background_window.
+    Returns:
+        tuple: Pruned lists of left, right, bottom, and top coordinates for bounding rectangles.
+    """
+    if seed_positions is None:
+        seed_positions, _ = animal_inner(
+            image, background_image, is_daytime, roi, volatility
+        )
+
+    margin = ENV.tracking_margin
+    near_boxes = np.zeros(len(seed_positions), dtype=bool)
+    for left, right, bottom, top in previous_boxes:
+        near_boxes |= (
+            (seed_positions[:, 0] >= left - margin)
+            & (seed_positions[:, 0] <= right + margin)
+            & (seed_positions[:, 1] >= bottom - margin)
+            & (seed_positions[:, 1] <= top + margin)
+        )
+
+    if previous_boxes and np.count_nonzero(~near_boxes) <= ENV.tracking_new_seeds:
+        lefts, rights, bottoms, tops = animal_finder(
+            image,
+            background_image,
+            is_daytime,
+            seed_positions[near_boxes],
+            roi,
+            volatility,
+        )
+        if lefts:
+            return lefts, rights, bottoms, tops
+
+    # There is nothing to track, something has changed elsewhere in the image, or tracking
+    # was lost
+    return animal_finder(
+        image, background_image, is_daytime, seed_positions, roi, volatility
+    )
+
+
+def normalise_to_background(
+    image: np.ndarray,
+    background_image: np.ndarray,
+    roi: Optional[RegionOfInterest] = None,
+) -> np.ndarray:
+    """
+    Match the brightness and contrast of an image to its background, with a gain and offset
+    for each channel fitted to their quartiles.
+
+    This undoes global lighting changes (e.g. a cloud, or the flash turning on), which
+    otherwise make almost every pixel differ from the background.
+
+    Args:
+        image (np.ndarray): The image
+        background_image (np.ndarray): The background image
+        roi (Optional[RegionOfInterest]): The region to search, if not the whole image. Only
+            pixels inside it are used to fit the gain and offset.
+
+    Returns:
+        np.ndarray: The normalised image
+    """
+    # Fit the gain and offset to a grid of about 10000 pixels
+    stride = max(1, int(np.sqrt(image.shape[0] * image.shape[1] / 10000)))
+    image_pixels = image[::stride, ::stride]
+    background_pixels = background_image[::stride, ::stride]
+    if roi is not None:
+        included = roi.mask[::stride, ::stride]
+        image_pixels, background_pixels = (
+            image_pixels[included],
+            background_pixels[included],
+        )
+    if image_pixels.size == 0:
+        return image
+
+    # Quartiles rather than the mean and spread, so that an animal does not skew the fit
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    image_lower, image_median, image_upper = np.percentile(
+        image_pixels.reshape(-1, channels), [25, 50, 75], axis=0
+    )
+    background_lower, background_median, background_upper = np.percentile(
+        background_pixels.reshape(-1, channels), [25, 50, 75], axis=0
+    )
+    image_spread = image_upper - image_lower
+    background_spread = background_upper - background_lower
+    # Flat scenes have no spread to compare, so only their brightness is matched
+    gain = np.where(
+        np.minimum(image_spread, background_spread) >= 8,
+        background_spread / np.maximum(image_spread, 1),
+        background_median / np.maximum(image_median, 1),
+    )
+    gain = np.clip(gain, 0.25, 4)
+    offset = background_median - gain * image_median
+    if image.ndim == 2:
+        gain, offset = gain[0], offset[0]
+    return np.clip(image * gain + offset, 0, 255).astype(np.uint8)
+
+
+def is_saturated(seed_positions: np.ndarray) -> bool:
+    """
+    Test whether so many candidate positions were found that the whole image has changed.
+
+    Args:
+        seed_positions (np.ndarray): The candidate positions, from animal_inner
+
+    Returns:
+        bool: True if more than ENV.global_change_fraction of the samples were candidates
+    """
+    return len(seed_positions) > ENV.global_change_fraction * ENV.sample_size
+
+
+def guard_global_change(
+    image: np.ndarray,
+    background_image: np.ndarray,
+    is_daytime: bool,
+    seed_positions: Optional[np.ndarray] = None,
+    roi: Optional[RegionOfInterest] = None,
+    volatility: Optional[np.ndarray] = None,
+) -> Tuple[np.ndarray, np.ndarray, bool]:
+    """
+    Check an image for a global change (e.g. a lighting change or the camera being bumped)
+    before it is searched.
+
+    Searching from thousands of candidate positions would take minutes, so if the image is
+    saturated (see is_saturated) it is first normalised to the background. If it is still
+    saturated, the candidate positions are thinned to ENV.global_change_max_seeds, and the
+    search should then be limited to ENV.global_change_max_walk steps.
+
+    Args:
+        image (np.ndarray): The image
+        background_image (np.ndarray): The background image
+        is_daytime (bool): Whether or not this image was a daytime image
+        seed_positions (Optional[np.ndarray]): Candidate positions already found for this image
+            (e.g. by animal_inner_batch). If not given, they are found with animal_inner.
+        roi (Optional[RegionOfInterest]): The region to search, if not the whole image.
+        volatility (Optional[np.ndarray]): The volatility of each pixel over the background
+            window, from make_background_window.
+
+    Returns:
+        np.ndarray: The image to search (normalised if it was saturated)
+        np.ndarray: The candidate positions to search from
+        bool: Whether the image has changed globally
+    """
+    if seed_positions is None:
+        seed_positions, _ = animal_inner(
+            image, background_image, is_daytime, roi, volatility
+        )
+    if not is_saturated(seed_positions):
+        return image, seed_positions, False
+
+    normalised_image = normalise_to_background(image, background_image, roi)
+    seed_positions, _ = animal_inner(
+        normalised_image, background_image, is_daytime, roi, volatility
+    )
+    if not is_saturated(seed_positions):
+        return normalised_image, seed_positions, False
+
+    if len(seed_positions) > ENV.global_change_max_seeds:
+        kept = np.linspace(
+            0, len(seed_positions) - 1, ENV.global_change_max_seeds
+        ).astype(int)
+        seed_positions = seed_positions[kept]
+    return normalised_image, seed_positions, True
+
+
+def measure_contours(
+    image: np.ndarray,
+    background_image: np.ndarray,
+    is_daytime: bool,
+    lefts: List[int],
+    rights: List[int],
+    bottoms: List[int],
+    tops: List[int],
+    roi: Optional[RegionOfInterest] = None,
+) -> np.ndarray:
+    """
+    Measure the bounding rectangles found by animal_finder.
+
+    Every rectangle is measured, whatever the current thresholds, so that the thresholds can be
+    changed later without detecting the rectangles again (see score_contours).
+
+    Args:
+        image (np.ndarray): The image
+        background_image (np.ndarray): The background image
+        is_daytime (bool): Whether or not this image was a daytime image
+        lefts (List[int]): The left coordinates of the rectangles
+        rights (List[int]): The right coordinates of the rectangles
+        bottoms (List[int]): The bottom coordinates of the rectangles
+        tops (List[int]): The top coordinates of the rectangles
+        roi (Optional[RegionOfInterest]): The region to search, if not the whole image. Samples
+            outside it are not counted as disturbed or secondary colour pixels.
+
+    Returns:
+        np.ndarray: The rectangles and their measurements, with dtype CANDIDATE_DTYPE
+    """
+    background_tol = ENV.background_tol_day if is_daytime else ENV.background_tol_night
+    single_channel = background_image.ndim == 2
+    colour_lower, colour_upper = channel_bounds(
+        ENV.colour_lower, ENV.colour_upper, single_channel
+    )
+    secondary_lower, secondary_upper = channel_bounds(
+        ENV.secondary_color_lower, ENV.secondary_color_upper, single_channel
+    )
+    candidates = np.zeros(len(lefts), dtype=CANDIDATE_DTYPE)
+    candidates["is_daytime"] = is_daytime
+    # Measure contours
+    for i in range(len(lefts)):
+        region_width = rights[i] - lefts[i]
+        region_height = tops[i] - bottoms[i]
+
+        # Generate random sample positions using numpy
+        x_samples = np.random.randint(lefts[i], rights[i], size=ENV.pixel_samples)
+        y_samples = np.random.randint(bottoms[i], tops[i], size=ENV.pixel_samples)
+
+        # Extract image and background samples using vectorized operations
+        image_samples = with_channels(image[x_samples, y_samples], single_channel)
+        background_samples = with_channels(
+            background_image[x_samples, y_samples], single_channel
+        )
+
+        # Calculate the pixel differences in a vectorized manner
+        pixel_diffs = np.abs(image_samples.astype(int) - background_samples.astype(int))
+        curr_dists = np.max(pixel_diffs, axis=1)  # Get max diff per pixel
+
+        # Check if any pixel meets the conditions
+        valid_pixels = np.all(
+            image_samples.astype(float) > colour_lower, axis=1
+        ) & np.all(image_samples.astype(float) < colour_upper, axis=1)
+
+        if roi is not None:
+            valid_pixels &= roi.mask[x_samples, y_samples]
+
+        # Calculate the number of valid pixels
+        valid_pixel_count = np.sum((curr_dists > background_tol) & valid_pixels)
+
+        # Check for black pixels
+        secondary_colour_samples = np.all(
+            image_samples.astype(float) < secondary_upper,
+            axis=1,
+        ) & np.all(
+            image_samples.astype(float) > secondary_lower,
+            axis=1,
+        )
+        if roi is not None:
+            secondary_colour_samples &= roi.mask[x_samples, y_samples]
+        secondary_colour_pixels = np.sum(secondary_colour_samples)
+
+        candidates[i]["left"] = lefts[i]
+        candidates[i]["right"] = rights[i]
+        candidates[i]["bottom"] = bottoms[i]
+        candidates[i]["top"] = tops[i]
+        candidates[i]["area"] = region_width * region_height
+        candidates[i]["disturbance"] = valid_pixel_count / ENV.pixel_samples
+        candidates[i]["secondary_colour"] = secondary_colour_pixels / ENV.pixel_samples
+
+    return candidates
+
+
+def score_contours(candidates: np.ndarray) -> np.ndarray:
+    """
+    Test measured rectangles against the current thresholds, keeping those that are large
+    enough and (if ENV.count_pixels is set) contain enough disturbed and secondary colour pixels.
+
+    Args:
+        candidates (np.ndarray): The rectangles and their measurements, from measure_contours
+
+    Returns:
+        np.ndarray: Whether each rectangle is accepted
+    """
+    size_tol = np.where(candidates["is_daytime"], ENV.size_tol_day, ENV.size_tol_night)
+    accepted = candidates["area"] > size_tol
+    if ENV.count_pixels == 1:
+        accepted &= (candidates["disturbance"] > ENV.disturbance_tol) & (
+            candidates["secondary_colour"] > ENV.secondary_colour_tol
+        )
+    return accepted
+
+
+def candidate_boxes(candidates: np.ndarray) -> List[Box]:
+    """
+    Get the rectangles of measured candidates as boxes.
+
+    Args:
+        candidates (np.ndarray): The rectangles and their measurements, from measure_contours
+
+    Returns:
+        List[Box]: The rectangles, as (left, right, bottom, top)
+    """
+    return [
+        (
+            int(candidate["left"]),
+            int(candidate["right"]),
+            int(candidate["bottom"]),
+            int(candidate["top"]),
+        )
+        for candidate in candidates
+    ]
+
+
+def sample_tolerances(
+    is_daytime: bool,
+    volatility: Optional[np.ndarray],
+    y_samples: np.ndarray,
+    x_samples: np.ndarray,
+) -> Union[float, np.ndarray]:
+    """
+    Get the background tolerance of sampled pixels.
+
+    Args:
+        is_daytime (bool): Whether or not the image is a daytime image
+        volatility (Optional[np.ndarray]): The volatility of each pixel over the background
+            window, if known
+        y_samples (np.ndarray): The rows of the samples
+        x_samples (np.ndarray): The columns of the samples
+
+    Returns:
+        Union[float,np.ndarray]: The tolerance, or the tolerance of each sample if it varies
+    """
+    background_tolerance = (
+        ENV.background_tol_day if is_daytime else ENV.background_tol_night
+    )
+    if volatility is None or ENV.volatility_weight <= 0:
+        return background_tolerance
+    return (
+        background_tolerance + ENV.volatility_weight * volatility[y_samples, x_samples]
+    )
+
+
 def animal_inner(
-    image: np.ndarray, background_image: np.ndarray, is_daytime: bool
+    image: np.ndarray,
+    background_image: np.ndarray,
+    is_daytime: bool,
+    roi: Optional[RegionOfInterest] = None,
+    volatility: Optional[np.ndarray] = None,
 ) -> Tuple[np.ndarray, int]:
     """
     Identify potential animal positions in an image by comparing sampled pixels with a background image.
@@ -134,21 +674,35 @@ def animal_inner(
         image (np.ndarray): The input image to analyze.
         background_image (np.ndarray): Background reference image for comparison.
         is_daytime (bool): Flag indicating whether it's daytime, which affects tolerance values.
+        roi (Optional[RegionOfInterest]): The region to sample, if not the whole image.
+        volatility (Optional[np.ndarray]): The volatility of each pixel over the background
+            window, which raises the tolerance of noisy pixels (see ENV.volatility_weight).
 
     Returns:
         tuple: Array of identified positions and the count of potential animals.
     """
-    background_tolerance = (
-        ENV.background_tol_day if is_daytime else ENV.background_tol_night
-    )
     image_shape = image.shape
+    single_channel = background_image.ndim == 2
+    colour_lower, colour_upper = channel_bounds(
+        ENV.colour_lower, ENV.colour_upper, single_channel
+    )
 
-    x_samples = np.random.randint(0, image_shape[1] - 1, size=ENV.sample_size)
-    y_samples = np.random.randint(0, image_shape[0] - 1, size=ENV.sample_size)
+    if roi is None:
+        x_samples = np.random.randint(0, image_shape[1] - 1, size=ENV.sample_size)
+        y_samples = np.random.randint(0, image_shape[0] - 1, size=ENV.sample_size)
+    else:
+        y_samples, x_samples = roi.sample(ENV.sample_size)
 
-    image_samples = image[y_samples, x_samples].astype(int)
-    background_samples = background_image[y_samples, x_samples].astype(int)
+    image_samples = with_channels(
+        image[y_samples, x_samples].astype(int), single_channel
+    )
+    background_samples = with_channels(
+        background_image[y_samples, x_samples].astype(int), single_channel
+    )
     diff_samples = np.abs(background_samples - image_samples).astype(int)
+    background_tolerance = sample_tolerances(
+        is_daytime, volatility, y_samples, x_samples
+    )
 
     valid_samples = (
         (
@@ -156,8 +710,8 @@ def animal_inner(
             < ENV.greyscale_parameter
         )
         & (np.max(diff_samples, axis=1) > background_tolerance)
-        & (np.sum(image_samples < ENV.colour_upper, axis=1) == 3)
-        & (np.sum(image_samples > ENV.colour_lower, axis=1) == 3)
+        & np.all(image_samples < colour_upper, axis=1)
+        & np.all(image_samples > colour_lower, axis=1)
     )
 
     positions = np.zeros((len(x_samples[valid_samples]), 2))
@@ -168,11 +722,88 @@ def animal_inner(
     return positions, animal_count
 
 
+def animal_inner_batch(
+    frame_stack: np.ndarray,
+    background_image: np.ndarray,
+    is_daytime: bool,
+    roi: Optional[RegionOfInterest] = None,
+    volatility: Optional[np.ndarray] = None,
+) -> List[np.ndarray]:
+    """
+    Identify potential animal positions in every image of a background window at once.
+
+    This applies the same tests as animal_inner, but samples and tests the pixels of the whole
+    (N,H,W,3) window stack in single vectorised operations.
+
+    Args:
+        frame_stack (np.ndarray): The (N,H,W,3) (or (N,H,W) single channel) stack of images
+            sharing the background.
+        background_image (np.ndarray): Background reference image for comparison.
+        is_daytime (bool): Flag indicating whether it's daytime, which affects tolerance values.
+        roi (Optional[RegionOfInterest]): The region to sample, if not the whole image.
+        volatility (Optional[np.ndarray]): The volatility of each pixel over the background
+            window, which raises the tolerance of noisy pixels (see ENV.volatility_weight).
+
+    Returns:
+        List[np.ndarray]: The array of identified positions for each image.
+    """
+    frame_count = frame_stack.shape[0]
+    image_shape = frame_stack.shape[1:]
+    single_channel = background_image.ndim == 2
+    colour_lower, colour_upper = channel_bounds(
+        ENV.colour_lower, ENV.colour_upper, single_channel
+    )
+
+    if roi is None:
+        x_samples = np.random.randint(
+            0, image_shape[1] - 1, size=(frame_count, ENV.sample_size)
+        )
+        y_samples = np.random.randint(
+            0, image_shape[0] - 1, size=(frame_count, ENV.sample_size)
+        )
+    else:
+        y_samples, x_samples = roi.sample((frame_count, ENV.sample_size))
+    frame_indices = np.arange(frame_count)[:, np.newaxis]
+
+    image_samples = with_channels(
+        frame_stack[frame_indices, y_samples, x_samples].astype(int), single_channel
+    )
+    background_samples = with_channels(
+        background_image[y_samples, x_samples].astype(int), single_channel
+    )
+    diff_samples = np.abs(background_samples - image_samples)
+    background_tolerance = sample_tolerances(
+        is_daytime, volatility, y_samples, x_samples
+    )
+
+    valid_samples = (
+        (
+            np.max(image_samples, axis=2) - np.min(image_samples, axis=2)
+            < ENV.greyscale_parameter
+        )
+        & (np.max(diff_samples, axis=2) > background_tolerance)
+        & np.all(image_samples < colour_upper, axis=2)
+        & np.all(image_samples > colour_lower, axis=2)
+    )
+
+    frame_positions = []
+    for frame_index in range(frame_count):
+        valid = valid_samples[frame_index]
+        positions = np.zeros((np.count_nonzero(valid), 2))
+        positions[:, 1] = x_samples[frame_index, valid]
+        positions[:, 0] = y_samples[frame_index, valid]
+        frame_positions.append(positions)
+
+    return frame_positions
+
+
 def bounce(
     image: np.ndarray,
     background_image: np.ndarray,
     is_daytime: bool,
     position: np.ndarray,
+    walk_memo: Optional[WalkMemo] = None,
+    limits: Optional[WalkLimits] = None,
 ) -> Tuple[int, int, int, int]:
     """
     Calculate the bounding coordinates of an object as it "bounces" within an image.
@@ -186,6 +817,8 @@ def bounce(
         background_image (np.ndarray): The background image for comparison.
         is_daytime (bool): Flag indicating if daytime background tolerance should be used.
         position (np.ndarray): Initial position of the object as a 2D array.
+        walk_memo (Optional[WalkMemo]): End points of walks already made in this image.
+        limits (Optional[WalkLimits]): The limits on walks in this image, from walk_limits.
 
     Returns:
         Tuple[float, float, float, float]: Bounding coordinates in the order (left, right, top, bottom).
@@ -203,6 +836,8 @@ def bounce(
             is_daytime,
             np.array([0.0, 1.0]),
             position,
+            walk_memo,
+            limits,
         )
         if movement == 0:
             position, movement = directional_walk(
@@ -211,6 +846,8 @@ def bounce(
                 is_daytime,
                 np.array([-1.0, 1.0]),
                 position,
+                walk_memo,
+                limits,
             )
             if movement == 0:
                 position, movement = directional_walk(
@@ -219,6 +856,8 @@ def bounce(
                     is_daytime,
                     np.array([1.0, 1.0]),
                     position,
+                    walk_memo,
+                    limits,
                 )
         top_bound = max(position[1], top_bound)
         left_bound = min(position[0], left_bound)
@@ -235,6 +874,8 @@ def bounce(
             is_daytime,
             np.array([0.0, -1.0]),
             position,
+            walk_memo,
+            limits,
         )
         if movement == 0:
             position, movement = directional_walk(
@@ -243,6 +884,8 @@ def bounce(
                 is_daytime,
                 np.array([1.0, -1.0]),
                 position,
+                walk_memo,
+                limits,
             )
             if movement == 0:
                 position, movement = directional_walk(
@@ -251,6 +894,8 @@ def bounce(
                     is_daytime,
                     np.array([-1.0, -1.0]),
                     position,
+                    walk_memo,
+                    limits,
                 )
         bottom_bound = min(position[1], bottom_bound)
         left_bound = min(position[0], left_bound)
@@ -267,6 +912,8 @@ def bounce(
             is_daytime,
             np.array([-1.0, 0.0]),
             position,
+            walk_memo,
+            limits,
         )
         if movement == 0:
             position, movement = directional_walk(
@@ -275,6 +922,8 @@ def bounce(
                 is_daytime,
                 np.array([-1.0, -1.0]),
                 position,
+                walk_memo,
+                limits,
             )
             if movement == 0:
                 position, movement = directional_walk(
@@ -283,6 +932,8 @@ def bounce(
                     is_daytime,
                     np.array([-1.0, 1.0]),
                     position,
+                    walk_memo,
+                    limits,
                 )
         top_bound = max(position[1], top_bound)
         left_bound = min(position[0], left_bound)
@@ -299,6 +950,8 @@ def bounce(
             is_daytime,
             np.array([1.0, 0.0]),
             position,
+            walk_memo,
+            limits,
         )
         if movement == 0:
             position, movement = directional_walk(
@@ -307,6 +960,8 @@ def bounce(
                 is_daytime,
                 np.array([1.0, -1.0]),
                 position,
+                walk_memo,
+                limits,
             )
             if movement == 0:
                 position, movement = directional_walk(
@@ -315,6 +970,8 @@ def bounce(
                     is_daytime,
                     np.array([1.0, 1.0]),
                     position,
+                    walk_memo,
+                    limits,
                 )
         top_bound = max(position[1], top_bound)
         right_bound = max(position[0], right_bound)
@@ -368,6 +1025,8 @@ def directional_walk(
     is_daytime: bool,
     direction: np.ndarray,
     start_position: np.ndarray,
+    walk_memo: Optional[WalkMemo] = None,
+    limits: Optional[WalkLimits] = None,
 ) -> Tuple[np.ndarray, int]:
     """
     Move an object in a specified direction within an image, checking for changes
@@ -383,6 +1042,12 @@ def directional_walk(
         is_daytime (bool): Flag indicating if daytime background tolerance should be used.
         direction (np.ndarray): The direction vector for movement.
         start_position (np.ndarray): The starting position of the object in the image.
+        walk_memo (Optional[WalkMemo]): End points of walks already made in this image. A walk
+            that reaches a position recorded for this direction jumps straight to its end point,
+            and every position passed through is recorded, unless the step budget ran out.
+        limits (Optional[WalkLimits]): The limits on walks in this image, from walk_limits
+            (computed here if not given). Walks stop at the edge of the region of interest,
+            or once the step budget is used up.
 
     Returns:
         Tuple[np.ndarray, int]: The final position after movement and a movement status flag (1 if moved, 0 if no movement).
@@ -394,7 +1059,35 @@ def directional_walk(
     old_x_pos, old_y_pos = start_position[0], start_position[1]
     image_shape = image.shape
 
+    if limits is None:
+        limits = walk_limits(image, is_daytime)
+    roi_mask, tolerance_map = limits.roi_mask, limits.tolerance_map
+    step_budget = limits.step_budget
+
+    single_channel = image.ndim == 2
+    if single_channel:
+        grey_lower, grey_upper = limits.grey_bounds
+
+    walked_keys = []
+    budget_stopped = False
+
     while True:
+        if step_budget is not None and step_budget[0] <= 0:
+            budget_stopped = True
+            break
+
+        if walk_memo is not None:
+            walk_key = (
+                int(direction[0]),
+                int(direction[1]),
+                int(start_position[0]),
+                int(start_position[1]),
+            )
+            if walk_key in walk_memo:
+                start_position[0], start_position[1] = walk_memo[walk_key]
+                break
+            walked_keys.append(walk_key)
+
         move = 0
         valid_move = 0
 
@@ -403,6 +1096,16 @@ def directional_walk(
             if 0 < start_position[1] + direction[1] * 5 < image_shape[1]:
                 valid_move = 1
 
+        if (
+            valid_move == 1
+            and roi_mask is not None
+            and not roi_mask[
+                int(start_position[0] + direction[0]),
+                int(start_position[1] + direction[1]),
+            ]
+        ):
+            valid_move = 0
+
         if valid_move == 1:
             # Get pixel values at the new position
             image_sample = image[
@@ -413,34 +1116,57 @@ def directional_walk(
                 int(start_position[0] + direction[0]),
                 int(start_position[1] + direction[1]),
             ]
+            if tolerance_map is not None:
+                background_tolerance = tolerance_map[
+                    int(start_position[0] + direction[0]),
+                    int(start_position[1] + direction[1]),
+                ]
 
-            # Check if the image sample is within the expected color range
-            color_test = np.sum(image_sample > ENV.colour_lower) + np.sum(
-                image_sample < ENV.colour_upper
-            )
+            if single_channel:
+                grey_value = int(image_sample)
+                changed = (
+                    grey_lower < grey_value < grey_upper
+                    and abs(int(background_image_sample) - grey_value)
+                    > background_tolerance
+                )
+            else:
+                # Check if the image sample is within the expected color range
+                color_test = np.sum(image_sample > ENV.colour_lower) + np.sum(
+                    image_sample < ENV.colour_upper
+                )
 
-            if (
-                int(np.max(image_sample)) - int(np.min(image_sample))
-                < ENV.greyscale_parameter
-                and color_test == 6
-            ):
-                max_diff = 0
-                for k in range(3):
-                    max_diff = max(
-                        abs(int(background_image_sample[k]) - int(image_sample[k])),
-                        max_diff,
-                    )
+                changed = False
+                if (
+                    int(np.max(image_sample)) - int(np.min(image_sample))
+                    < ENV.greyscale_parameter
+                    and color_test == 6
+                ):
+                    max_diff = 0
+                    for k in range(3):
+                        max_diff = max(
+                            abs(int(background_image_sample[k]) - int(image_sample[k])),
+                            max_diff,
+                        )
+                    changed = max_diff > background_tolerance
 
-                if max_diff > background_tolerance:
-                    # Update position if there is significant change
-                    for n in range(len(start_position)):
-                        start_position[n] += direction[n]
-                    move = 1
+            if changed:
+                # Update position if there is significant change
+                for n in range(len(start_position)):
+                    start_position[n] += direction[n]
+                move = 1
+                if step_budget is not None:
+                    step_budget[0] -= 1
 
         # Stop if no valid movement is detected
         if move == 0:
             break
 
+    # A walk cut short by the step budget did not reach its true end point
+    if walk_memo is not None and not budget_stopped:
+        end_position = (start_position[0], start_position[1])
+        for walk_key in walked_keys:
+            walk_memo[walk_key] = end_position
+
     # Check if movement occurred
     movement_status = 1
     if old_x_pos == start_position[0] and old_y_pos == start_position[1]:
@@ -0,0 +1,178 @@
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from .config import EnvSettings
+from .storage import get_storage
+
+ENV = EnvSettings()
+
+
+@dataclass
+class ResourcePlan:
+    """
+    Limits chosen to keep a run within its memory budget.
+    """
+
+    # The maximum number of images in each background window
+    window_length: int
+
+    # The maximum number of decoded images queued for export
+    frames_in_flight: int
+
+    # The number of folders to process at the same time
+    workers: int
+
+    # The estimated peak memory of each worker in bytes
+    worker_bytes: int
+
+
+def memory_budget_bytes() -> Optional[int]:
+    """
+    Get the memory budget for the whole run.
+
+    Returns:
+        Optional[int]: ENV.memory_budget_mb in bytes, or half of the physical memory if that is
+            not set, or None if neither is known
+    """
+    if ENV.memory_budget_mb is not None:
+        return int(ENV.memory_budget_mb * 1024**2)
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def background_frames() -> int:
+    """
+    Get the memory used to find the background, in decoded images.
+
+    The float64 background takes 8 bytes per value, and the quartiles found alongside it for
+    the volatility map (see ENV.volatility_weight) take another 16.
+
+    Returns:
+        int: The memory used, as a number of decoded images
+    """
+    return 24 if ENV.volatility_weight > 0 else 8
+
+
+def estimate_worker_bytes(
+    image_shape: Tuple[int, ...], window_length: int, frames_in_flight: int
+) -> int:
+    """
+    Estimate the peak memory used to process one folder.
+
+    This counts the decoded window stack, the copy taken by np.median, the float64 background
+    (with any quartiles, see background_frames) and any decoded images waiting to be
+    exported.
+
+    Args:
+        image_shape (Tuple[int,...]): The shape of the decoded images
+        window_length (int): The number of images in each background window
+        frames_in_flight (int): The number of decoded images queued for export
+
+    Returns:
+        int: The estimated number of bytes
+    """
+    frame_bytes = 1
+    for dimension in image_shape:
+        frame_bytes *= int(dimension)
+    return frame_bytes * (2 * window_length + background_frames() + frames_in_flight)
+
+
+def plan_resources(
+    image_shape: Tuple[int, ...], workers: int = 1, verbose: bool = True
+) -> ResourcePlan:
+    """
+    Choose the window length, images in flight and number of workers that fit the memory budget.
+
+    The number of workers is reduced first, so that each worker can use full-length windows.
+    If a single worker still does not fit, its images in flight and then its window length
+    are capped to fit the budget.
+
+    Args:
+        image_shape (Tuple[int,...]): The shape of the decoded images
+        workers (int): The number of workers requested
+        verbose (bool): Whether to print the chosen limits
+
+    Returns:
+        ResourcePlan: The chosen limits
+    """
+    window_length = ENV.background_max_images
+    frames_in_flight = 2 * ENV.export_workers if ENV.save_images else 0
+    budget = memory_budget_bytes()
+
+    if budget is None:
+        return ResourcePlan(
+            window_length,
+            frames_in_flight,
+            workers,
+            estimate_worker_bytes(image_shape, window_length, frames_in_flight),
+        )
+
+    # Prefer fewer workers with full windows, then shorten the windows of a single worker
+    full_bytes = estimate_worker_bytes(image_shape, window_length, frames_in_flight)
+    workers = max(1, min(workers, budget // full_bytes))
+    worker_budget = budget // workers
+
+    fixed_frames = background_frames()
+    frame_bytes = estimate_worker_bytes(image_shape, 0, 0) // fixed_frames
+    shortest_window = min(ENV.min_background_used + 1, window_length)
+    spare_frames = worker_budget // frame_bytes - fixed_frames - 2 * shortest_window
+    frames_in_flight = min(
+        frames_in_flight, max(min(frames_in_flight, 1), spare_frames)
+    )
+    window_length = min(
+        window_length,
+        (worker_budget // frame_bytes - fixed_frames - frames_in_flight) // 2,
+    )
+    if window_length < shortest_window:
+        print(
+            f"Warning: The memory budget of {budget / 1024**2:.0f} MB is too small for images"
+            f" of shape {tuple(image_shape)}"
+        )
+        window_length = shortest_window
+
+    plan = ResourcePlan(
+        window_length,
+        frames_in_flight,
+        workers,
+        estimate_worker_bytes(image_shape, window_length, frames_in_flight),
+    )
+    if verbose:
+        print(
+            f"Memory budget {budget / 1024**2:.0f} MB for images of shape"
+            f" {tuple(image_shape)}: {plan.workers} worker(s), windows of up to"
+            f" {plan.window_length} images, {plan.frames_in_flight} image(s) queued for"
+            f" export, about {plan.worker_bytes / 1024**2:.0f} MB per worker"
+        )
+    return plan
+
+
+def probe_image_shape(image_path: str) -> Optional[Tuple[int, int, int]]:
+    """
+    Read the shape of an image from its header, without decoding it.
+
+    The shape is that of the image once decoded by load_image, so it is scaled if read
+    through the frame cache.
+
+    Args:
+        image_path (str): The path to the image
+
+    Returns:
+        Optional[Tuple[int,int,int]]: The (height, width, channels) of the decoded image
+    """
+    from PIL import Image
+
+    from .frame_cache import scaled_size
+
+    try:
+        with (
+            get_storage(image_path).read_header(image_path) as header,
+            Image.open(header) as image,
+        ):
+            width, height = image.size
+    except OSError:
+        return None
+    height, width = scaled_size(height, width)
+    return height, width, 3
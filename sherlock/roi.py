@@ -0,0 +1,129 @@
+import os
+from dataclasses import dataclass
+from fnmatch import fnmatch
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .config import EnvSettings
+from .storage import get_storage
+
+ENV = EnvSettings()
+
+
+@dataclass
+class RegionOfInterest:
+    """
+    The parts of a camera's images to search for animals.
+    """
+
+    # True where pixels are searched, with shape (H,W)
+    mask: np.ndarray
+
+    # The flat indices of the included pixels that may be sampled
+    sample_indices: np.ndarray
+
+    # The (rows, columns) of the tiles that contain included pixels
+    tiles: List[Tuple[slice, slice]]
+
+    def sample(self, size) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Draw random positions from the included pixels.
+
+        Args:
+            size: The number (or shape) of positions to draw
+
+        Returns:
+            np.ndarray: The rows of the positions
+            np.ndarray: The columns of the positions
+        """
+        if len(self.sample_indices) == 0:
+            empty = np.zeros(size, dtype=np.int64)
+            return empty, empty
+        flat_indices = self.sample_indices[
+            np.random.randint(0, len(self.sample_indices), size=size)
+        ]
+        return np.divmod(flat_indices, self.mask.shape[1])
+
+
+def make_region_of_interest(mask: np.ndarray) -> RegionOfInterest:
+    """
+    Make a region of interest from a mask.
+
+    Args:
+        mask (np.ndarray): True where pixels are searched, with shape (H,W)
+
+    Returns:
+        RegionOfInterest: The region of interest
+    """
+    mask = mask.astype(bool)
+    height, width = mask.shape
+
+    # As without a mask, the last row and column are never sampled
+    sampled = np.zeros_like(mask)
+    sampled[: height - 1, : width - 1] = mask[: height - 1, : width - 1]
+
+    tile_size = ENV.roi_tile_size
+    tiles = [
+        (slice(top, top + tile_size), slice(left, left + tile_size))
+        for top in range(0, height, tile_size)
+        for left in range(0, width, tile_size)
+        if mask[top : top + tile_size, left : left + tile_size].any()
+    ]
+    return RegionOfInterest(mask, np.flatnonzero(sampled), tiles)
+
+
+def load_region_of_interest(
+    folder_path: str, image_shape: Tuple[int, ...], scale: float = 1.0
+) -> Optional[RegionOfInterest]:
+    """
+    Load the region of interest for a folder of images.
+
+    The mask is read from the ENV.roi_mask_name image in the folder (white where pixels are
+    searched, black where they are not), if there is one. Any ENV.roi_polygons whose pattern
+    matches the folder are then excluded.
+
+    Args:
+        folder_path (str): The folder path
+        image_shape (Tuple[int,...]): The shape of the images in the folder, as decoded
+        scale (float): The scale of the decoded images relative to full resolution (see
+            frame_scale), as the polygons are given in full resolution pixels
+
+    Returns:
+        Optional[RegionOfInterest]: The region of interest, or None if the whole image is
+            searched
+    """
+    height, width = image_shape[:2]
+    mask = None
+
+    mask_path = f"{folder_path}/{ENV.roi_mask_name}"
+    storage = get_storage(mask_path)
+    if ENV.roi_mask_name and storage.is_file(mask_path):
+        mask_image = storage.decode_image(mask_path, cv2.IMREAD_GRAYSCALE)
+        if mask_image is None:
+            print(f"Warning: Could not read the mask {mask_path}")
+        else:
+            if mask_image.shape != (height, width):
+                mask_image = cv2.resize(
+                    mask_image, (width, height), interpolation=cv2.INTER_NEAREST
+                )
+            mask = mask_image > 127
+
+    name = os.path.basename(os.path.normpath(folder_path))
+    polygons = [
+        np.round(np.array(polygon, dtype=np.float64) * scale).astype(np.int32)
+        for pattern, folder_polygons in ENV.roi_polygons.items()
+        if fnmatch(name, pattern) or fnmatch(folder_path, pattern)
+        for polygon in folder_polygons
+    ]
+    if polygons:
+        if mask is None:
+            mask = np.ones((height, width), dtype=bool)
+        excluded = np.zeros((height, width), dtype=np.uint8)
+        cv2.fillPoly(excluded, polygons, 1)
+        mask &= excluded == 0
+
+    if mask is None or mask.all():
+        return None
+    return make_region_of_interest(mask)
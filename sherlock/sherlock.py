@@ -1,260 +1,553 @@
-import json
-import os
-from typing import Any, Dict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
 
-import cv2
-import numpy as np
-import pandas as pd
-
-from .background_image import make_background_image
+from .background_image import make_background_window
+from .candidates import load_candidates, save_candidates
 from .config import EnvSettings
-from .process_images import animal_finder
+from .crop_store import CropWriter
+from .dedup import WindowRecord, load_window, save_window, window_key
+from .export import PositiveExporter
+from .frame_cache import frame_scale, full_resolution_boxes
+from .leases import FolderLease
+from .process_images import (
+    Box,
+    animal_finder,
+    animal_inner_batch,
+    burst_finder,
+    candidate_boxes,
+    guard_global_change,
+    measure_contours,
+    score_contours,
+)
+from .resources import plan_resources
+from .roi import load_region_of_interest
+from .storage import get_storage
 from .utils import (
+    cached_datetime,
     create_summary_csv,
-    datetime_difference,
-    extract_datetime,
     find_max_image_path,
+    in_same_burst,
+    load_image,
+    mark_adjacent_images,
     set_image_shape,
 )
 
 ENV = EnvSettings()
 
 
-def process_folder(folder_path: str):
+@dataclass
+class FrameResult:
+    """
+    The result for an image, as recorded in the processed data.
+    """
+
+    # The image index and path
+    image_index: int
+    image_path: str
+
+    # "animal", "no animal" or "error"
+    status: str
+
+    # Why the image has its status (e.g. "contour found", "adjacent"), if processed
+    reason: Optional[str] = None
+
+    # The number of accepted contours
+    contours: int = 0
+
+    # Whether the image could not be searched normally, and so is counted as true
+    error: bool = False
+
+    # Whether the image was marked as positive for being taken close to a positive image
+    adjacency: bool = False
+
+    # The boxes of the accepted contours, in full resolution coordinates
+    boxes: List[Box] = field(default_factory=list)
+
+    # Whether this marks another image as adjacent to the image just processed, rather than
+    # being the result of processing it
+    update: bool = False
+
+
+def frame_result(
+    processed_data: Dict[str, Any],
+    folder_path: str,
+    image_index: int,
+    boxes: Optional[List[Box]] = None,
+    update: bool = False,
+) -> FrameResult:
+    """
+    Make the result for an image from its entry in the processed data.
+
+    Args:
+        processed_data (Dict[str,Any]): The processed data
+        folder_path (str): The folder path
+        image_index (int): The image index
+        boxes (Optional[List[Box]]): The boxes of the accepted contours, in full resolution
+            coordinates
+        update (bool): Whether this marks the image as adjacent to the image just processed
+
+    Returns:
+        FrameResult: The result
+    """
+    image_datum = processed_data["images"][str(image_index)]
+    return FrameResult(
+        image_index=image_index,
+        image_path=f"{folder_path}/{ENV.image_prefix}_{str(image_index).zfill(4)}.{ENV.image_suffix}",
+        status=image_datum["status"],
+        reason=image_datum.get("reason"),
+        contours=image_datum.get("contours", 0),
+        error=image_datum.get("error", False),
+        adjacency=image_datum.get("adjacency", False),
+        boxes=boxes or [],
+        update=update,
+    )
+
+
+def process_folder(
+    folder_path: str,
+    lease: Optional[FolderLease] = None,
+    start_index: int = 1,
+    resync_after: Optional[int] = None,
+    max_image: Optional[int] = None,
+    resume: bool = True,
+):
     """
     Process the images in a folder.
 
     Args:
         folder_path (str): The path to the folder
+        lease (Optional[FolderLease]): The lease held on the folder, if coordinating with
+            other processes. Results are not written once the lease has been lost.
+        start_index (int): The image to start processing from. This should be the first
+            image of a background window.
+        resync_after (Optional[int]): If given, stop once past this image at the first
+            background window that starts where a previously recorded window started, as
+            the results from there onwards are unchanged
+        max_image (Optional[int]): The highest image index, if already known. In this case
+            ENV.image_size must already be set for this folder.
+        resume (bool): Whether to carry on from where a previous run of the folder was
+            stopped (e.g. cancelled), if that is after start_index
+    """
+    for _ in iter_folder_results(
+        folder_path, lease, start_index, resync_after, max_image, resume
+    ):
+        pass
+
+
+def iter_folder_results(
+    folder_path: str,
+    lease: Optional[FolderLease] = None,
+    start_index: int = 1,
+    resync_after: Optional[int] = None,
+    max_image: Optional[int] = None,
+    resume: bool = True,
+) -> Iterator[FrameResult]:
+    """
+    Process the images in a folder, yielding the result for each image as soon as it is
+    decided.
+
+    The processed data, candidates and summary CSV are written as by process_folder, but
+    the folder is only marked as completed (and the candidates and summary written) once
+    every result has been consumed. If the iterator is closed part-way (or fails), the
+    exports and crops of the images processed so far are still finished and indexed, and the
+    next run of the folder resumes from the first background window that was not finished.
+    When a positive image marks the images taken close to it as adjacent, the result of each
+    of those images is yielded with update set.
+
+    Args:
+        folder_path (str): The path to the folder
+        lease (Optional[FolderLease]): The lease held on the folder, if coordinating with
+            other processes. Results are not written once the lease has been lost.
+        start_index (int): The image to start processing from. This should be the first
+            image of a background window.
+        resync_after (Optional[int]): If given, stop once past this image at the first
+            background window that starts where a previously recorded window started, as
+            the results from there onwards are unchanged
+        max_image (Optional[int]): The highest image index, if already known. In this case
+            ENV.image_size must already be set for this folder.
+        resume (bool): Whether to carry on from where a previous run of the folder was
+            stopped (e.g. cancelled), if that is after start_index
+
+    Yields:
+        FrameResult: The result for each image, in order
     """
-    # Find max image
-    max_image = find_max_image_path(folder_path)
-    print(max_image)
-    if not max_image:
-        return
+    if max_image is None:
+        # Find max image
+        max_image = find_max_image_path(folder_path)
+        print(max_image)
+        if not max_image:
+            return
 
-    # Set the shape
-    set_image_shape(folder_path, max_image)
+        # Set the shape
+        set_image_shape(folder_path, max_image)
 
     # Read the stored image data in this folder
+    storage = get_storage(folder_path)
     json_path = f"{folder_path}/processed_data_{ENV.run_code}.json"
-    if os.path.isfile(json_path):
-        processed_data: Dict[str, Any] = json.load(open(json_path, "r"))
+    if storage.is_file(json_path):
+        processed_data: Dict[str, Any] = storage.read_json(json_path)
     else:
         processed_data = {"completed": False, "images": {}}
 
-    image_index = 1
-    while image_index < max_image + 1:
-        if image_index in processed_data["images"]:
-            print(f"Skipping image {image_index} as it has been previously processed")
-            continue  # image already processed
-
-        if not os.path.isfile(
-            f"{folder_path}/{ENV.image_prefix}_{str(image_index).zfill(4)}.{ENV.image_suffix}"
-        ):
-            image_index += 1
-            print(f"Skipping image {image_index} as it was not found")
-            continue
-        background_image, background_end_index, is_daytime = make_background_image(
-            folder_path, image_index
+    # A run that was stopped part-way carries on from the first window it did not finish
+    if (
+        resume
+        and not processed_data["completed"]
+        and processed_data.get("resume_index", 1) > start_index
+    ):
+        start_index = processed_data["resume_index"]
+        print(f"Resuming folder {folder_path} from image {start_index}")
+
+    # Record the background windows, so that they can be rebuilt individually later
+    previous_windows = processed_data.get("windows", [])
+    previous_window_starts = {window[0] for window in previous_windows}
+    new_windows = []
+
+    # The datetime of each image, so that its metadata is only read once
+    date_times: Dict[str, str] = {}
+
+    # The content hash of each image, if reusing the results of identical windows
+    content_hashes: Dict[str, str] = {}
+
+    # Keep the measured candidates of images that are not processed again
+    folder_candidates = load_candidates(folder_path)
+
+    # The region of the images to search, if masked
+    roi = load_region_of_interest(folder_path, ENV.image_size, frame_scale())
+
+    # Limit the window length and images held for export to the memory budget
+    resource_plan = plan_resources(ENV.image_size)
+
+    # Positive images are written on background threads
+    exporter = None
+    if ENV.save_images:
+        exporter = PositiveExporter(
+            folder_path, max_in_flight=resource_plan.frames_in_flight
         )
-        used_images = background_end_index - image_index
-        while image_index < background_end_index:
-
-            if used_images < ENV.min_background_used:
-                processed_data["images"][str(image_index)] = {
-                    "status": "animal",
-                    "reason": "insufficient background images",
-                    "contours": 0,
-                    "error": True,
-                }
-                print(
-                    f"Skipping image {image_index} as insufficient background images (counting as true)"
-                )
+
+    # Crops of accepted boxes are written while the images are in memory
+    crop_writer = None
+    if ENV.crop_size:
+        if storage.is_local:
+            crop_writer = CropWriter(folder_path, start_index)
+        else:
+            print(f"Warning: Not writing crops for {folder_path} as it is not local")
+
+    # The exports and crops written so far are kept if the results are abandoned part-way
+    # (e.g. the iterator is closed), but the folder is only completed on a normal exit
+    finished = False
+    # The first image of the first window not yet finished
+    resume_index = start_index
+    try:
+        image_index = start_index
+        while image_index < max_image + 1:
+            if (
+                resync_after is not None
+                and image_index > resync_after
+                and image_index in previous_window_starts
+            ):
+                break
+
+            if not storage.is_file(
+                f"{folder_path}/{ENV.image_prefix}_{str(image_index).zfill(4)}.{ENV.image_suffix}"
+            ):
                 image_index += 1
+                print(f"Skipping image {image_index} as it was not found")
                 continue
+            # An identical window (e.g. in a copied folder) is not processed again
+            key = None
+            reused_window: Optional[WindowRecord] = None
+            if ENV.dedup_directory:
+                key = window_key(
+                    folder_path,
+                    image_index,
+                    resource_plan.window_length,
+                    roi,
+                    content_hashes,
+                )
+                reused_window = load_window(key)
+            if reused_window is not None:
+                print(
+                    f"Reusing the results of an identical window from image {image_index}"
+                )
+                background_image = is_daytime = frame_stack = volatility = None
+                background_end_index = image_index + reused_window.length
             else:
-                image_path = f"{folder_path}/{ENV.image_prefix}_{str(image_index).zfill(4)}.{ENV.image_suffix}"
-                image = cv2.imread(image_path)
+                (
+                    background_image,
+                    background_end_index,
+                    is_daytime,
+                    frame_stack,
+                    volatility,
+                ) = make_background_window(
+                    folder_path, image_index, resource_plan.window_length, roi
+                )
+            window_start = image_index
+            # Record the results of a new window, unless it had images that could not be read
+            new_window = None
+            if (
+                key is not None
+                and reused_window is None
+                and background_image is not None
+            ):
+                new_window = WindowRecord(background_end_index - window_start)
+            # Images of another shape (e.g. a different camera setting) are searched in full
+            window_roi = roi
+            if (
+                roi is not None
+                and background_image is not None
+                and roi.mask.shape != background_image.shape[:2]
+            ):
+                window_roi = None
+            # The boxes found in the previous image, while tracking them through a burst
+            burst_boxes: Optional[List[Box]] = None
+            previous_date_time = ""
+            stacked_images = 0 if frame_stack is None else len(frame_stack)
+            new_windows.append([image_index, background_end_index])
+            processed_data["windows"] = sorted(
+                [window for window in previous_windows if window[0] < start_index]
+                + new_windows
+                + [
+                    window
+                    for window in previous_windows
+                    if window[0] >= background_end_index
+                ]
+            )
+            used_images = background_end_index - image_index
 
-                if image is None or background_image is None:
-                    # Error processing image
-                    if image_index in processed_data["images"]:
-                        processed_data["images"][str(image_index)]["error"] = False
-                    else:
-                        processed_data["images"][str(image_index)] = {
-                            "status": "error",
-                            "error": True,
-                            "contours": 0,
-                        }
+            # Find the candidate positions for the whole window at once
+            window_seeds = None
+            if background_image is not None and used_images >= ENV.min_background_used:
+                window_seeds = animal_inner_batch(
+                    frame_stack, background_image, is_daytime, window_roi, volatility
+                )
+            while image_index < background_end_index:
+
+                if used_images < ENV.min_background_used:
+                    folder_candidates.pop(image_index, None)
+                    if crop_writer is not None:
+                        crop_writer.remove(image_index)
+                    processed_data["images"][str(image_index)] = {
+                        "status": "animal",
+                        "reason": "insufficient background images",
+                        "contours": 0,
+                        "error": True,
+                    }
+                    print(
+                        f"Skipping image {image_index} as insufficient background images (counting as true)"
+                    )
+                    yield frame_result(processed_data, folder_path, image_index)
                     image_index += 1
                     continue
-                image_static = image.copy()
-                date_time = extract_datetime(image_path)
-                lefts, rights, bottoms, tops = animal_finder(
-                    image, background_image, is_daytime
-                )
-                size_tol = ENV.size_tol_day if is_daytime else ENV.size_tol_night
-                background_tol = (
-                    ENV.background_tol_day if is_daytime else ENV.background_tol_night
-                )
-                # Initialise animal found
-                contours_found = 0
-                # Test contours
-                for i in range(len(lefts)):
-                    region_width = rights[i] - lefts[i]
-                    region_height = tops[i] - bottoms[i]
-
-                    if region_width * region_height > size_tol:
-                        if ENV.count_pixels == 1:
-
-                            # Generate random sample positions using numpy
-                            x_samples = np.random.randint(
-                                lefts[i], rights[i], size=ENV.pixel_samples
-                            )
-                            y_samples = np.random.randint(
-                                bottoms[i], tops[i], size=ENV.pixel_samples
+                else:
+                    image_path = f"{folder_path}/{ENV.image_prefix}_{str(image_index).zfill(4)}.{ENV.image_suffix}"
+                    reused_frame = None
+                    if reused_window is not None:
+                        image = None
+                        reused_frame = reused_window.frames.get(
+                            image_index - window_start
+                        )
+                        failed = reused_frame is None
+                    else:
+                        if image_index - window_start < stacked_images:
+                            image = frame_stack[image_index - window_start]
+                        else:
+                            image = load_image(
+                                image_path,
+                                single_channel=background_image is not None
+                                and background_image.ndim == 2,
                             )
+                        failed = image is None or background_image is None
 
-                            # Extract image and background samples using vectorized operations
-                            image_samples = image[x_samples, y_samples, :]
-                            background_samples = background_image[
-                                x_samples, y_samples, :
-                            ]
-
-                            # Calculate the pixel differences in a vectorized manner
-                            pixel_diffs = np.abs(
-                                image_samples.astype(int)
-                                - background_samples.astype(int)
-                            )
-                            curr_dists = np.max(
-                                pixel_diffs, axis=1
-                            )  # Get max diff per pixel
-
-                            # Check if any pixel meets the conditions
-                            valid_pixels = np.all(
-                                image_samples.astype(float) > ENV.colour_lower, axis=1
-                            ) & np.all(
-                                image_samples.astype(float) < ENV.colour_upper, axis=1
+                    if failed:
+                        # Error processing image
+                        folder_candidates.pop(image_index, None)
+                        if crop_writer is not None:
+                            crop_writer.remove(image_index)
+                        burst_boxes = None
+                        new_window = None
+                        if image_index in processed_data["images"]:
+                            processed_data["images"][str(image_index)]["error"] = False
+                        else:
+                            processed_data["images"][str(image_index)] = {
+                                "status": "error",
+                                "error": True,
+                                "contours": 0,
+                            }
+                        yield frame_result(processed_data, folder_path, image_index)
+                        image_index += 1
+                        continue
+                    date_time = cached_datetime(image_path, date_times)
+                    if reused_frame is not None:
+                        candidates, global_change = reused_frame
+                    else:
+                        seed_positions = None
+                        if image_index - window_start < stacked_images:
+                            seed_positions = window_seeds[image_index - window_start]
+                        # Lighting changes are searched in the normalised image, if that helps
+                        search_image, seed_positions, global_change = (
+                            guard_global_change(
+                                image,
+                                background_image,
+                                is_daytime,
+                                seed_positions,
+                                window_roi,
+                                volatility,
                             )
-
-                            # Calculate the number of valid pixels
-                            valid_pixel_count = np.sum(
-                                (curr_dists > background_tol) & valid_pixels
+                        )
+                        if global_change:
+                            lefts, rights, bottoms, tops = animal_finder(
+                                search_image,
+                                background_image,
+                                is_daytime,
+                                seed_positions,
+                                window_roi,
+                                volatility,
+                                ENV.global_change_max_walk,
                             )
-
-                            # Check for black pixels
-                            secondary_colour_pixels = np.sum(
-                                np.all(
-                                    image_samples.astype(float)
-                                    < ENV.secondary_color_upper,
-                                    axis=1,
-                                )
-                                & np.all(
-                                    image_samples.astype(float)
-                                    > ENV.secondary_color_lower,
-                                    axis=1,
-                                )
+                        elif burst_boxes is not None and in_same_burst(
+                            previous_date_time, date_time
+                        ):
+                            lefts, rights, bottoms, tops = burst_finder(
+                                search_image,
+                                background_image,
+                                is_daytime,
+                                burst_boxes,
+                                seed_positions,
+                                window_roi,
+                                volatility,
                             )
-
-                            # Check if thresholds are exceeded
-                            if (
-                                valid_pixel_count / ENV.pixel_samples
-                                > ENV.disturbance_tol
-                                and secondary_colour_pixels / ENV.pixel_samples
-                                > ENV.secondary_colour_tol
-                            ):
-                                contours_found += 1
-                                if ENV.save_images:
-                                    cv2.rectangle(
-                                        image_static,
-                                        (int(tops[i]), int(lefts[i])),
-                                        (int(bottoms[i]), int(rights[i])),
-                                        (0, 0, 255),
-                                        4,
-                                    )
                         else:
-                            contours_found += 1
-                            if ENV.save_images:
-                                cv2.rectangle(
-                                    image_static,
-                                    (int(tops[i]), int(lefts[i])),
-                                    (int(bottoms[i]), int(rights[i])),
-                                    (0, 0, 255),
-                                    4,
-                                )
-
-            if contours_found > 0:
-                processed_data["images"][str(image_index)] = {
-                    "status": "animal",
-                    "reason": "contour found",
-                    "contours": contours_found,
-                }
-
-                if ENV.save_images:
-                    if not os.path.isdir(f"{folder_path}/positive_images/"):
-                        os.mkdir(f"{folder_path}/positive_images/")
-
-                    cv2.imwrite(
-                        f"{folder_path}/positive_images/{ENV.image_prefix}_{str(image_index).zfill(4)}.{ENV.image_suffix}",
-                        image_static,
+                            lefts, rights, bottoms, tops = animal_finder(
+                                search_image,
+                                background_image,
+                                is_daytime,
+                                seed_positions,
+                                window_roi,
+                                volatility,
+                            )
+                        if ENV.burst_tracking:
+                            burst_boxes = (
+                                None
+                                if global_change
+                                else list(zip(lefts, rights, bottoms, tops))
+                            )
+                            previous_date_time = date_time
+                        candidates = measure_contours(
+                            search_image,
+                            background_image,
+                            is_daytime,
+                            lefts,
+                            rights,
+                            bottoms,
+                            tops,
+                            window_roi,
+                        )
+                        if new_window is not None:
+                            new_window.frames[image_index - window_start] = (
+                                candidates,
+                                global_change,
+                            )
+                    candidates["image_index"] = image_index
+                    folder_candidates[image_index] = candidates
+                    accepted_boxes = candidate_boxes(
+                        candidates[score_contours(candidates)]
                     )
-            else:
-                if image_index in processed_data["images"]:
-                    processed_data["images"][str(image_index)]["contours"] = 0
-                else:
+                    contours_found = len(accepted_boxes)
+                    if crop_writer is not None:
+                        crop_writer.add(
+                            image_index,
+                            image_path,
+                            image,
+                            full_resolution_boxes(accepted_boxes),
+                        )
+
+                if global_change:
+                    # The search was cut short, so count the image as true
                     processed_data["images"][str(image_index)] = {
-                        "status": "no animal",
-                        "reason": "no contour found",
-                        "contours": 0,
+                        "status": "animal",
+                        "reason": "global change",
+                        "contours": contours_found,
+                        "error": True,
                     }
-            if contours_found > 0:
-                for trial_index in range(
-                    image_index - ENV.adjacency, image_index + ENV.adjacency
-                ):
-                    if trial_index <= 0 or trial_index > max_image:
-                        continue
-                    if date_time == "1800-01-01 00:00:00":
-                        print("Error: Could not parse date from image metadata")
-                    if trial_index == image_index:
-                        continue
-
-                    trial_image_path = f"{folder_path}/{ENV.image_prefix}_{str(image_index).zfill(4)}.{ENV.image_suffix}"
-                    if not os.path.isfile(trial_image_path):
-                        continue
+                    print(f"Image {image_index} changed globally (counting as true)")
 
-                    trial_date_time = extract_datetime(trial_image_path)
+                if contours_found > 0:
+                    if not global_change:
+                        processed_data["images"][str(image_index)] = {
+                            "status": "animal",
+                            "reason": "contour found",
+                            "contours": contours_found,
+                        }
 
                     if (
-                        datetime_difference(trial_date_time, date_time)
-                        < ENV.datetime_adjacency_tolerance
+                        exporter is not None
+                        and image is not None
+                        and frame_scale() == 1
                     ):
-                        if str(trial_index) in processed_data["images"]:
-                            processed_data["images"][str(trial_index)][
-                                "status"
-                            ] = "animal"
-                            processed_data["images"][str(trial_index)][
-                                "adjacency"
-                            ] = True
-                            if (
-                                processed_data["images"][str(trial_index)]["reason"]
-                                == "no contour found"
-                            ):
-                                processed_data["images"][str(trial_index)][
-                                    "reason"
-                                ] = "adjacent"
-
-                        else:
-                            processed_data["images"][str(trial_index)] = {
-                                "status": "animal",
-                                "reason": "adjacent",
-                                "contours": 0,
-                                "adjacency": True,
-                            }
-            # Save JSON at each step
-            json.dump(processed_data, open(json_path, "w"))
-            print(f"Image {image_index} processed")
-            image_index += 1
+                        # The image may be a view of the window stack, which the exporter
+                        # would keep in memory (and draw onto), so it is given a copy
+                        exporter.submit(image_path, image.copy(), accepted_boxes)
+                    elif exporter is not None:
+                        # Export the full resolution image rather than the scaled (or reused) one
+                        exporter.submit(
+                            image_path, None, full_resolution_boxes(accepted_boxes)
+                        )
+                elif not global_change:
+                    if image_index in processed_data["images"]:
+                        processed_data["images"][str(image_index)]["contours"] = 0
+                    else:
+                        processed_data["images"][str(image_index)] = {
+                            "status": "no animal",
+                            "reason": "no contour found",
+                            "contours": 0,
+                        }
+                adjacent_images = []
+                if contours_found > 0:
+                    adjacent_images = mark_adjacent_images(
+                        processed_data,
+                        folder_path,
+                        image_index,
+                        date_time,
+                        max_image,
+                        date_times,
+                    )
+                # Save JSON at each step
+                if lease is not None:
+                    lease.check()
+                storage.write_json(json_path, processed_data)
+                print(f"Image {image_index} processed")
+                yield frame_result(
+                    processed_data,
+                    folder_path,
+                    image_index,
+                    full_resolution_boxes(accepted_boxes),
+                )
+                for adjacent_index in adjacent_images:
+                    yield frame_result(
+                        processed_data, folder_path, adjacent_index, update=True
+                    )
+                image_index += 1
+            if new_window is not None:
+                save_window(key, new_window)
+            resume_index = background_end_index
+        finished = True
+    finally:
+        try:
+            if exporter is not None:
+                exporter.close()
+        finally:
+            if crop_writer is not None:
+                crop_writer.close()
+        if not finished and (lease is None or not lease.lost):
+            # Record where to resume, with the candidates found so far
+            processed_data["resume_index"] = resume_index
+            storage.write_json(json_path, processed_data)
+            save_candidates(folder_path, folder_candidates)
     processed_data["completed"] = True
-    json.dump(processed_data, open(json_path, "w"))
+    processed_data.pop("resume_index", None)
+    if lease is not None:
+        lease.check()
+    storage.write_json(json_path, processed_data)
+    save_candidates(folder_path, folder_candidates)
     create_summary_csv(processed_data, folder_path)
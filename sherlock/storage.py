@@ -0,0 +1,435 @@
+import abc
+import io
+import json
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .config import EnvSettings
+
+ENV = EnvSettings()
+
+# The permissions of new files, as mkstemp makes files only readable by their owner
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+_FILE_MODE = 0o666 & ~_UMASK
+
+
+@dataclass
+class StorageEntry:
+    """
+    A file or folder listed by a storage backend.
+    """
+
+    # The file or folder name
+    name: str
+
+    # Whether this is a folder
+    is_dir: bool
+
+    # The size in bytes (0 for folders)
+    size: int = 0
+
+    # The modification time in ns (0 for folders)
+    mtime_ns: int = 0
+
+
+class Storage(abc.ABC):
+    """
+    Access to the files under a root directory.
+
+    Paths are written as "folder/name" on every backend, so that they can be built in the same
+    way as local paths.
+    """
+
+    # Whether paths are local file paths, usable by anything that needs a real file
+    is_local = False
+
+    @abc.abstractmethod
+    def list_dir(self, path: str) -> List[StorageEntry]:
+        """
+        List the files and folders in a folder.
+
+        Args:
+            path (str): The folder path
+
+        Returns:
+            List[StorageEntry]: The entries
+        """
+
+    @abc.abstractmethod
+    def is_file(self, path: str) -> bool:
+        """
+        Check whether a file exists.
+
+        Args:
+            path (str): The file path
+
+        Returns:
+            bool: True if the file exists
+        """
+
+    @abc.abstractmethod
+    def stat(self, path: str) -> Optional[StorageEntry]:
+        """
+        Get the size and modification time of a file.
+
+        Args:
+            path (str): The file path
+
+        Returns:
+            Optional[StorageEntry]: The file, or None if there is no such file
+        """
+
+    @abc.abstractmethod
+    def read_bytes(self, path: str) -> bytes:
+        """
+        Read a whole file.
+
+        Args:
+            path (str): The file path
+
+        Returns:
+            bytes: The contents, raising FileNotFoundError if there is no such file
+        """
+
+    @abc.abstractmethod
+    def read_range(self, path: str, start: int, length: int) -> bytes:
+        """
+        Read part of a file.
+
+        Args:
+            path (str): The file path
+            start (int): The offset of the first byte
+            length (int): The maximum number of bytes to read
+
+        Returns:
+            bytes: The contents
+        """
+
+    @abc.abstractmethod
+    def write_bytes(self, path: str, data: bytes):
+        """
+        Write a whole file, replacing any existing file.
+
+        Args:
+            path (str): The file path
+            data (bytes): The contents
+        """
+
+    @abc.abstractmethod
+    def remove(self, path: str):
+        """
+        Remove a file, if it exists.
+
+        Args:
+            path (str): The file path
+        """
+
+    def refresh(self):
+        """
+        Forget any cached folder listings, e.g. before checking for new images.
+        """
+
+    def read_header(self, path: str) -> BinaryIO:
+        """
+        Open the start of a file (ENV.header_read_bytes), e.g. to read image metadata without
+        fetching the whole image.
+
+        Args:
+            path (str): The file path
+
+        Returns:
+            BinaryIO: The start of the file
+        """
+        return io.BytesIO(self.read_range(path, 0, ENV.header_read_bytes))
+
+    def decode_image(self, path: str, flags: int = 1) -> Optional[np.ndarray]:
+        """
+        Decode an image.
+
+        Args:
+            path (str): The image path
+            flags (int): The cv2.imread flags (by default cv2.IMREAD_COLOR)
+
+        Returns:
+            Optional[np.ndarray]: The image, or None if it could not be read
+        """
+        # Imported here so that listing files does not need OpenCV
+        import cv2
+
+        try:
+            data = self.read_bytes(path)
+        except OSError:
+            return None
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+
+    def read_json(self, path: str) -> Any:
+        """
+        Read a JSON file.
+
+        Args:
+            path (str): The file path
+
+        Returns:
+            Any: The decoded JSON
+        """
+        return json.loads(self.read_bytes(path))
+
+    def write_json(self, path: str, data: Any):
+        """
+        Write a JSON file.
+
+        Args:
+            path (str): The file path
+            data (Any): The data to encode
+        """
+        self.write_bytes(path, json.dumps(data).encode())
+
+
+class LocalStorage(Storage):
+    """
+    Files on a local (or network mounted) file system.
+    """
+
+    is_local = True
+
+    def list_dir(self, path: str) -> List[StorageEntry]:
+        entries = []
+        for entry in os.scandir(path):
+            if entry.is_dir(follow_symlinks=False):
+                entries.append(StorageEntry(entry.name, True))
+            else:
+                stat = entry.stat()
+                entries.append(
+                    StorageEntry(entry.name, False, stat.st_size, stat.st_mtime_ns)
+                )
+        return entries
+
+    def is_file(self, path: str) -> bool:
+        return os.path.isfile(path)
+
+    def stat(self, path: str) -> Optional[StorageEntry]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return StorageEntry(
+            os.path.basename(path), False, stat.st_size, stat.st_mtime_ns
+        )
+
+    def read_bytes(self, path: str) -> bytes:
+        with open(path, "rb") as file:
+            return file.read()
+
+    def read_range(self, path: str, start: int, length: int) -> bytes:
+        with open(path, "rb") as file:
+            file.seek(start)
+            return file.read(length)
+
+    def write_bytes(self, path: str, data: bytes):
+        folder_path = os.path.dirname(path) or "."
+        os.makedirs(folder_path, exist_ok=True)
+        # A unique temporary file, so that processes writing the same file at once (e.g. the
+        # same dedup window) never write into each other's temporary file
+        handle, temporary_path = tempfile.mkstemp(
+            dir=folder_path, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(data)
+            os.chmod(temporary_path, _FILE_MODE)
+            os.replace(temporary_path, path)
+        except BaseException:
+            if os.path.lexists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    def remove(self, path: str):
+        if os.path.lexists(path):
+            os.remove(path)
+
+    def read_header(self, path: str) -> BinaryIO:
+        # Local files are read lazily, so there is no need to limit the read
+        return open(path, "rb")
+
+    def decode_image(self, path: str, flags: int = 1) -> Optional[np.ndarray]:
+        import cv2
+
+        return cv2.imread(path, flags)
+
+
+class S3Storage(Storage):
+    """
+    Objects in an S3-compatible bucket, with paths written as "s3://bucket/key".
+
+    A single client with a pool of ENV.storage_connections connections is shared by every
+    thread. Folder listings are cached, so checking for many files costs one listing request.
+    """
+
+    def __init__(self, bucket: str):
+        """
+        Args:
+            bucket (str): The bucket name
+        """
+        self.bucket = bucket
+        self._client: Any = None
+        self._lock = threading.Lock()
+        self._listings: Dict[str, Dict[str, StorageEntry]] = {}
+
+    @property
+    def client(self) -> Any:
+        """
+        The S3 client, created on first use.
+        """
+        with self._lock:
+            if self._client is None:
+                try:
+                    import boto3
+                    from botocore.config import Config
+                except ImportError as error:
+                    raise ImportError(
+                        "boto3 is needed to read from S3 (pip install boto3)"
+                    ) from error
+                self._client = boto3.client(
+                    "s3",
+                    endpoint_url=ENV.s3_endpoint_url,
+                    config=Config(
+                        max_pool_connections=ENV.storage_connections,
+                        retries={"max_attempts": 5, "mode": "standard"},
+                    ),
+                )
+            return self._client
+
+    def key(self, path: str) -> str:
+        """
+        Get the object key for a path.
+
+        Args:
+            path (str): The path, as "s3://bucket/key"
+
+        Returns:
+            str: The key
+        """
+        prefix = f"s3://{self.bucket}"
+        if path != prefix and not path.startswith(f"{prefix}/"):
+            raise ValueError(f"{path} is not in the bucket {self.bucket}")
+        return path[len(prefix) + 1 :].strip("/")
+
+    def _split(self, path: str) -> Tuple[str, str]:
+        folder_path, _, name = path.rstrip("/").rpartition("/")
+        return folder_path, name
+
+    def _listing(self, folder_path: str) -> Dict[str, StorageEntry]:
+        folder_path = folder_path.rstrip("/")
+        with self._lock:
+            listing = self._listings.get(folder_path)
+        if listing is not None:
+            return listing
+
+        prefix = self.key(folder_path)
+        prefix = f"{prefix}/" if prefix else ""
+        listing = {}
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(
+            Bucket=self.bucket, Prefix=prefix, Delimiter="/"
+        ):
+            for common_prefix in page.get("CommonPrefixes", []):
+                name = common_prefix["Prefix"][len(prefix) :].rstrip("/")
+                listing[name] = StorageEntry(name, True)
+            for content in page.get("Contents", []):
+                name = content["Key"][len(prefix) :]
+                if name:
+                    listing[name] = StorageEntry(
+                        name,
+                        False,
+                        content["Size"],
+                        int(content["LastModified"].timestamp() * 1e9),
+                    )
+        with self._lock:
+            self._listings[folder_path] = listing
+        return listing
+
+    def _update_listing(self, path: str, entry: Optional[StorageEntry]):
+        folder_path, name = self._split(path)
+        with self._lock:
+            listing = self._listings.get(folder_path)
+            if listing is None:
+                return
+            if entry is None:
+                listing.pop(name, None)
+            else:
+                listing[name] = entry
+
+    def refresh(self):
+        with self._lock:
+            self._listings = {}
+
+    def list_dir(self, path: str) -> List[StorageEntry]:
+        return list(self._listing(path).values())
+
+    def is_file(self, path: str) -> bool:
+        folder_path, name = self._split(path)
+        entry = self._listing(folder_path).get(name)
+        return entry is not None and not entry.is_dir
+
+    def stat(self, path: str) -> Optional[StorageEntry]:
+        folder_path, name = self._split(path)
+        entry = self._listing(folder_path).get(name)
+        return None if entry is None or entry.is_dir else entry
+
+    def _get(self, path: str, **arguments: Any) -> bytes:
+        try:
+            response = self.client.get_object(
+                Bucket=self.bucket, Key=self.key(path), **arguments
+            )
+        except self.client.exceptions.NoSuchKey as error:
+            raise FileNotFoundError(path) from error
+        return response["Body"].read()
+
+    def read_bytes(self, path: str) -> bytes:
+        return self._get(path)
+
+    def read_range(self, path: str, start: int, length: int) -> bytes:
+        return self._get(path, Range=f"bytes={start}-{start + length - 1}")
+
+    def write_bytes(self, path: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self.key(path), Body=data)
+        self._update_listing(path, StorageEntry(self._split(path)[1], False, len(data)))
+
+    def remove(self, path: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(path))
+        self._update_listing(path, None)
+
+
+LOCAL_STORAGE = LocalStorage()
+
+# The S3 storage for each bucket used in this process
+_s3_storages: Dict[str, S3Storage] = {}
+_s3_storages_lock = threading.Lock()
+
+
+def get_storage(path: str) -> Storage:
+    """
+    Get the storage backend for a path.
+
+    Paths starting with "s3://" are objects in an S3-compatible bucket (see ENV.s3_endpoint_url),
+    and all other paths are local.
+
+    Args:
+        path (str): The file or folder path
+
+    Returns:
+        Storage: The storage backend
+    """
+    if not path.startswith("s3://"):
+        return LOCAL_STORAGE
+    bucket = path[len("s3://") :].split("/", 1)[0]
+    with _s3_storages_lock:
+        if bucket not in _s3_storages:
+            _s3_storages[bucket] = S3Storage(bucket)
+        return _s3_storages[bucket]
@@ -1,26 +1,33 @@
-import os
 from datetime import datetime, timedelta
 from typing import Any, Dict, List, Optional
 
-import cv2
-import pandas as pd
-from PIL import Image
-from PIL.ExifTags import TAGS
+import numpy as np
 
 from .config import EnvSettings
+from .decoders import decode_image
+from .storage import get_storage
 
 ENV = EnvSettings()
 
 
-def create_summary_csv(processed_data: Dict[str, Any], folder_path: str):
+def create_summary_csv(
+    processed_data: Dict[str, Any], folder_path: str, csv_path: Optional[str] = None
+):
     """
     Create a summary CSV for a folder.
 
     Args:
         processed_data (Dict[str,Any]): The processed data
         folder_path (str): The folder path
+        csv_path (Optional[str]): The path of the CSV (defaults to a summary for the folder)
     """
-    summary_data: List[pd.DataFrame] = []
+    # Imported here as pandas is slow to import and only needed for the summary
+    import pandas as pd
+
+    if csv_path is None:
+        csv_path = f"{folder_path}/summary_data_{ENV.run_code}.csv"
+
+    summary_data: List["pd.DataFrame"] = []
     for image_index, image_datum in processed_data["images"].items():
         summary_data.append(
             pd.DataFrame(
@@ -37,8 +44,8 @@ def create_summary_csv(processed_data: Dict[str, Any], folder_path: str):
             )
         )
 
-    pd.concat(summary_data).to_csv(
-        f"{folder_path}/summary_data_{ENV.run_code}.csv", index=False
+    get_storage(csv_path).write_bytes(
+        csv_path, pd.concat(summary_data).to_csv(index=False).encode()
     )
 
 
@@ -85,6 +92,60 @@ def datetime_difference(dt1: str, dt2: str) -> bool:
     return time_diff < timedelta(seconds=ENV.datetime_adjacency_tolerance)
 
 
+def parse_datetime(date_time: str) -> Optional[datetime]:
+    """
+    Parse a datetime string from image metadata.
+
+    Args:
+        date_time (str): The datetime string in the format "YYYY:MM:DD HH:MM:SS"
+
+    Returns:
+        Optional[datetime]: The datetime, or None if it is in an unexpected format
+    """
+    try:
+        return datetime.strptime(date_time, "%Y:%m:%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+
+
+def in_same_burst(dt1: str, dt2: str) -> bool:
+    """
+    Test whether two images were taken in the same burst, i.e. at most
+    ENV.burst_interval seconds apart.
+
+    Args:
+        dt1 (str): The datetime of the first image
+        dt2 (str): The datetime of the second image
+
+    Returns:
+        bool: True if both datetimes are known and close enough to be in the same burst
+    """
+    dt1_obj = parse_datetime(dt1)
+    dt2_obj = parse_datetime(dt2)
+    if dt1_obj is None or dt2_obj is None:
+        return False
+    return abs(dt1_obj - dt2_obj) <= timedelta(seconds=ENV.burst_interval)
+
+
+def cached_datetime(image_path: str, date_times: Optional[Dict[str, str]]) -> str:
+    """
+    Extract the datetime of an image, reading its metadata only once.
+
+    Args:
+        image_path (str): The file path of the image
+        date_times (Optional[Dict[str,str]]): The datetimes already read, by image path,
+            updated in place. If None, the metadata is always read.
+
+    Returns:
+        str: The datetime
+    """
+    if date_times is None:
+        return extract_datetime(image_path)
+    if image_path not in date_times:
+        date_times[image_path] = extract_datetime(image_path)
+    return date_times[image_path]
+
+
 def extract_datetime(image_path: str) -> str:
     """
     Extract the DateTime and Make metadata from the EXIF data of an image.
@@ -95,11 +156,17 @@ def extract_datetime(image_path: str) -> str:
     Returns:
         str: The datetime
     """
+    from PIL import Image
+    from PIL.ExifTags import TAGS
+
     datetime_value = "1800-01-01 00:00:00"
 
     try:
-        image = Image.open(image_path)
-        exif_data = image.getexif()
+        with (
+            get_storage(image_path).read_header(image_path) as header,
+            Image.open(header) as image,
+        ):
+            exif_data = image.getexif()
 
         for tag_id, value in exif_data.items():
             tag_name = TAGS.get(tag_id, tag_id)
@@ -119,6 +186,129 @@ def extract_datetime(image_path: str) -> str:
     return datetime_value
 
 
+def mark_adjacent_images(
+    processed_data: Dict[str, Any],
+    folder_path: str,
+    image_index: int,
+    date_time: str,
+    max_image: int,
+    date_times: Optional[Dict[str, str]] = None,
+) -> List[int]:
+    """
+    Mark the images taken close to a positive image as positive, as these are likely to show
+    the same animal.
+
+    Args:
+        processed_data (Dict[str,Any]): The processed data, updated in place
+        folder_path (str): The folder path
+        image_index (int): The index of the positive image
+        date_time (str): The datetime of the positive image
+        max_image (int): The highest image index in the folder
+        date_times (Optional[Dict[str,str]]): The datetimes already read, by image path, so
+            that the metadata of each image is only read once
+
+    Returns:
+        List[int]: The indices of the images marked
+    """
+    marked = []
+    for trial_index in range(image_index - ENV.adjacency, image_index + ENV.adjacency):
+        if trial_index <= 0 or trial_index > max_image:
+            continue
+        if date_time == "1800-01-01 00:00:00":
+            print("Error: Could not parse date from image metadata")
+        if trial_index == image_index:
+            continue
+
+        trial_image_path = f"{folder_path}/{ENV.image_prefix}_{str(image_index).zfill(4)}.{ENV.image_suffix}"
+        if not get_storage(trial_image_path).is_file(trial_image_path):
+            continue
+
+        trial_date_time = cached_datetime(trial_image_path, date_times)
+
+        if (
+            datetime_difference(trial_date_time, date_time)
+            < ENV.datetime_adjacency_tolerance
+        ):
+            if str(trial_index) in processed_data["images"]:
+                processed_data["images"][str(trial_index)]["status"] = "animal"
+                processed_data["images"][str(trial_index)]["adjacency"] = True
+                if (
+                    processed_data["images"][str(trial_index)].get("reason")
+                    == "no contour found"
+                ):
+                    processed_data["images"][str(trial_index)]["reason"] = "adjacent"
+
+            else:
+                processed_data["images"][str(trial_index)] = {
+                    "status": "animal",
+                    "reason": "adjacent",
+                    "contours": 0,
+                    "adjacency": True,
+                }
+            marked.append(trial_index)
+    return marked
+
+
+def mark_adjacent_frames(processed_data: Dict[str, Any]) -> List[int]:
+    """
+    Mark the frames of a video clip processed close to a positive frame as positive.
+
+    Frames in a clip are a fraction of a second apart, so frames are adjacent by position
+    alone: the same ENV.adjacency positions around a positive frame are marked as
+    mark_adjacent_images marks around a positive image.
+
+    Args:
+        processed_data (Dict[str,Any]): The processed data of the clip, updated in place
+
+    Returns:
+        List[int]: The frame numbers of the frames marked
+    """
+    frame_numbers = sorted(int(key) for key in processed_data["images"])
+    positive_positions = [
+        position
+        for position, frame_number in enumerate(frame_numbers)
+        if processed_data["images"][str(frame_number)]["contours"] > 0
+    ]
+    marked = []
+    for position in positive_positions:
+        for trial_position in range(
+            max(position - ENV.adjacency, 0),
+            min(position + ENV.adjacency, len(frame_numbers)),
+        ):
+            if trial_position == position:
+                continue
+            trial_datum = processed_data["images"][str(frame_numbers[trial_position])]
+            trial_datum["status"] = "animal"
+            trial_datum["adjacency"] = True
+            if trial_datum.get("reason") == "no contour found":
+                trial_datum["reason"] = "adjacent"
+            marked.append(frame_numbers[trial_position])
+    return marked
+
+
+def load_image(image_path: str, single_channel: bool = False) -> Optional[np.ndarray]:
+    """
+    Decode an image with the decoder set by ENV.image_decoder.
+
+    If ENV.frame_cache_directory is set, the image is read through the frame cache, and so
+    is scaled to ENV.frame_cache_scale.
+
+    Args:
+        image_path (str): The path to the image
+        single_channel (bool): Whether to decode the image as a single (grey) channel
+
+    Returns:
+        Optional[np.ndarray]: The (H,W,3) BGR image, or the (H,W) grey image if single_channel
+            is set, or None if it could not be read
+    """
+    if ENV.frame_cache_directory:
+        from .frame_cache import load_cached_image
+
+        return load_cached_image(image_path, single_channel)
+
+    return decode_image(image_path, single_channel)
+
+
 def find_max_image_path(folder_path: str) -> Optional[int]:
     """
     Find the image with the highest index in the specified folder by checking from the maximum index (9999)
@@ -130,11 +320,13 @@ def find_max_image_path(folder_path: str) -> Optional[int]:
     Returns:
         Optional[str]: The path of the image with the highest index, or None if no matching images are found.
     """
+    storage = get_storage(folder_path)
+
     # Start with the maximum index (9999) and decrement until an image is found
     for image_index in range(9999, -1, -1):
         image_path = f"{folder_path}/{ENV.image_prefix}_{str(image_index).zfill(4)}.{ENV.image_suffix}"
 
-        if os.path.isfile(image_path):
+        if storage.is_file(image_path):
             return image_index
 
     # Return None if no matching image is found
@@ -159,8 +351,8 @@ def set_image_shape(path_to_file: str, image_max: int):
     mid_image_path = (
         f"{path_to_file}/{ENV.image_prefix}_{mid_image_index}.{ENV.image_suffix}"
     )
-    if os.path.isfile(mid_image_path):
-        mid_image = cv2.imread(mid_image_path)
+    if get_storage(mid_image_path).is_file(mid_image_path):
+        mid_image = load_image(mid_image_path)
         ENV.image_size = mid_image.shape
 
     else:
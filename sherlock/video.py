@@ -0,0 +1,325 @@
+import os
+import queue
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from .background_image import background_statistics, daytime_test_sample
+from .candidates import save_candidates
+from .config import EnvSettings
+from .crop_store import CropWriter
+from .dedup import WindowRecord, load_window, save_window, video_window_key
+from .discovery import video_output_paths
+from .export import PositiveExporter
+from .process_images import (
+    animal_finder,
+    candidate_boxes,
+    guard_global_change,
+    measure_contours,
+    score_contours,
+)
+from .resources import plan_resources
+from .storage import get_storage
+from .utils import create_summary_csv, mark_adjacent_frames
+
+ENV = EnvSettings()
+
+
+class VideoFrameSource:
+    """
+    Stream the frames of a video through a bounded buffer.
+
+    A reader thread decodes frames with cv2.VideoCapture while the caller processes earlier
+    ones. Frames skipped by the stride are grabbed but never decoded.
+    """
+
+    def __init__(
+        self,
+        video_path: str,
+        stride: Optional[int] = None,
+        buffer_size: Optional[int] = None,
+    ):
+        """
+        Args:
+            video_path (str): The path to the video
+            stride (Optional[int]): Process every stride-th frame (defaults to ENV.video_frame_stride)
+            buffer_size (Optional[int]): The number of decoded frames to buffer (defaults to
+                ENV.video_buffer_size)
+        """
+        self.video_path = video_path
+        self.stride = ENV.video_frame_stride if stride is None else stride
+        self._buffer: "queue.Queue[Optional[Tuple[int, np.ndarray]]]" = queue.Queue(
+            maxsize=ENV.video_buffer_size if buffer_size is None else buffer_size
+        )
+        self._stop = threading.Event()
+        self._capture = cv2.VideoCapture(video_path)
+        if not self._capture.isOpened():
+            raise IOError(f"Could not open video {video_path}")
+        self.fps: float = self._capture.get(cv2.CAP_PROP_FPS) or 0.0
+        self._reader = threading.Thread(
+            target=self._read, name=f"video reader {video_path}", daemon=True
+        )
+        self._reader.start()
+
+    def __iter__(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """
+        Yields:
+            Tuple[int,np.ndarray]: The frame number and the (BGR) frame
+        """
+        while True:
+            item = self._buffer.get()
+            if item is None:
+                return
+            yield item
+
+    def __enter__(self) -> "VideoFrameSource":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Stop the reader thread and release the video.
+        """
+        self._stop.set()
+        # Unblock the reader if it is waiting for space in the buffer
+        while self._reader.is_alive():
+            try:
+                self._buffer.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._capture.release()
+
+    def _read(self):
+        frame_number = 0
+        try:
+            while not self._stop.is_set():
+                if frame_number % self.stride != 0:
+                    if not self._capture.grab():
+                        break
+                else:
+                    success, frame = self._capture.read()
+                    if not success:
+                        break
+                    self._put((frame_number, frame))
+                frame_number += 1
+        finally:
+            self._put(None)
+
+    def _put(self, item: Optional[Tuple[int, np.ndarray]]):
+        while not self._stop.is_set():
+            try:
+                self._buffer.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+
+def process_video(video_path: str):
+    """
+    Process a video clip, streaming its frames without writing them to disk.
+
+    Frames are grouped into windows of ENV.background_max_images (sampled) frames, or fewer if
+    the memory budget requires, each with its own background. Results are keyed by frame number and written per clip.
+
+    The measured candidates, crops and reused windows of a clip are kept as for a folder, so
+    that clips can be rescored and deduplicated in the same way.
+
+    Args:
+        video_path (str): The path to the video
+    """
+    json_path, csv_path = video_output_paths(video_path)
+    processed_data: Dict[str, Any] = {"completed": False, "images": {}}
+    clip_candidates: Dict[int, np.ndarray] = {}
+
+    exporter = None
+    if ENV.save_images:
+        # There are no original files to link or copy for video frames
+        mode = "annotated" if ENV.export_mode in ("link", "original") else None
+        exporter = PositiveExporter(os.path.dirname(video_path) or ".", mode)
+    crop_writer = None
+    if ENV.crop_size:
+        if get_storage(video_path).is_local:
+            crop_writer = CropWriter(video_path)
+        else:
+            print(f"Warning: Not writing crops for {video_path} as it is not local")
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+
+    try:
+        with VideoFrameSource(video_path) as source:
+            is_daytime: Optional[bool] = None
+            window: List[Tuple[int, np.ndarray]] = []
+            for frame_number, frame in source:
+                if is_daytime is None:
+                    # Videos carry no flash metadata, so classify the clip from its first
+                    # frame
+                    is_daytime = daytime_test_sample(frame)
+                    window_length = plan_resources(frame.shape).window_length
+                if not is_daytime and ENV.night_single_channel:
+                    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                window.append((frame_number, frame))
+                if len(window) == window_length:
+                    process_video_window(
+                        window,
+                        is_daytime,
+                        processed_data,
+                        clip_candidates,
+                        exporter,
+                        crop_writer,
+                        stem,
+                    )
+                    window = []
+            if window:
+                process_video_window(
+                    window,
+                    bool(is_daytime),
+                    processed_data,
+                    clip_candidates,
+                    exporter,
+                    crop_writer,
+                    stem,
+                )
+    finally:
+        # The exporter and crop writer are closed even if the clip could not be read
+        try:
+            if exporter is not None:
+                exporter.close()
+        finally:
+            if crop_writer is not None:
+                crop_writer.close()
+
+    # Only a clip read to the end is completed
+    mark_adjacent_frames(processed_data)
+    processed_data["completed"] = True
+    get_storage(json_path).write_json(json_path, processed_data)
+    save_candidates(video_path, clip_candidates)
+    create_summary_csv(processed_data, os.path.dirname(video_path), csv_path)
+    print(f"Video {video_path} processed")
+
+
+def process_video_window(
+    window: List[Tuple[int, np.ndarray]],
+    is_daytime: bool,
+    processed_data: Dict[str, Any],
+    clip_candidates: Dict[int, np.ndarray],
+    exporter: Optional[PositiveExporter],
+    crop_writer: Optional[CropWriter],
+    stem: str,
+):
+    """
+    Build the background for a window of video frames and process each frame against it.
+
+    As for a window of images, the first frame of the window is not used in the background.
+    Adjacency is applied to the whole clip once every window has been processed.
+
+    Args:
+        window (List[Tuple[int,np.ndarray]]): The frame numbers and frames
+        is_daytime (bool): Whether the clip is a daytime clip
+        processed_data (Dict[str,Any]): The results for the clip, updated in place
+        clip_candidates (Dict[int,np.ndarray]): The measured candidates of each frame, by
+            frame number, updated in place
+        exporter (Optional[PositiveExporter]): The exporter for positive frames
+        crop_writer (Optional[CropWriter]): The writer for crops of accepted boxes
+        stem (str): The video file name without its suffix
+    """
+    frame_numbers = [frame_number for frame_number, _ in window]
+
+    if len(window) < ENV.min_background_used:
+        for frame_number in frame_numbers:
+            processed_data["images"][str(frame_number)] = {
+                "status": "animal",
+                "reason": "insufficient background images",
+                "contours": 0,
+                "error": True,
+            }
+        return
+    if len(window) == 1:
+        # There are no other frames to build a background from
+        processed_data["images"][str(frame_numbers[0])] = {
+            "status": "error",
+            "error": True,
+            "contours": 0,
+        }
+        return
+
+    # An identical window (e.g. a copied clip) is not processed again
+    key = None
+    reused_window: Optional[WindowRecord] = None
+    if ENV.dedup_directory:
+        key = video_window_key([frame for _, frame in window], is_daytime)
+        reused_window = load_window(key)
+    new_window = None
+    if reused_window is not None:
+        print(
+            f"Reusing the results of an identical window from frame {frame_numbers[0]}"
+        )
+    else:
+        background_image, volatility = background_statistics(
+            np.stack([frame for _, frame in window[1:]])
+        )
+        if key is not None:
+            new_window = WindowRecord(len(window))
+
+    for position, (frame_number, frame) in enumerate(window):
+        if reused_window is not None:
+            candidates, global_change = reused_window.frames[position]
+        else:
+            search_frame, seed_positions, global_change = guard_global_change(
+                frame, background_image, is_daytime, volatility=volatility
+            )
+            lefts, rights, bottoms, tops = animal_finder(
+                search_frame,
+                background_image,
+                is_daytime,
+                seed_positions,
+                volatility=volatility,
+                max_walk_steps=ENV.global_change_max_walk if global_change else None,
+            )
+            candidates = measure_contours(
+                search_frame,
+                background_image,
+                is_daytime,
+                lefts,
+                rights,
+                bottoms,
+                tops,
+            )
+            if new_window is not None:
+                new_window.frames[position] = (candidates, global_change)
+        candidates["image_index"] = frame_number
+        clip_candidates[frame_number] = candidates
+        accepted_boxes = candidate_boxes(candidates[score_contours(candidates)])
+
+        if global_change:
+            # The search was cut short, so count the frame as true
+            processed_data["images"][str(frame_number)] = {
+                "status": "animal",
+                "reason": "global change",
+                "contours": len(accepted_boxes),
+                "error": True,
+            }
+        elif accepted_boxes:
+            processed_data["images"][str(frame_number)] = {
+                "status": "animal",
+                "reason": "contour found",
+                "contours": len(accepted_boxes),
+            }
+        else:
+            processed_data["images"][str(frame_number)] = {
+                "status": "no animal",
+                "reason": "no contour found",
+                "contours": 0,
+            }
+        if crop_writer is not None:
+            # Video frames are never scaled
+            crop_writer.add(frame_number, "", frame, accepted_boxes, scale=1.0)
+        if accepted_boxes and exporter is not None:
+            exporter.submit(
+                f"{stem}_{str(frame_number).zfill(6)}.jpg", frame, accepted_boxes
+            )
+
+    if new_window is not None:
+        save_window(key, new_window)
@@ -0,0 +1,212 @@
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import EnvSettings
+from .discovery import discover_jobs, frame_pattern
+from .leases import FolderLease, LeaseLostError
+from .storage import get_storage
+from .utils import set_image_shape
+
+ENV = EnvSettings()
+
+
+def scan_frames(folder_path: str) -> Dict[int, Tuple[int, int]]:
+    """
+    List the frames in a folder along with their size and modification time.
+
+    Args:
+        folder_path (str): The folder path
+
+    Returns:
+        Dict[int,Tuple[int,int]]: The (size, modification time in ns) of each frame, by index
+    """
+    pattern = frame_pattern()
+    frames: Dict[int, Tuple[int, int]] = {}
+    for entry in get_storage(folder_path).list_dir(folder_path):
+        match = pattern.match(entry.name)
+        if match is None or entry.is_dir:
+            continue
+        frames[int(match.group(1))] = (entry.size, entry.mtime_ns)
+    return frames
+
+
+def load_manifest(folder_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the manifest of frames seen in a folder by previous runs.
+
+    Args:
+        folder_path (str): The folder path
+
+    Returns:
+        Optional[Dict[str,Any]]: The manifest, or None if there is no manifest
+    """
+    manifest_path = f"{folder_path}/manifest_{ENV.run_code}.json"
+    storage = get_storage(manifest_path)
+    if not storage.is_file(manifest_path):
+        return None
+    return storage.read_json(manifest_path)
+
+
+def save_manifest(folder_path: str, frames: Dict[int, Tuple[int, int]]):
+    """
+    Save the manifest of frames in a folder, along with the image shape for the folder.
+
+    Args:
+        folder_path (str): The folder path
+        frames (Dict[int,Tuple[int,int]]): The (size, modification time) of each frame
+    """
+    manifest_path = f"{folder_path}/manifest_{ENV.run_code}.json"
+    manifest = {
+        "image_size": list(ENV.image_size),
+        "frames": {str(index): list(stat) for index, stat in frames.items()},
+    }
+    get_storage(manifest_path).write_json(manifest_path, manifest)
+
+
+def find_update_start(
+    changed: List[int], windows: List[List[int]], previous_max: int
+) -> int:
+    """
+    Find the first image to reprocess, which is the start of the earliest background window
+    affected by the changed frames.
+
+    Args:
+        changed (List[int]): The (sorted) indices of new or changed frames
+        windows (List[List[int]]): The [start, end) of each recorded background window
+        previous_max (int): The highest frame index when the folder was last processed
+
+    Returns:
+        int: The index to start processing from
+    """
+    first_changed = changed[0]
+    for window_start, window_end in windows:
+        if window_start <= first_changed < window_end:
+            return window_start
+
+    # New frames after the last window extend it if it was cut short by the end of the folder
+    last_start, last_end = windows[-1]
+    if first_changed >= last_end and last_end > previous_max:
+        return last_start
+
+    return first_changed
+
+
+def update_folder(folder_path: str, lease: Optional[FolderLease] = None) -> bool:
+    """
+    Process only the background windows of a folder that contain new or changed frames,
+    extending the existing results and summary in place.
+
+    Args:
+        folder_path (str): The folder path
+        lease (Optional[FolderLease]): The lease held on the folder, if coordinating
+
+    Returns:
+        bool: True if any frames were processed
+    """
+    # Imported here so that polls with nothing to do avoid loading OpenCV and pandas
+    from .sherlock import process_folder
+
+    frames = scan_frames(folder_path)
+    if not frames:
+        return False
+    max_image = max(frames)
+
+    storage = get_storage(folder_path)
+    json_path = f"{folder_path}/processed_data_{ENV.run_code}.json"
+    manifest = load_manifest(folder_path)
+    if manifest is None:
+        if not storage.is_file(json_path):
+            print(f"Running folder {folder_path}")
+            process_folder(folder_path, lease)
+            save_manifest(folder_path, frames)
+            return True
+
+        # Adopt the frames with stored results from a run made before the manifest existed
+        processed_images = storage.read_json(json_path)["images"]
+        manifest = {
+            "image_size": None,
+            "frames": {
+                str(index): list(stat)
+                for index, stat in frames.items()
+                if str(index) in processed_images
+            },
+        }
+
+    previous_frames = manifest["frames"]
+    changed = sorted(
+        index
+        for index, stat in frames.items()
+        if previous_frames.get(str(index)) != list(stat)
+    )
+    if not changed:
+        return False
+
+    windows = storage.read_json(json_path).get("windows", [])
+
+    if manifest["image_size"] is not None:
+        ENV.image_size = tuple(manifest["image_size"])
+    else:
+        set_image_shape(folder_path, max_image)
+
+    if windows:
+        previous_max = max((int(index) for index in previous_frames), default=0)
+        start_index = find_update_start(changed, windows, previous_max)
+    else:
+        start_index = 1
+
+    print(
+        f"Updating folder {folder_path}: {len(changed)} new or changed images,"
+        f" reprocessing from image {start_index}"
+    )
+    process_folder(
+        folder_path,
+        lease,
+        start_index=start_index,
+        resync_after=changed[-1],
+        max_image=max_image,
+        resume=False,
+    )
+    save_manifest(folder_path, frames)
+    return True
+
+
+def watch_sherlock(
+    root_path: Optional[str] = None,
+    poll_interval: Optional[float] = None,
+    max_polls: Optional[int] = None,
+):
+    """
+    Watch a folder tree, processing new or changed images as they arrive.
+
+    Args:
+        root_path (Optional[str]): The root path (defaults to ENV.root_directory)
+        poll_interval (Optional[float]): Seconds between polls (defaults to ENV.watch_poll_interval)
+        max_polls (Optional[int]): Stop after this many polls (by default, watch forever)
+    """
+    if root_path is None:
+        root_path = ENV.root_directory
+    if poll_interval is None:
+        poll_interval = ENV.watch_poll_interval
+
+    polls = 0
+    while max_polls is None or polls < max_polls:
+        # Forget cached listings, so that new images in object stores are seen
+        get_storage(root_path).refresh()
+        for job in discover_jobs(root_path):
+            if job.frame_count == 0:
+                continue
+            if not ENV.coordinate:
+                update_folder(job.path)
+                continue
+
+            with FolderLease(job.path) as lease:
+                if not lease.acquire():
+                    continue
+                try:
+                    update_folder(job.path, lease)
+                except LeaseLostError as error:
+                    print(f"Warning: Stopped updating {job.path} ({error})")
+
+        polls += 1
+        if max_polls is None or polls < max_polls:
+            time.sleep(poll_interval)
@@ -0,0 +1,53 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from sherlock.config import EnvSettings, apply_settings, get_settings
+
+# The synthetic images made by sherlock/generate_test_images.py
+TEST_IMAGES = Path(__file__).resolve().parent.parent / "test_images"
+
+
+def use_test_image_settings(root_directory: str):
+    """
+    Set the settings that suit the test images (white scenes with black blobs).
+
+    Args:
+        root_directory (str): The root directory of the copied test images
+    """
+    env = EnvSettings()
+    env.root_directory = root_directory
+    env.image_prefix = "image"
+    env.image_suffix = "jpg"
+    env.size_tol_day = 5
+    env.size_tol_night = 3
+    env.colour_lower = np.array([-1, -1, -1])
+    env.colour_upper = np.array([50, 50, 40])
+    env.secondary_color_lower = np.array([-1, -1, -1])
+    env.secondary_color_upper = np.array([50, 50, 50])
+    env.save_images = False
+
+
+@pytest.fixture(autouse=True)
+def restore_settings():
+    """
+    Restore the settings changed by a test.
+    """
+    settings = get_settings()
+    yield
+    apply_settings(settings)
+
+
+@pytest.fixture
+def image_root(tmp_path: Path) -> Path:
+    """
+    A copy of the test image folders, with the settings to process them.
+    """
+    root = tmp_path / "images"
+    for folder in ("folder_1", "folder_2"):
+        shutil.copytree(TEST_IMAGES / folder, root / folder)
+    use_test_image_settings(str(root))
+    np.random.seed(0)
+    return root
@@ -0,0 +1,57 @@
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+import pytest
+
+from sherlock import async_api
+from sherlock.async_api import process_folder_async
+
+
+def test_cancelled_folder_resumes_from_unfinished_window(image_root, monkeypatch):
+    folder_path = str(image_root / "folder_1")
+    json_path = f"{folder_path}/processed_data_1.json"
+    iter_folder_results = async_api.iter_folder_results
+    reached = threading.Event()
+    release = threading.Event()
+
+    def pause_at_image(folder_path):
+        # Hold the folder at an image inside its second window until it is cancelled
+        with closing(iter_folder_results(folder_path)) as results:
+            for result in results:
+                if result.image_index == 7 and not release.is_set():
+                    reached.set()
+                    release.wait()
+                yield result
+
+    monkeypatch.setattr(async_api, "iter_folder_results", pause_at_image)
+
+    async def cancel_and_resume():
+        # A thread pool runs the folder in this process, with the pause above
+        with ThreadPoolExecutor(1) as executor:
+            task = asyncio.create_task(process_folder_async(folder_path, executor))
+            await asyncio.to_thread(reached.wait)
+            task.cancel()
+            await asyncio.sleep(0.1)
+            release.set()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+            with open(json_path) as json_file:
+                processed_data = json.load(json_file)
+            assert not processed_data["completed"]
+
+            results = await process_folder_async(folder_path, executor)
+        return processed_data["resume_index"], results
+
+    resume_index, results = asyncio.run(cancel_and_resume())
+
+    assert 1 < resume_index <= 7
+    assert results[0].image_index == resume_index
+    with open(json_path) as json_file:
+        processed_data = json.load(json_file)
+    assert processed_data["completed"]
+    assert "resume_index" not in processed_data
+    assert len(processed_data["images"]) == 50
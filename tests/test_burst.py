@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+from conftest import use_test_image_settings
+
+from sherlock import process_images
+from sherlock.config import EnvSettings
+from sherlock.process_images import animal_finder, burst_finder
+
+ENV = EnvSettings()
+
+# The box found around the first animal in the previous image
+TRACKED_BOX = (18, 42, 28, 62)
+
+
+def two_animal_image():
+    """
+    Make a background and an image with two dark animals, and a seed in each.
+    """
+    background_image = np.full((200, 300, 3), 150.0)
+    image = background_image.copy()
+    image[20:40, 30:60] = 20
+    image[150:170, 200:240] = 20
+    seed_positions = np.array([[30, 45], [160, 220]])
+    return image, background_image, seed_positions
+
+
+@pytest.fixture
+def bounce_starts(tmp_path, monkeypatch):
+    """
+    Record the position each bounce starts from.
+    """
+    use_test_image_settings(tmp_path)
+    np.random.seed(0)
+    bounce = process_images.bounce
+    starts = []
+
+    def record_bounce(image, background_image, is_daytime, position, *args):
+        starts.append(tuple(position))
+        return bounce(image, background_image, is_daytime, position, *args)
+
+    monkeypatch.setattr(process_images, "bounce", record_bounce)
+    return starts
+
+
+def test_seeds_away_from_tracked_box_are_not_grown(bounce_starts):
+    image, background_image, seed_positions = two_animal_image()
+
+    boxes = burst_finder(image, background_image, True, [TRACKED_BOX], seed_positions)
+
+    # Only the tracked animal is found, without walking from the other seed
+    assert len(boxes[0]) == 1
+    assert boxes[0][0] <= 30 <= boxes[1][0] and boxes[2][0] <= 45 <= boxes[3][0]
+    assert (160, 220) not in bounce_starts
+    tracked_bounces = len(bounce_starts)
+
+    bounce_starts.clear()
+    animal_finder(image, background_image, True, seed_positions)
+    assert len(bounce_starts) > tracked_bounces
+
+
+def test_many_changes_away_from_tracked_box_are_searched(bounce_starts):
+    ENV.tracking_new_seeds = 0
+    image, background_image, seed_positions = two_animal_image()
+
+    boxes = burst_finder(image, background_image, True, [TRACKED_BOX], seed_positions)
+
+    assert len(boxes[0]) == 2
+
+
+def test_lost_track_is_searched(bounce_starts):
+    image, background_image, seed_positions = two_animal_image()
+    # The tracked animal has gone, so nothing is found near its box
+    image[20:40, 30:60] = 150
+
+    boxes = burst_finder(image, background_image, True, [TRACKED_BOX], seed_positions)
+
+    assert len(boxes[0]) == 1
+    assert boxes[0][0] <= 160 <= boxes[1][0] and boxes[2][0] <= 220 <= boxes[3][0]
+
+
+def test_image_after_one_without_boxes_is_searched(bounce_starts):
+    image, background_image, seed_positions = two_animal_image()
+
+    boxes = burst_finder(image, background_image, True, [], seed_positions)
+
+    assert len(boxes[0]) == 2
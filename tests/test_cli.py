@@ -0,0 +1,26 @@
+import json
+import os
+
+from sherlock.cli import main
+from sherlock.config import EnvSettings
+
+ENV = EnvSettings()
+
+
+def test_dry_run_only_prints_the_plan(image_root, tmp_path, capsys):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"sample_size": 1000}))
+    folder_files = {
+        folder: sorted(os.listdir(image_root / folder))
+        for folder in ("folder_1", "folder_2")
+    }
+
+    assert main(["--dry-run", str(image_root), "-c", str(config_path), "-j", "2"]) == 0
+
+    # The settings were applied, but nothing was processed
+    assert ENV.sample_size == 1000
+    assert ENV.jobs == 2
+    for folder, files in folder_files.items():
+        assert sorted(os.listdir(image_root / folder)) == files
+    output = capsys.readouterr().out
+    assert "2 of 2 folders to process: 80 frames" in output
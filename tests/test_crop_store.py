@@ -0,0 +1,41 @@
+import os
+
+from sherlock.config import EnvSettings
+from sherlock.crop_store import crop_paths, load_crops
+from sherlock.dedup import settings_hash
+from sherlock.discovery import discover_jobs
+from sherlock.iterate_folders import run_job
+
+ENV = EnvSettings()
+
+
+def test_cancelled_run_leaves_indexed_crops(image_root):
+    ENV.crop_size = 32
+    ENV.crop_chunk_size = 4
+    checks = []
+
+    def cancelled() -> bool:
+        checks.append(True)
+        return len(checks) > 20
+
+    for job in discover_jobs(str(image_root)):
+        checks.clear()
+        run_job(job, cancelled)
+
+    for folder in ("folder_1", "folder_2"):
+        folder_path = str(image_root / folder)
+        crops_path, index_path = crop_paths(folder_path)
+        raw_files = [name for name in os.listdir(folder_path) if name.endswith(".raw")]
+        assert raw_files == [os.path.basename(crops_path)]
+        assert os.path.isfile(index_path)
+        # The crops file is trimmed to the crops written, all of which are indexed
+        crops, index = load_crops(folder_path)
+        assert 0 < len(crops) == len(index)
+        assert set(index["row"]) == set(range(len(index)))
+
+
+def test_crop_settings_do_not_change_reused_windows():
+    before = settings_hash()
+    ENV.crop_size = 64
+    ENV.crop_chunk_size = 16
+    assert settings_hash() == before
@@ -0,0 +1,20 @@
+import pytest
+
+from sherlock.config import EnvSettings
+from sherlock.decoders import DECODERS, Decoder, get_decoder
+
+ENV = EnvSettings()
+
+
+def test_decoders_must_implement_decode():
+    class NamedOnly(Decoder):
+        name = "named"
+
+    with pytest.raises(TypeError):
+        NamedOnly()
+
+
+def test_opencv_is_used_unless_auto_is_chosen():
+    # Every worker then decodes with the same library, whatever the benchmark would pick
+    assert EnvSettings().image_decoder == "opencv"
+    assert get_decoder(b"") is DECODERS["opencv"]
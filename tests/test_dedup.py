@@ -0,0 +1,23 @@
+import numpy as np
+
+from sherlock.config import EnvSettings, get_settings
+from sherlock.dedup import DETECTION_SETTINGS, NON_DETECTION_SETTINGS, settings_hash
+
+ENV = EnvSettings()
+
+
+def test_every_setting_is_classified():
+    # A new setting must be added to one of the sets, to decide whether it keys the index
+    settings = set(get_settings())
+    assert settings == DETECTION_SETTINGS | NON_DETECTION_SETTINGS
+    assert not DETECTION_SETTINGS & NON_DETECTION_SETTINGS
+
+
+def test_only_detection_settings_change_the_hash():
+    before = settings_hash()
+    ENV.size_tol_day = ENV.size_tol_day + 1
+    ENV.save_images = not ENV.save_images
+    assert settings_hash() == before
+
+    ENV.colour_lower = np.array(ENV.colour_lower) + 1
+    assert settings_hash() != before
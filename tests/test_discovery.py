@@ -0,0 +1,75 @@
+import json
+
+from sherlock.config import EnvSettings
+from sherlock.discovery import discover_jobs
+
+ENV = EnvSettings()
+
+
+def make_folder(folder, frame_count, frame_bytes=10):
+    """
+    Make a folder of (empty) frames following the naming convention.
+    """
+    folder.mkdir(parents=True)
+    for index in range(1, frame_count + 1):
+        (folder / f"image_{index:04d}.jpg").write_bytes(b"\0" * frame_bytes)
+
+
+def use_discovery_settings(root):
+    ENV.root_directory = str(root)
+    ENV.image_prefix = "image"
+    ENV.image_suffix = "jpg"
+
+
+def test_jobs_are_ordered_largest_first(tmp_path):
+    use_discovery_settings(tmp_path)
+    make_folder(tmp_path / "small", 3)
+    make_folder(tmp_path / "site" / "large", 20)
+    # Fewer frames, but large enough files to cost the most
+    make_folder(tmp_path / "site" / "heavy", 5, frame_bytes=2_000_000)
+
+    jobs = discover_jobs(str(tmp_path))
+
+    assert [job.path for job in jobs] == [
+        f"{tmp_path}/site/heavy",
+        f"{tmp_path}/site/large",
+        f"{tmp_path}/small",
+    ]
+    assert [job.frame_count for job in jobs] == [5, 20, 3]
+    assert jobs[0].total_bytes == 5 * 2_000_000
+    assert jobs[1].max_index == 20
+
+
+def test_folders_are_filtered(tmp_path):
+    use_discovery_settings(tmp_path)
+    make_folder(tmp_path / "camera_1", 4)
+    make_folder(tmp_path / "camera_2", 4)
+    make_folder(tmp_path / "notes", 4)
+    # Outputs, hidden folders and folders with too few frames are skipped
+    make_folder(tmp_path / "camera_1" / "positive_images", 4)
+    make_folder(tmp_path / ".trash", 4)
+    make_folder(tmp_path / "camera_3", 1)
+    # Other files are not frames
+    (tmp_path / "camera_2" / "IMG_0001.jpg").write_bytes(b"\0")
+    ENV.include_patterns = ["camera_*"]
+
+    jobs = discover_jobs(str(tmp_path))
+
+    assert sorted(job.path for job in jobs) == [
+        f"{tmp_path}/camera_1",
+        f"{tmp_path}/camera_2",
+    ]
+    assert all(job.frame_count == 4 for job in jobs)
+
+
+def test_completed_folders_are_marked(tmp_path):
+    use_discovery_settings(tmp_path)
+    make_folder(tmp_path / "done", 4)
+    make_folder(tmp_path / "pending", 4)
+    with open(tmp_path / "done" / f"processed_data_{ENV.run_code}.json", "w") as file:
+        json.dump({"completed": True, "images": {}}, file)
+
+    jobs = {job.path: job for job in discover_jobs(str(tmp_path))}
+
+    assert jobs[f"{tmp_path}/done"].completed
+    assert not jobs[f"{tmp_path}/pending"].completed
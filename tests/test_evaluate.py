@@ -0,0 +1,27 @@
+import os
+
+from sherlock.evaluate import evaluate_configurations
+
+
+def test_only_labelled_folders_are_processed(image_root, tmp_path):
+    os.remove(image_root / "folder_2" / "labels.csv")
+    folder_2_files = sorted(os.listdir(image_root / "folder_2"))
+    dedup_directory = tmp_path / "windows"
+    dedup_directory.mkdir()
+
+    report = evaluate_configurations(
+        str(image_root), {"reuse": {"dedup_directory": str(dedup_directory)}}
+    )
+
+    assert len(report) == 1
+    assert report[0]["images_per_second"] > 0
+    assert report[0]["true_positives"] + report[0]["false_negatives"] > 0
+    # The unlabelled folder was not processed
+    assert sorted(os.listdir(image_root / "folder_2")) == folder_2_files
+    # The configuration did not read or write the configured window index
+    assert os.listdir(dedup_directory) == []
+    # Its outputs were removed
+    assert not any(
+        name.startswith("processed_data_")
+        for name in os.listdir(image_root / "folder_1")
+    )
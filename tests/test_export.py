@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+
+import cv2
+import pytest
+from conftest import TEST_IMAGES
+
+from sherlock.config import EnvSettings
+from sherlock.export import PositiveExporter
+from sherlock.sherlock import process_folder
+
+ENV = EnvSettings()
+
+BOXES = [(10, 60, 20, 80)]
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    """
+    A copy of a test image in its own folder.
+    """
+    path = tmp_path / "folder" / "image_0001.jpg"
+    path.parent.mkdir()
+    shutil.copy(TEST_IMAGES / "folder_1" / "image_0001.jpg", path)
+    return str(path)
+
+
+@pytest.mark.parametrize("mode", ["annotated", "preview", "link", "original"])
+def test_export_modes(image_path, mode):
+    ENV.export_preview_scale = 0.25
+    folder_path = os.path.dirname(image_path)
+    original = cv2.imread(image_path)
+
+    with PositiveExporter(folder_path, mode) as exporter:
+        # The image is decoded by the exporter if it is not given
+        exporter.submit(image_path, None, BOXES)
+
+    output_path = f"{folder_path}/positive_images/image_0001.jpg"
+    exported = cv2.imread(output_path)
+    if mode == "annotated":
+        assert exported.shape == original.shape
+        # The box is drawn in red
+        blue, green, red = exported[10, 40].astype(int)
+        assert red > 200 and blue < 80 and green < 80
+    elif mode == "preview":
+        assert exported.shape[:2] == (
+            round(original.shape[0] * 0.25),
+            round(original.shape[1] * 0.25),
+        )
+    else:
+        with (
+            open(image_path, "rb") as original_file,
+            open(output_path, "rb") as exported_file,
+        ):
+            assert exported_file.read() == original_file.read()
+
+    sidecar_path = f"{folder_path}/positive_images/image_0001.json"
+    if mode == "link":
+        with open(sidecar_path) as sidecar_file:
+            assert json.load(sidecar_file)["boxes"] == [
+                {"x_min": 20, "x_max": 80, "y_min": 10, "y_max": 60}
+            ]
+    else:
+        assert not os.path.exists(sidecar_path)
+
+
+def test_unknown_export_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        PositiveExporter(str(tmp_path), "thumbnail")
+
+
+def test_exported_images_do_not_hold_the_window(image_root, monkeypatch):
+    ENV.save_images = True
+    ENV.export_mode = "annotated"
+    submitted = []
+
+    def record_submit(self, image_path, image, boxes):
+        submitted.append(image)
+
+    monkeypatch.setattr(PositiveExporter, "submit", record_submit)
+    process_folder(str(image_root / "folder_1"))
+
+    assert submitted
+    for image in submitted:
+        # A view of the window stack would keep every image of the window in memory
+        assert image.base is None
@@ -0,0 +1,100 @@
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from conftest import TEST_IMAGES, use_test_image_settings
+
+from sherlock.config import EnvSettings, apply_settings, get_settings
+from sherlock.leases import FolderLease, LeaseLostError
+
+ENV = EnvSettings()
+
+
+def run_coordinated(root: str, settings: dict, log_path: str):
+    """
+    Run Sherlock in its own process, logging what it printed.
+    """
+    from sherlock.iterate_folders import run_sherlock
+
+    apply_settings(settings)
+    with open(log_path, "w") as log_file:
+        sys.stdout = log_file
+        run_sherlock(root, jobs=1)
+
+
+def test_processes_claim_distinct_folders(tmp_path: Path):
+    root = tmp_path / "images"
+    folders = [f"camera_{index}" for index in range(6)]
+    for folder in folders:
+        shutil.copytree(TEST_IMAGES / "folder_1", root / folder)
+    use_test_image_settings(str(root))
+    ENV.coordinate = True
+
+    context = multiprocessing.get_context("spawn")
+    log_paths = [str(tmp_path / f"process_{index}.log") for index in range(3)]
+    processes = [
+        context.Process(
+            target=run_coordinated, args=(str(root), get_settings(), log_path)
+        )
+        for log_path in log_paths
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(timeout=120)
+        assert process.exitcode == 0
+
+    runs = [
+        line.split()[-1]
+        for log_path in log_paths
+        for line in open(log_path).read().splitlines()
+        if line.startswith("Running folder")
+    ]
+    # Every folder is processed by exactly one process
+    assert sorted(runs) == sorted(str(root / folder) for folder in folders)
+    for folder in folders:
+        with open(root / folder / f"processed_data_{ENV.run_code}.json") as json_file:
+            assert json.load(json_file)["completed"]
+        assert not list((root / folder).glob(".sherlock_lease_*"))
+
+
+def test_live_lease_is_not_taken(tmp_path: Path):
+    with FolderLease(str(tmp_path)) as first, FolderLease(str(tmp_path)) as second:
+        assert first.acquire()
+        assert not second.acquire()
+    assert not os.path.exists(first.lease_path)
+
+
+def test_stale_lease_is_taken_over(tmp_path: Path):
+    ENV.lease_ttl = 1
+    ENV.lease_heartbeat = 0.05
+    stale = FolderLease(str(tmp_path))
+    with open(stale.lease_path, "w") as lease_file:
+        json.dump({"owner": "crashed:1:0", "acquired": time.time() - 10}, lease_file)
+    os.utime(stale.lease_path, (time.time() - 10, time.time() - 10))
+
+    with FolderLease(str(tmp_path)) as lease:
+        assert lease.acquire()
+        with open(lease.lease_path) as lease_file:
+            assert json.load(lease_file)["owner"] == lease.owner
+
+        # The heartbeat keeps the lease from expiring
+        time.sleep(1.5)
+        assert not FolderLease(str(tmp_path)).acquire()
+        lease.check()
+
+
+def test_lost_lease_is_reported(tmp_path: Path):
+    ENV.lease_heartbeat = 0.05
+    with FolderLease(str(tmp_path)) as lease:
+        assert lease.acquire()
+        with open(lease.lease_path, "w") as lease_file:
+            json.dump({"owner": "another:2:0"}, lease_file)
+        time.sleep(0.3)
+        with pytest.raises(LeaseLostError):
+            lease.check()
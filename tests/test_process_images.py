@@ -0,0 +1,221 @@
+import cv2
+import numpy as np
+
+from sherlock.background_image import background_statistics, make_background_window
+from sherlock.config import EnvSettings
+from sherlock.process_images import (
+    animal_finder,
+    animal_inner,
+    animal_inner_batch,
+    bounce,
+    directional_walk,
+    guard_global_change,
+    walk_limits,
+)
+
+ENV = EnvSettings()
+
+
+def test_memoised_walks_give_the_same_boxes(image_root):
+    background_image, _, is_daytime, frame_stack, _ = make_background_window(
+        str(image_root / "folder_1"), 1
+    )
+    rng = np.random.default_rng(0)
+
+    memo_boxes = 0
+    for image in frame_stack:
+        limits = walk_limits(image, is_daytime)
+        seed_positions, _ = animal_inner(image, background_image, is_daytime)
+        positions = [seed.copy() for seed in seed_positions]
+        # Points around the seeds, as bounced from by animal_finder
+        for seed in seed_positions:
+            position = seed + rng.integers(-3, 4, size=2)
+            positions.append(np.clip(position, 5, np.array(image.shape[:2]) - 6))
+
+        walk_memo = {}
+        for position in positions:
+            expected = bounce(
+                image, background_image, is_daytime, position.copy(), None, limits
+            )
+            memoised = bounce(
+                image, background_image, is_daytime, position.copy(), walk_memo, limits
+            )
+            assert memoised == expected
+            memo_boxes += 1
+
+    assert memo_boxes > 0
+
+
+def test_memo_saves_steps(image_root):
+    background_image, _, is_daytime, frame_stack, _ = make_background_window(
+        str(image_root / "folder_1"), 1
+    )
+    image = frame_stack[0]
+    seed_positions, _ = animal_inner(image, background_image, is_daytime)
+    assert len(seed_positions) > 1
+
+    def count_steps(walk_memo):
+        limits = walk_limits(image, is_daytime, max_walk_steps=10**9)
+        for seed in seed_positions:
+            bounce(image, background_image, is_daytime, seed.copy(), walk_memo, limits)
+        return 10**9 - limits.step_budget[0]
+
+    assert count_steps({}) < count_steps(None)
+
+
+def test_batched_seeds_match_each_image(image_root, monkeypatch):
+    background_image, _, is_daytime, frame_stack, volatility = make_background_window(
+        str(image_root / "folder_1"), 1
+    )
+    randint = np.random.randint
+    batch_samples = []
+
+    def record_samples(*args, **kwargs):
+        batch_samples.append(randint(*args, **kwargs))
+        return batch_samples[-1]
+
+    monkeypatch.setattr(np.random, "randint", record_samples)
+    batch_positions = animal_inner_batch(
+        frame_stack, background_image, is_daytime, volatility=volatility
+    )
+    x_samples, y_samples = batch_samples
+
+    for frame_index, image in enumerate(frame_stack):
+        # Draw the samples the batch drew for this image
+        frame_samples = iter([x_samples[frame_index], y_samples[frame_index]])
+        monkeypatch.setattr(np.random, "randint", lambda *_, **__: next(frame_samples))
+        positions, animal_count = animal_inner(
+            image, background_image, is_daytime, volatility=volatility
+        )
+        assert animal_count > 0
+        assert np.array_equal(positions, batch_positions[frame_index])
+
+
+def test_single_channel_night_images_match_colour(image_root):
+    _, _, _, frame_stack, _ = make_background_window(str(image_root / "folder_1"), 1)
+    # Night images are grey, so have the same value in every channel
+    grey_stack = np.stack(
+        [cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) for image in frame_stack]
+    )
+    colour_stack = np.repeat(grey_stack[..., np.newaxis], 3, axis=3)
+    grey_background, _ = background_statistics(grey_stack[1:])
+    colour_background, _ = background_statistics(colour_stack[1:])
+
+    box_count = 0
+    for grey_image, colour_image in zip(grey_stack, colour_stack):
+        np.random.seed(1)
+        colour_boxes = animal_finder(colour_image, colour_background, False)
+        np.random.seed(1)
+        grey_boxes = animal_finder(grey_image, grey_background, False)
+        assert grey_boxes == colour_boxes
+        box_count += len(colour_boxes[0])
+
+    assert box_count > 0
+
+
+def test_volatile_pixels_need_a_larger_change(image_root):
+    # The left of the scene keeps changing, e.g. moving vegetation
+    frames = np.full((8, 60, 100, 3), 150, dtype=np.uint8)
+    frames[0::2, :, :50] = 20
+    frames[1::2, :, :50] = 200
+    image = frames[0].copy()
+    # An animal in the still part of the scene
+    image[20:40, 70:90] = 20
+
+    def seed_columns():
+        background_image, volatility = background_statistics(frames)
+        seed_positions, _ = animal_inner(
+            image, background_image, True, volatility=volatility
+        )
+        return seed_positions[:, 1]
+
+    ENV.volatility_weight = 0
+    columns = seed_columns()
+    assert np.any(columns < 50) and np.any(columns >= 70)
+
+    ENV.volatility_weight = 1
+    columns = seed_columns()
+    assert not np.any(columns < 50) and np.any(columns >= 70)
+
+
+def bumped_camera_image():
+    """
+    Make a background of large squares, and an image with the squares swapped, as if the
+    camera had moved.
+    """
+    rows, columns = np.indices((60, 100))
+    squares = ((rows // 10 + columns // 10) % 2).astype(np.uint8)
+    background_image = np.repeat((200 * squares)[..., np.newaxis], 3, axis=2)
+    image = np.repeat((200 * (1 - squares))[..., np.newaxis], 3, axis=2)
+    return image, background_image.astype(float)
+
+
+def test_global_change_is_guarded(image_root):
+    image, background_image = bumped_camera_image()
+
+    _, seed_positions, global_change = guard_global_change(
+        image, background_image, True
+    )
+
+    assert global_change
+    assert len(seed_positions) == ENV.global_change_max_seeds
+
+    # A lighting change is undone by normalising the image instead
+    background_image, _, _, frame_stack, _ = make_background_window(
+        str(image_root / "folder_1"), 1
+    )
+    dark_image = (frame_stack[0] * 0.15).astype(np.uint8)
+    normalised_image, _, global_change = guard_global_change(
+        dark_image, background_image, True
+    )
+    assert not global_change
+    assert not np.array_equal(normalised_image, dark_image)
+
+
+def test_walks_are_limited_by_the_step_budget(image_root):
+    image, background_image = bumped_camera_image()
+    _, seed_positions, _ = guard_global_change(image, background_image, True)
+
+    def count_steps(max_walk_steps):
+        limits = walk_limits(image, True, max_walk_steps=max_walk_steps)
+        walk_memo = {}
+        for seed in seed_positions:
+            bounce(image, background_image, True, seed.copy(), walk_memo, limits)
+        return max_walk_steps - limits.step_budget[0]
+
+    assert count_steps(10**9) > 50
+    assert count_steps(50) == 50
+
+
+def test_walks_stopped_by_the_step_budget_are_not_memoised(image_root):
+    background_image = np.full((60, 100, 3), 150.0)
+    image = background_image.copy()
+    image[20:40] = 20
+    direction = np.array([0, 1])
+    walk_memo = {}
+
+    limits = walk_limits(image, True, max_walk_steps=3)
+    position, _ = directional_walk(
+        image,
+        background_image,
+        True,
+        direction,
+        np.array([30.0, 10.0]),
+        walk_memo,
+        limits,
+    )
+    assert position[1] == 13
+    assert walk_memo == {}
+
+    # A later walk with steps to spare still reaches the end
+    limits = walk_limits(image, True, max_walk_steps=1000)
+    position, _ = directional_walk(
+        image,
+        background_image,
+        True,
+        direction,
+        np.array([30.0, 10.0]),
+        walk_memo,
+        limits,
+    )
+    assert position[1] > 90
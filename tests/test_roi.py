@@ -0,0 +1,22 @@
+import cv2
+import numpy as np
+
+from sherlock.config import EnvSettings
+from sherlock.roi import load_region_of_interest
+
+ENV = EnvSettings()
+
+
+def test_polygons_are_scaled_with_the_frames(tmp_path):
+    ENV.roi_polygons = {"camera_*": [[[100, 40], [300, 40], [300, 120], [100, 120]]]}
+    folder_path = str(tmp_path / "camera_1")
+
+    full_roi = load_region_of_interest(folder_path, (200, 400, 3))
+    half_roi = load_region_of_interest(folder_path, (100, 200, 3), 0.5)
+
+    expected = cv2.resize(
+        full_roi.mask.astype(np.uint8), (200, 100), interpolation=cv2.INTER_NEAREST
+    )
+    assert np.array_equal(half_roi.mask, expected.astype(bool))
+    assert not half_roi.mask[20:60, 50:150].any()
+    assert half_roi.mask.sum() == 100 * 200 - 41 * 101
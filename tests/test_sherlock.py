@@ -0,0 +1,69 @@
+import json
+import os
+
+import numpy as np
+
+from sherlock.candidates import load_candidates
+from sherlock.config import EnvSettings
+from sherlock.crop_store import crop_paths, load_crops
+from sherlock.sherlock import iter_folder_results
+
+ENV = EnvSettings()
+
+
+def test_abandoned_results_keep_exports_and_crops(image_root):
+    ENV.save_images = True
+    ENV.crop_size = 32
+    folder_path = str(image_root / "folder_1")
+
+    results = iter_folder_results(folder_path)
+    seen = []
+    for result in results:
+        seen.append(result)
+        if len(seen) == 30:
+            break
+    results.close()
+
+    with open(f"{folder_path}/processed_data_{ENV.run_code}.json") as json_file:
+        processed_data = json.load(json_file)
+    assert not processed_data["completed"]
+
+    # Every positive image so far was exported, and its crops indexed
+    positives = {result.image_index for result in seen if result.boxes}
+    assert positives
+    exported = set(os.listdir(f"{folder_path}/positive_images"))
+    assert {f"image_{index:04d}.jpg" for index in positives} <= exported
+    crops, index = load_crops(folder_path)
+    assert set(index["image_index"]) == positives
+    assert len(crops) == len(index)
+    assert os.path.isfile(crop_paths(folder_path)[1])
+
+
+def test_stopped_folder_resumes_from_unfinished_window(image_root):
+    folder_path = str(image_root / "folder_1")
+    json_path = f"{folder_path}/processed_data_{ENV.run_code}.json"
+
+    results = iter_folder_results(folder_path)
+    for count, result in enumerate(results):
+        if count == 30:
+            break
+    results.close()
+    with open(json_path) as json_file:
+        resume_index = json.load(json_file)["resume_index"]
+    assert 1 < resume_index <= 31
+    stopped_candidates = load_candidates(folder_path)
+    assert any(index < resume_index for index in stopped_candidates)
+
+    resumed = list(iter_folder_results(folder_path))
+
+    assert resumed[0].image_index == resume_index
+    with open(json_path) as json_file:
+        processed_data = json.load(json_file)
+    assert processed_data["completed"]
+    assert "resume_index" not in processed_data
+    assert len(processed_data["images"]) == 50
+    # The candidates found before stopping are kept
+    candidates = load_candidates(folder_path)
+    for image_index, image_candidates in stopped_candidates.items():
+        if image_index < resume_index:
+            assert np.array_equal(candidates[image_index], image_candidates)
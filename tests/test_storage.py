@@ -0,0 +1,108 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+import pytest
+from conftest import TEST_IMAGES
+
+from sherlock import storage as storage_module
+from sherlock.config import EnvSettings
+from sherlock.storage import LocalStorage, S3Storage, Storage, get_storage
+
+ENV = EnvSettings()
+
+
+def test_storage_backends_must_implement_every_operation():
+    class ListOnly(Storage):
+        def list_dir(self, path):
+            return []
+
+    with pytest.raises(TypeError):
+        ListOnly()
+
+
+def test_concurrent_local_writes_are_atomic(tmp_path):
+    path = str(tmp_path / "results" / "data.bin")
+    storage = LocalStorage()
+    payloads = [bytes([index]) * 100_000 for index in range(8)]
+
+    threads = [
+        threading.Thread(target=storage.write_bytes, args=(path, payload))
+        for payload in payloads
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert storage.read_bytes(path) in payloads
+    # No temporary files are left behind
+    assert os.listdir(tmp_path / "results") == ["data.bin"]
+
+
+@pytest.fixture
+def s3_bucket(monkeypatch):
+    """
+    Make an empty bucket in a mocked S3, with the image of a test folder.
+    """
+    moto = pytest.importorskip("moto")
+    boto3 = pytest.importorskip("boto3")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    ENV.s3_endpoint_url = None
+    with moto.mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket="traps")
+        image_path = TEST_IMAGES / "folder_1" / "image_0001.jpg"
+        client.put_object(
+            Bucket="traps",
+            Key="site/folder_1/image_0001.jpg",
+            Body=image_path.read_bytes(),
+        )
+        # The storage made for this bucket holds a client for the mocked S3
+        monkeypatch.setattr(storage_module, "_s3_storages", {})
+        yield "s3://traps"
+
+
+def test_s3_storage(s3_bucket):
+    storage = get_storage(f"{s3_bucket}/site")
+    assert isinstance(storage, S3Storage)
+    image_path = f"{s3_bucket}/site/folder_1/image_0001.jpg"
+    image_bytes = (TEST_IMAGES / "folder_1" / "image_0001.jpg").read_bytes()
+
+    # List
+    assert [
+        (entry.name, entry.is_dir) for entry in storage.list_dir(f"{s3_bucket}/site")
+    ] == [("folder_1", True)]
+    assert storage.is_file(image_path)
+    assert not storage.is_file(f"{s3_bucket}/site/folder_1/image_0002.jpg")
+
+    # Stat
+    entry = storage.stat(image_path)
+    assert entry.size == len(image_bytes)
+    assert entry.mtime_ns > 0
+    assert storage.stat(f"{s3_bucket}/site/missing.jpg") is None
+
+    # Read a range
+    assert storage.read_range(image_path, 10, 100) == image_bytes[10:110]
+    assert (
+        storage.read_header(image_path).read() == image_bytes[: ENV.header_read_bytes]
+    )
+
+    # Write, which is seen by the cached listing
+    json_path = f"{s3_bucket}/site/folder_1/processed_data_1.json"
+    storage.write_json(json_path, {"completed": True})
+    assert storage.is_file(json_path)
+    storage.refresh()
+    assert storage.read_json(json_path) == {"completed": True}
+    storage.remove(json_path)
+    assert not storage.is_file(json_path)
+    with pytest.raises(FileNotFoundError):
+        storage.read_bytes(json_path)
+
+    # Decode
+    image = storage.decode_image(image_path)
+    expected = cv2.imread(str(TEST_IMAGES / "folder_1" / "image_0001.jpg"))
+    assert np.array_equal(image, expected)
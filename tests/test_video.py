@@ -0,0 +1,147 @@
+import json
+import os
+
+import cv2
+import numpy as np
+import pytest
+from conftest import TEST_IMAGES, use_test_image_settings
+
+from sherlock import video
+from sherlock.candidates import (
+    candidates_path,
+    load_candidates,
+    rescore_sherlock,
+    rescore_video,
+)
+from sherlock.config import EnvSettings
+from sherlock.crop_store import crop_paths, load_crops
+from sherlock.discovery import video_output_paths
+from sherlock.utils import mark_adjacent_frames
+from sherlock.video import process_video
+
+ENV = EnvSettings()
+
+
+def write_clip(video_path, frame_count=12):
+    """
+    Write the first images of a test folder as a video clip.
+    """
+    frames = [
+        cv2.imread(str(TEST_IMAGES / "folder_1" / f"image_{index:04d}.jpg"))
+        for index in range(1, frame_count + 1)
+    ]
+    height, width = frames[0].shape[:2]
+    writer = cv2.VideoWriter(
+        str(video_path), cv2.VideoWriter_fourcc(*"MJPG"), 5, (width, height)
+    )
+    for frame in frames:
+        writer.write(frame)
+    writer.release()
+
+
+def test_clip_outputs_can_be_rescored(tmp_path):
+    use_test_image_settings(tmp_path)
+    ENV.crop_size = 32
+    np.random.seed(0)
+    video_path = str(tmp_path / "clip.avi")
+    write_clip(video_path)
+
+    process_video(video_path)
+
+    json_path, csv_path = video_output_paths(video_path)
+    with open(json_path) as json_file:
+        processed_data = json.load(json_file)
+    assert processed_data["completed"]
+    assert len(processed_data["images"]) == 12
+    assert os.path.isfile(csv_path)
+    assert os.path.isfile(candidates_path(video_path))
+    candidates = load_candidates(video_path)
+    assert set(candidates) <= {int(frame) for frame in processed_data["images"]}
+    crops, index = load_crops(video_path)
+    assert len(index) == sum(
+        datum["contours"] for datum in processed_data["images"].values()
+    )
+    assert len(index) > 0
+
+    # Rescoring with the same thresholds gives the same results
+    assert rescore_video(video_path)
+    with open(json_path) as json_file:
+        assert json.load(json_file) == processed_data
+
+
+def test_completed_clips_are_rescored(tmp_path, capsys):
+    use_test_image_settings(tmp_path)
+    np.random.seed(0)
+    video_path = str(tmp_path / "clips" / "clip.avi")
+    os.mkdir(tmp_path / "clips")
+    write_clip(video_path)
+    process_video(video_path)
+    json_path, _ = video_output_paths(video_path)
+    with open(json_path) as json_file:
+        processed_data = json.load(json_file)
+    assert any(
+        datum["status"] == "animal" for datum in processed_data["images"].values()
+    )
+
+    # No box is large enough with the new threshold
+    ENV.size_tol_day = ENV.size_tol_night = 10**6
+    rescore_sherlock(str(tmp_path))
+
+    assert "Rescored 0 folder(s) and 1 video(s)" in capsys.readouterr().out
+    with open(json_path) as json_file:
+        rescored_data = json.load(json_file)
+    assert rescored_data["completed"]
+    assert all(
+        datum["status"] == "no animal" for datum in rescored_data["images"].values()
+    )
+
+
+def test_clip_that_fails_is_not_completed(tmp_path, monkeypatch):
+    use_test_image_settings(tmp_path)
+    ENV.crop_size = 32
+    ENV.background_max_images = 6
+    np.random.seed(0)
+    video_path = str(tmp_path / "clip.avi")
+    write_clip(video_path)
+
+    process_video_window = video.process_video_window
+    windows = []
+
+    def fail_second_window(window, *args):
+        windows.append(window)
+        if len(windows) > 1:
+            raise RuntimeError("Decoding failed")
+        process_video_window(window, *args)
+
+    monkeypatch.setattr(video, "process_video_window", fail_second_window)
+    with pytest.raises(RuntimeError):
+        process_video(video_path)
+
+    # The crops of the first window were still written, but the clip is not completed
+    assert os.path.isfile(crop_paths(video_path)[1])
+    json_path, csv_path = video_output_paths(video_path)
+    assert not os.path.exists(json_path)
+    assert not os.path.exists(csv_path)
+    assert not os.path.exists(candidates_path(video_path))
+
+
+def test_clip_adjacency_matches_images():
+    ENV.adjacency = 2
+    processed_data = {
+        "images": {
+            str(frame): {
+                "status": "no animal",
+                "reason": "no contour found",
+                "contours": 0,
+            }
+            for frame in range(10)
+        }
+    }
+    processed_data["images"]["5"] = {
+        "status": "animal",
+        "reason": "contour found",
+        "contours": 1,
+    }
+
+    # As for images, the range of adjacent positions is half-open
+    assert mark_adjacent_frames(processed_data) == [3, 4, 6]
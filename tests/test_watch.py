@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+
+import numpy as np
+from conftest import TEST_IMAGES
+
+from sherlock.config import EnvSettings
+from sherlock.sherlock import process_folder
+from sherlock.watch import find_update_start, load_manifest, update_folder
+
+ENV = EnvSettings()
+
+
+def load_results(folder_path):
+    with open(f"{folder_path}/processed_data_{ENV.run_code}.json") as json_file:
+        return json.load(json_file)
+
+
+def hold_back_frames(folder_path, first_index):
+    """
+    Move the frames from first_index onwards out of a folder, to add them later.
+    """
+    held_back = f"{folder_path}_later"
+    os.makedirs(held_back)
+    for index in range(first_index, 51):
+        name = f"image_{index:04d}.jpg"
+        shutil.move(f"{folder_path}/{name}", f"{held_back}/{name}")
+    return held_back
+
+
+def add_frames(folder_path, held_back):
+    for name in sorted(os.listdir(held_back)):
+        shutil.move(f"{held_back}/{name}", f"{folder_path}/{name}")
+
+
+def test_update_start():
+    windows = [[1, 5], [5, 13], [13, 20]]
+    # A changed frame reprocesses its window
+    assert find_update_start([7], windows, 19) == 5
+    # New frames extend a last window cut short by the end of the folder
+    assert find_update_start([20, 21], windows, 19) == 13
+    # but start a new window after a complete one
+    assert find_update_start([25], windows, 30) == 25
+
+
+def test_new_frames_extend_short_last_window(image_root, capsys):
+    folder_path = str(image_root / "folder_1")
+    held_back = hold_back_frames(folder_path, 46)
+    assert update_folder(folder_path)
+    windows = load_results(folder_path)["windows"]
+    # The last window was cut short by the end of the folder
+    assert windows[-1][1] == 46
+    capsys.readouterr()
+
+    add_frames(folder_path, held_back)
+    assert update_folder(folder_path)
+
+    output = capsys.readouterr().out
+    assert (
+        f"5 new or changed images, reprocessing from image {windows[-1][0]}" in output
+    )
+    assert f"Image {windows[-1][0] - 1} processed" not in output
+    results = load_results(folder_path)
+    assert results["completed"]
+    assert sorted(map(int, results["images"])) == list(range(1, 51))
+    assert results["windows"][-1][1] == 51
+    assert len(load_manifest(folder_path)["frames"]) == 50
+    # Nothing is processed once the folder is up to date
+    assert not update_folder(folder_path)
+
+
+def test_changed_frame_reprocesses_only_its_window(image_root, capsys):
+    folder_path = str(image_root / "folder_1")
+    assert update_folder(folder_path)
+    before = load_results(folder_path)
+    window_start, window_end = next(
+        window for window in before["windows"] if window[0] < 15 < window[1]
+    )
+    capsys.readouterr()
+
+    shutil.copy(
+        TEST_IMAGES / "folder_1" / "image_0016.jpg", f"{folder_path}/image_0015.jpg"
+    )
+    np.random.seed(0)
+    assert update_folder(folder_path)
+
+    output = capsys.readouterr().out
+    assert f"1 new or changed images, reprocessing from image {window_start}" in output
+    processed = {
+        int(line.split()[1])
+        for line in output.splitlines()
+        if line.endswith(" processed") and line.startswith("Image ")
+    }
+    assert min(processed) == window_start
+    # The later windows are unchanged, so processing stops at the end of this window
+    assert max(processed) == window_end - 1
+    after = load_results(folder_path)
+    for index in range(window_end, 51):
+        assert after["images"][str(index)] == before["images"][str(index)]
+
+
+def test_folder_processed_before_manifests(image_root, capsys):
+    folder_path = str(image_root / "folder_1")
+    held_back = hold_back_frames(folder_path, 46)
+    process_folder(folder_path)
+    assert load_manifest(folder_path) is None
+    last_start = load_results(folder_path)["windows"][-1][0]
+    ENV.image_size = None
+    capsys.readouterr()
+
+    add_frames(folder_path, held_back)
+    assert update_folder(folder_path)
+
+    # Only the new frames are counted as changed, and the image shape is found again
+    output = capsys.readouterr().out
+    assert f"5 new or changed images, reprocessing from image {last_start}" in output
+    assert ENV.image_size is not None
+    results = load_results(folder_path)
+    assert sorted(map(int, results["images"])) == list(range(1, 51))
+    assert len(load_manifest(folder_path)["frames"]) == 50